@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Login storm load test of the /auth/complete/ admission control
+Open-loop Poisson arrivals of OIDC callbacks are served by a fixed number of
+threads standing in for the uWSGI workers. Every callback goes through the
+real SSOAdmissionMiddleware, then runs a transaction against a model of the
+database. A transaction needs --txn-ms of work. Up to --db-parallel
+transactions run at full speed, and beyond that they share the capacity.
+Every concurrent transaction also slows the others by --contention, like
+the lock waits on auth_user and social_auth_usersocialauth. Under overload
+the database therefore gets less done the more callbacks it runs at once.
+
+A callback answered 503 is retried after Retry-After, as the retry page does.
+The login time is measured from the first callback to the successful one.
+For each run the script reports the callback response times, the login
+times and the outcomes:
+
+    python bench_admission.py --peak 25 --duration 20
+
+This models the database, it does not measure MySQL. Set --txn-ms,
+--db-parallel and --contention from the trace of a real login
+(the pipeline_step records) and from the MySQL server size.
+"""
+import argparse
+import heapq
+import itertools
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+import django
+from django.conf import settings
+
+settings.configure(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    SSO_METRICS_ENABLED=False,
+    ALLOWED_HOSTS=["*"],
+)
+django.setup()
+
+from django.core.cache import cache  # noqa: E402
+from django.http import HttpResponse  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+
+from bench_login_flow import percentile  # noqa: E402
+from tutorssoredirect.sso_redirect import admission, middleware  # noqa: E402
+
+
+class Database(object):
+    '''Processor sharing with a contention penalty per concurrent transaction'''
+
+    def __init__(self, txn, parallel, contention, tick=0.002):
+        self.txn = txn
+        self.parallel = parallel
+        self.contention = contention
+        self.tick = tick
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def transaction(self):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            done = 0.0
+            while done < self.txn:
+                n = self.active
+                speed = min(1.0, self.parallel / n) / (1 + self.contention * (n - 1))
+                time.sleep(self.tick)
+                done += self.tick * speed
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def run(name, args, rate, limit):
+    cache.clear()
+    db = Database(args.txn_ms / 1000.0, args.db_parallel, args.contention)
+
+    def callback(request):
+        db.transaction()
+        return HttpResponse("ok")
+
+    if limit:
+        admission._limiter = admission.Limiter(
+            cache, limit=limit, queue_timeout=args.queue_seconds, retry_after=args.retry_after)
+        handler = middleware.SSOAdmissionMiddleware(callback)
+    else:
+        handler = callback
+    factory = RequestFactory()
+
+    # Callbacks due, (due time, sequence, login start); retries are pushed back
+    due = []
+    due_lock = threading.Condition()
+    sequence = itertools.count()
+    responses, logins, outcomes = [], [], Counter()
+    stop = threading.Event()
+
+    def submit(at, started):
+        with due_lock:
+            heapq.heappush(due, (at, next(sequence), started))
+            due_lock.notify()
+
+    def worker():
+        while True:
+            with due_lock:
+                while not stop.is_set() and (not due or due[0][0] > time.perf_counter()):
+                    due_lock.wait(due[0][0] - time.perf_counter() if due else 0.05)
+                if stop.is_set():
+                    return
+                at, _seq, started = heapq.heappop(due)
+            response = handler(factory.get("/auth/complete/oidc/", {"state": "x", "code": "y"}))
+            now = time.perf_counter()
+            responses.append(now - at)
+            if response.status_code == 503:
+                outcomes["retry page"] += 1
+                submit(now + int(response["Retry-After"]), started)
+            else:
+                outcomes["completed"] += 1
+                logins.append(now - started)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(args.workers)]
+    for thread in threads:
+        thread.start()
+    began = time.perf_counter()
+    arrivals = 0
+    at = began
+    while at < began + args.duration:
+        at += random.expovariate(rate)
+        time.sleep(max(0.0, at - time.perf_counter()))
+        submit(at, at)
+        arrivals += 1
+    # Drain: let the retries and the backlog finish, within limits
+    drain_until = time.perf_counter() + args.drain
+    while len(logins) < arrivals and time.perf_counter() < drain_until:
+        time.sleep(0.1)
+    stop.set()
+    with due_lock:
+        due_lock.notify_all()
+        unfinished = arrivals - len(logins)
+
+    print(f"\n{name}: {rate:.0f} callbacks/s for {args.duration:.0f}s, "
+          f"{arrivals} logins, database peak concurrency {db.peak}")
+    print(f"  {'':<20} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for label, values in (("callback response", responses), ("login", logins)):
+        ms = [v * 1000 for v in values]
+        if not ms:
+            print(f"  {label:<20} {'-':>9}")
+            continue
+        print(f"  {label:<20} {percentile(ms, 50):>9.0f} {percentile(ms, 95):>9.0f} "
+              f"{percentile(ms, 99):>9.0f} {max(ms):>9.0f}")
+    print(f"  completed {outcomes['completed']}, retry pages {outcomes['retry page']}, "
+          f"unfinished after drain {unfinished}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--peak", type=float, default=25.0, help="Normal peak, callbacks per second")
+    parser.add_argument("--factor", type=float, default=2.0, help="Storm, times the normal peak")
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--drain", type=float, default=30.0, help="Seconds allowed to finish after arrivals stop")
+    parser.add_argument("--workers", type=int, default=32, help="uWSGI workers of all the LMS containers")
+    parser.add_argument("--txn-ms", type=float, default=100.0, help="Database work of one callback")
+    parser.add_argument("--db-parallel", type=int, default=8, help="Transactions run at full speed")
+    parser.add_argument("--contention", type=float, default=0.03, help="Slowdown per concurrent transaction")
+    parser.add_argument("--limit", type=int, default=8, help="SSO_ADMISSION_LIMIT")
+    parser.add_argument("--queue-seconds", type=float, default=2.0, help="SSO_ADMISSION_QUEUE_SECONDS")
+    parser.add_argument("--retry-after", type=int, default=5, help="SSO_ADMISSION_RETRY_AFTER")
+    args = parser.parse_args(argv)
+
+    storm = args.peak * args.factor
+    run("normal peak, no limit", args, args.peak, None)
+    run("storm, no limit", args, storm, None)
+    run(f"storm, limit {args.limit}", args, storm, args.limit)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
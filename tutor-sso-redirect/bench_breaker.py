@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Worker time held by a slow IdP, with and without the circuit breaker
+Threads stand in for uWSGI workers calling mock_oidc.py's JWKS endpoint
+through the pooled IdP session. The IdP is healthy, then slower than the
+read timeout, then healthy again. For each phase the script reports the
+calls that succeeded, failed or were failed fast by the breaker, and the
+seconds of worker time spent waiting for the IdP. Breaker state changes are
+printed as they happen.
+"""
+import argparse
+import sys
+import threading
+import time
+from collections import Counter
+
+import django
+from django.conf import settings
+
+settings.configure(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    SSO_METRICS_ENABLED=False,
+)
+django.setup()
+
+from django.core.cache import cache  # noqa: E402
+
+from bench_login_flow import percentile  # noqa: E402
+from mock_oidc import MockOIDCProvider  # noqa: E402
+from tutorssoredirect.sso_redirect.breaker import CircuitBreaker, CircuitOpen, NullBreaker  # noqa: E402
+from tutorssoredirect.sso_redirect.idp_client import build_session  # noqa: E402
+
+
+def run(name, breaker, provider, args):
+    cache.clear()
+    session = build_session(pool_size=args.workers, retries=0)
+    url = provider.url + "/oauth/v2/keys"
+    phases = [("healthy", 0.0, args.phase), ("slow IdP", args.slow_latency, args.phase * 2),
+              ("recovered", 0.0, args.phase * 2)]
+    stats = {}
+    state = {"phase": None}
+    stop = threading.Event()
+
+    def worker():
+        while not stop.is_set():
+            phase = state["phase"]
+            start = time.perf_counter()
+            try:
+                with breaker.call():
+                    session.get(url, timeout=(1, args.read_timeout)).raise_for_status()
+                outcome = "ok"
+            except CircuitOpen:
+                outcome = "failed fast"
+            except Exception:
+                outcome = "failed"
+            elapsed = time.perf_counter() - start
+            counts, held = stats[phase]
+            counts[outcome] += 1
+            held.append(elapsed)
+            if outcome == "failed fast":
+                # A rejected login still costs the worker a request
+                time.sleep(0.01)
+
+    def watch():
+        last = breaker.state()
+        while not stop.is_set():
+            current = breaker.state()
+            if current != last:
+                print(f"    {time.perf_counter() - began:6.1f}s  breaker {last} -> {current}")
+                last = current
+            time.sleep(0.05)
+
+    print(f"\n{name}")
+    began = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(args.workers)]
+    for phase, latency, duration in phases:
+        stats[phase] = (Counter(), [])
+        provider.latencies["jwks"] = latency
+        state["phase"] = phase
+        if not threads[0].is_alive():
+            for thread in threads:
+                thread.start()
+            threading.Thread(target=watch, daemon=True).start()
+        time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    session.close()
+
+    print(f"  {'phase':<10} {'ok':>6} {'failed':>7} {'fast':>6} {'worker-s held':>14} {'p50 ms':>8} {'p99 ms':>8}")
+    for phase, _latency, _duration in phases:
+        counts, held = stats[phase]
+        ms = [t * 1000 for t in held]
+        print(f"  {phase:<10} {counts['ok']:>6} {counts['failed']:>7} {counts['failed fast']:>6} "
+              f"{sum(held):>14.1f} {percentile(ms, 50):>8.1f} {percentile(ms, 99):>8.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--phase", type=float, default=3.0, help="Seconds of the healthy phase")
+    parser.add_argument("--slow-latency", type=float, default=3.0, help="IdP latency when slow")
+    parser.add_argument("--read-timeout", type=float, default=2.0)
+    parser.add_argument("--open-for", type=float, default=2.0)
+    args = parser.parse_args(argv)
+
+    with MockOIDCProvider() as provider:
+        run("without breaker", NullBreaker(), provider, args)
+        breaker = CircuitBreaker(cache, window=4, buckets=4, min_calls=10, slow_call=1.0,
+                                 open_for=args.open_for, probes=3)
+        run("with breaker", breaker, provider, args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for the SSO redirect middleware path check
+Compares the per-request pattern scans of the previous middleware with the
+precompiled classifier, in ns/request for representative LMS paths
+"""
+import sys
+import timeit
+
+from tutorssoredirect.sso_redirect.classifier import PathClassifier, REDIRECT
+
+
+PATHS = [
+    "/",
+    "/dashboard",
+    "/login",
+    "/register",
+    "/authn/login",
+    "/auth/login/oidc/",
+    "/auth/complete/oidc/",
+    "/heartbeat",
+    "/static/css/lms-main-v1.css",
+    "/static/js/lms-main_vendor.js",
+    "/courses/course-v1:edX+DemoX+Demo_Course/courseware",
+    "/courses/course-v1:edX+DemoX+Demo_Course/xblock/block-v1:edX+DemoX+Demo_Course+type@problem+block@123/handler/xmodule_handler/problem_check",
+    "/api/courseware/course/course-v1:edX+DemoX+Demo_Course",
+    "/api/user/v1/account/login_session/",
+    "/user_api/v1/account/registration/",
+    "/csrf/api/v1/token",
+    "/login_refresh",
+]
+
+
+def legacy_is_auth_url(path):
+    """Path check of the previous middleware, lists rebuilt per request"""
+    path = path.lower().rstrip('/')
+    auth_patterns = [
+        '/login',
+        '/signin',
+        '/register',
+        '/signup',
+        '/logistration',
+        '/authn',
+        '/user_api/v1/account/login_session',
+        '/api/user/v1/account/login_session',
+        '/create_account',
+        '/ui/login',
+        '/account',
+    ]
+    is_auth_url = False
+    for pattern in auth_patterns:
+        if pattern in path or path.endswith(pattern):
+            is_auth_url = True
+            break
+    if is_auth_url:
+        skip_patterns = [
+            '/api/csrf/',
+            '/static/',
+            '/media/',
+            '/admin/',
+            '/oauth2/',
+            '/auth/complete/',
+            '/logout',
+            '/auth/login/oidc/',
+            '/login_refresh',
+            '/api/user/v2/account/login_session/',
+            '/api/mobile/',
+            '/heartbeat',
+        ]
+        if any(skip in path for skip in skip_patterns):
+            return False
+    return is_auth_url
+
+
+def measure(func, path, number):
+    best = min(timeit.repeat(lambda: func(path), number=number, repeat=5))
+    return best / number * 1e9
+
+
+def main(number=200000):
+    classifier = PathClassifier()
+
+    # Both implementations must agree before timing means anything
+    for path in PATHS:
+        assert legacy_is_auth_url(path) == (classifier.classify(path) == REDIRECT), path
+
+    print(f"{'path':<60} {'before':>10} {'after':>10}")
+    print("-" * 82)
+    total_before = total_after = 0.0
+    for path in PATHS:
+        before = measure(legacy_is_auth_url, path, number)
+        after = measure(classifier.classify, path, number)
+        total_before += before
+        total_after += after
+        label = path if len(path) <= 58 else path[:55] + "..."
+        print(f"{label:<60} {before:>8.0f}ns {after:>8.0f}ns")
+    print("-" * 82)
+    print(f"{'mean':<60} {total_before / len(PATHS):>8.0f}ns {total_after / len(PATHS):>8.0f}ns")
+
+    # Cold path: every path seen for the first time, as with unique usage ids
+    cold = [f"/courses/course-v1:edX+DemoX+{i}/courseware" for i in range(number // 10)]
+    before = min(timeit.repeat(lambda: [legacy_is_auth_url(p) for p in cold], number=1, repeat=3))
+    after = min(timeit.repeat(lambda: [classifier.match(p) for p in cold], number=1, repeat=3))
+    print(f"{'uncached (unique course paths)':<60} {before / len(cold) * 1e9:>8.0f}ns {after / len(cold) * 1e9:>8.0f}ns")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+IdP call latency with and without the pooled keep-alive session
+Serves mock_oidc.py over TLS with a throwaway self-signed certificate (needs
+the openssl command) and makes the calls of a login, token endpoint aside,
+with a new connection per call as social_core does, and through the pooled
+session of tutorssoredirect.sso_redirect.idp_client. Reports the latency per
+call and the number of TLS connections the server accepted.
+"""
+import argparse
+import os
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from bench_login_flow import percentile
+from mock_oidc import MockOIDCProvider
+from tutorssoredirect.sso_redirect.idp_client import build_session
+
+# IdP calls of a login that do not need an authorization code
+PATHS = ["/.well-known/openid-configuration", "/oauth/v2/keys", "/.well-known/openid-configuration"]
+
+
+def self_signed(directory):
+    cert = os.path.join(directory, "cert.pem")
+    key = os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-keyout", key, "-out", cert, "-subj", "/CN=localhost",
+         "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1"],
+        check=True, capture_output=True,
+    )
+    return cert, key
+
+
+def tls_provider(cert, key, latency):
+    provider = MockOIDCProvider(host="127.0.0.1", latency=latency)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    server = provider.server
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    server.accepted = 0
+    get_request = server.get_request
+
+    def counting_get_request():
+        server.accepted += 1
+        return get_request()
+
+    server.get_request = counting_get_request
+    host, port = server.server_address[:2]
+    provider._issuer = f"https://localhost:{port}"
+    return provider
+
+
+def login_calls(call, base):
+    timings = []
+    for path in PATHS:
+        start = time.perf_counter()
+        response = call("GET", base + path)
+        response.raise_for_status()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run(name, call, provider, logins, concurrency):
+    accepted = provider.server.accepted
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(lambda _: login_calls(call, provider.url), range(logins)))
+    elapsed = time.perf_counter() - start
+    ms = [t * 1000 for timings in results for t in timings]
+    print(f"{name:<28} {concurrency:>6} {percentile(ms, 50):>9.2f}ms {percentile(ms, 95):>9.2f}ms "
+          f"{percentile(ms, 99):>9.2f}ms {logins / elapsed:>10.1f} {provider.server.accepted - accepted:>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--logins", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added by the IdP")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        cert, key = self_signed(directory)
+        with tls_provider(cert, key, args.latency) as provider:
+            print(f"{len(PATHS)} calls per login, {args.logins} logins")
+            print(f"{'client':<28} {'conc.':>6} {'p50':>11} {'p95':>11} {'p99':>11} "
+                  f"{'logins/s':>10} {'TLS conn':>8}")
+            print("-" * 92)
+            for concurrency in args.concurrency:
+                run("new connection per call",
+                    lambda method, url: requests.request(method, url, verify=cert, timeout=10),
+                    provider, args.logins, concurrency)
+                session = build_session(pool_size=concurrency)
+                run("pooled session",
+                    lambda method, url: session.request(method, url, verify=cert,
+                                                        timeout=(3.05, 10)),
+                    provider, args.logins, concurrency)
+                session.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
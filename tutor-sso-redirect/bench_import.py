@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Import-time benchmark for the Tutor plugin module
+Runs ``python -X importtime`` in fresh interpreters and reports the
+cumulative import time of the plugin, against tutorssoredirect.plugin_broken
+which still loads pkg_resources and reads its patch files on import
+"""
+import statistics
+import subprocess
+import sys
+
+MODULES = [
+    "tutor.hooks",  # Paid by every plugin, for reference
+    "tutorssoredirect.plugin_broken",
+    "tutorssoredirect.plugin",
+]
+
+
+def import_times(module):
+    """Return {imported package: cumulative microseconds} for one fresh import"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _self, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def measure(module, runs):
+    # The total includes tutor.hooks: it is what every tutor invocation pays
+    totals = []
+    pkg_resources = []
+    for _ in range(runs):
+        times = import_times(module)
+        totals.append(times.get(module, 0))
+        pkg_resources.append(times.get("pkg_resources", 0))
+    return statistics.median(totals), statistics.median(pkg_resources)
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"Cumulative import time, median of {runs} fresh interpreters")
+    print("=" * 70)
+    print(f"{'module':<36} {'total':>12} {'pkg_resources':>16}")
+    for module in MODULES:
+        total, pkg_resources = measure(module, runs)
+        print(f"{module:<36} {total / 1000:>10.1f}ms {pkg_resources / 1000:>14.1f}ms")
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Per-request logging overhead of the SSO logging profiles
+Emulates the log calls of a login request (the middleware decision, social
+auth and third party auth debug output) and times them, in us/request, with
+the previous synchronous DEBUG console handler and with each SSO_LOG_PROFILE.
+Records are written to a file, flushed per record as the console is, and
+each flush can be made to block for a while, as stdout does when the log
+collector falls behind:
+
+    python bench_logging.py --requests 5000 --console-latency-us 0 200
+"""
+import argparse
+import logging
+import logging.config
+import os
+import tempfile
+import time
+
+from tutorssoredirect.sso_redirect import logs
+
+PACKAGE = logs.PACKAGE
+
+FORMATTERS = {
+    "standard": {
+        "format": "%(asctime)s %(levelname)s %(process)d [%(name)s] %(filename)s:%(lineno)d - %(message)s",
+    },
+}
+
+
+class Console(object):
+    '''File whose flushes block for ``latency`` seconds'''
+
+    def __init__(self, stream, latency):
+        self.stream = stream
+        self.latency = latency
+
+    def write(self, data):
+        return self.stream.write(data)
+
+    def flush(self):
+        self.stream.flush()
+        if self.latency:
+            time.sleep(self.latency)
+
+
+class Payload(object):
+    # Stand-in for the objects social auth logs, e.g. responses and backends
+    def __repr__(self):
+        return "<Payload {}>".format(", ".join(f"{k}={k * 3}" for k in "abcdefgh"))
+
+
+def request(i, payload, eager=False):
+    middleware = logging.getLogger(PACKAGE + ".middleware")
+    social = logging.getLogger("social.backends.oidc")
+    tpa = logging.getLogger("common.djangoapps.third_party_auth.pipeline")
+    middleware.info("SSO Redirect: INTERCEPTING %s -> %s", "/login", "/auth/login/oidc/")
+    for step in range(8):
+        if eager:
+            social.debug(f"pipeline step {step} of request {i}: {payload!r}")
+        else:
+            social.debug("pipeline step %s of request %s: %r", step, i, payload)
+    tpa.debug("auth_entry %s, next %s", "login", "/dashboard")
+    tpa.debug("running %s", payload)
+
+
+def previous_config(stream):
+    # The former settings patch: SSO loggers at DEBUG on the console handler
+    return {
+        "version": 1,
+        "disable_existing_loggers": False,
+        "formatters": FORMATTERS,
+        "handlers": {
+            "console": {"class": "logging.StreamHandler", "formatter": "standard", "stream": stream},
+        },
+        "loggers": {
+            name: {"handlers": ["console"], "level": "DEBUG", "propagate": False}
+            for name in logs.SSO_LOGGERS
+        },
+    }
+
+
+def profile_config(stream, profile, queue_size, **kwargs):
+    config = {"version": 1, "disable_existing_loggers": False, "formatters": dict(FORMATTERS)}
+    config = logs.configure_logging(config, profile, queue_size=queue_size, **kwargs)
+    config["handlers"]["sso_async"]["stream"] = stream
+    return config
+
+
+def async_handler():
+    for handler in logging.getLogger(PACKAGE).handlers:
+        if isinstance(handler, logs.AsyncHandler):
+            return handler
+    return None
+
+
+def run(name, config, requests, eager=False):
+    logging.config.dictConfig(config)
+    payload = Payload()
+    start = time.perf_counter()
+    for i in range(requests):
+        request(i, payload, eager)
+    elapsed = time.perf_counter() - start
+    handler = async_handler()
+    dropped = 0
+    if handler is not None:
+        # Drain outside of the timing: it happens in the listener thread
+        handler.stop()
+        dropped = handler.dropped
+    print(f"{name:<44} {elapsed / requests * 1e6:>10.1f}us {dropped:>10}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--console-latency-us", type=float, nargs="+", default=[0, 200],
+                        help="Time every console flush blocks for")
+    args = parser.parse_args(argv)
+
+    records = args.requests * 11
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, "console.log"), "w") as log_file:
+            for latency in args.console_latency_us:
+                stream = Console(log_file, latency / 1e6)
+                print(f"\nConsole flushes blocking for {latency:g}us")
+                print(f"{'variant':<44} {'per request':>12} {'dropped':>10}")
+                print("-" * 68)
+                run("previous: sync console, DEBUG", previous_config(stream), args.requests)
+                for label, profile, kwargs in [
+                    ("debug", "debug", {}),
+                    ("debug, sampled 1/10", "debug", {"sample_rate": 0.1}),
+                    ("debug, rate limited 50/s", "debug", {"rate_limit": 50}),
+                    ("production", "production", {}),
+                    ("quiet", "quiet", {}),
+                ]:
+                    config = profile_config(stream, profile, records, **kwargs)
+                    run(label, config, args.requests)
+                # Disabled debug calls that format their message anyway
+                config = profile_config(stream, "production", records)
+                run("production, f-string debug calls", config, args.requests, eager=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+End-to-end login flow benchmark against a local mock OIDC provider
+Drives concurrent logins through the whole chain, legacy /login,
+mfe_sso_redirect, the MFE tpa_hint page, /auth/login/oidc/, the IdP and
+/auth/complete/oidc/, and reports p50/p95/p99 per hop and end to end, plus
+throughput. The IdP is mock_oidc.py, started in-process, whose token and
+userinfo latency can be set, so that a slow login can be attributed either
+to the LMS or to the IdP.
+
+Point the LMS at the mock IdP first (the issuer must be reachable from the
+LMS container and from this script):
+
+    tutor config save --set SSO_OIDC_ENDPOINT=http://172.17.0.1:8090 \\
+        --set SSO_OIDC_KEY=lms --set SSO_OIDC_SECRET=secret
+    tutor local restart lms
+
+    python bench_login_flow.py http://local.openedx.io:8000 \\
+        --idp-issuer http://172.17.0.1:8090 --logins 500 --concurrency 50 \\
+        --token-latency 0.05 --userinfo-latency 0.02 --key-file mock_idp.pem
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import defaultdict
+from urllib.parse import quote, urljoin, urlsplit
+
+from mock_oidc import MockOIDCProvider
+from tutorssoredirect.diagnostics import HTTPClient, REDIRECT_STATUSES
+
+HOPS = ["login", "mfe", "auth_begin", "idp_authorize", "auth_complete"]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    values = sorted(values)
+    index = max(0, min(len(values) - 1, int(round(pct / 100.0 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def label(url, lms_host, idp_host):
+    parts = urlsplit(url)
+    if parts.netloc == idp_host:
+        return "idp_authorize"
+    if "/auth/complete/" in parts.path:
+        return "auth_complete"
+    if "/auth/login/" in parts.path:
+        return "auth_begin"
+    if parts.netloc != lms_host or "tpa_hint" in parts.query:
+        return "mfe"
+    return "login"
+
+
+async def login(client, lms, idp_host, next_url="/dashboard", max_hops=15):
+    """Run one login and return [(hop, seconds, status)], success"""
+    lms_host = urlsplit(lms).netloc
+    url = f"{lms}/login?next={quote(next_url)}"
+    cookies = defaultdict(dict)
+    hops = []
+    for _ in range(max_hops):
+        host = urlsplit(url).netloc
+        headers = {"User-Agent": "sso-login-bench"}
+        if cookies[host]:
+            headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in cookies[host].items())
+        response = await client.request("GET", url, headers)
+        cookies[host].update(response.cookies)
+        hop = label(url, lms_host, idp_host)
+        hops.append((hop, response.latency, response.status))
+        location = response.header("location")
+        if hop == "auth_complete":
+            # Logged in when the callback sends the browser on, not back to login
+            ok = response.status in REDIRECT_STATUSES and location is not None \
+                and "/login" not in location and "error" not in location
+            return hops, ok
+        if response.status in REDIRECT_STATUSES and location:
+            url = urljoin(url, location)
+        elif hop == "mfe" and response.status == 200:
+            # What the authn MFE does in the browser once its bundle is loaded
+            url = f"{lms}/auth/login/oidc/?auth_entry=login&next={quote(next_url)}"
+        else:
+            return hops, False
+    return hops, False
+
+
+async def run(lms, idp_host, logins, concurrency, timeout):
+    client = HTTPClient(connections_per_host=concurrency, timeout=timeout)
+    semaphore = asyncio.Semaphore(concurrency)
+    results = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                hops, ok = await login(client, lms, idp_host)
+            except Exception as e:
+                hops, ok = [("error", 0.0, repr(e))], False
+            results.append((hops, ok, time.perf_counter() - start))
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*[one() for _ in range(logins)])
+    finally:
+        await client.close()
+    return results, time.perf_counter() - start
+
+
+def report(results, elapsed, provider):
+    per_hop = defaultdict(list)
+    end_to_end = []
+    for hops, ok, total in results:
+        if not ok:
+            continue
+        end_to_end.append(total)
+        for hop, seconds, _status in hops:
+            per_hop[hop].append(seconds)
+
+    def stats(values):
+        ms = [v * 1000 for v in values]
+        stats = {"count": len(ms)}
+        # No percentiles when every login failed, first_failures tells why
+        for pct in (50, 95, 99) if ms else ():
+            stats[f"p{pct}_ms"] = round(percentile(ms, pct), 2)
+        return stats
+
+    succeeded = len(end_to_end)
+    return {
+        "logins": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(succeeded / elapsed, 2) if elapsed else None,
+        "hops": {hop: stats(per_hop[hop]) for hop in HOPS + sorted(set(per_hop) - set(HOPS))
+                 if per_hop[hop]},
+        "end_to_end": stats(end_to_end),
+        # Server-side time of the IdP, including the configured latency. The
+        # token and userinfo calls are made by the LMS inside auth_complete.
+        "idp": {name: stats(values) for name, values in sorted(provider.timings.items())},
+        "first_failures": [
+            [(hop, status) for hop, _seconds, status in hops]
+            for hops, ok, _total in results if not ok
+        ][:5],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("lms", help="LMS base URL, e.g. http://local.openedx.io:8000")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--idp-host", default="0.0.0.0")
+    parser.add_argument("--idp-port", type=int, default=8090)
+    parser.add_argument("--idp-issuer", help="Mock IdP URL as the LMS and this script reach it")
+    parser.add_argument("--client-id", default="lms")
+    parser.add_argument("--client-secret", default="secret")
+    parser.add_argument("--users", type=int, default=1000,
+                        help="Distinct mock users; fewer users means more returning logins")
+    parser.add_argument("--key-file",
+                        help="PEM file of the mock IdP signing key, created if missing. Reuse it "
+                             "across runs, the LMS refetches the JWKS for a new key once a minute")
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    parser.add_argument("--userinfo-latency", type=float, default=0.0)
+    parser.add_argument("--authorize-latency", type=float, default=0.0)
+    parser.add_argument("-o", "--output", help="Write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    provider = MockOIDCProvider(
+        host=args.idp_host,
+        port=args.idp_port,
+        issuer=args.idp_issuer,
+        client_id=args.client_id,
+        client_secret=args.client_secret,
+        users=args.users,
+        key_file=args.key_file,
+        latencies={
+            "authorize": args.authorize_latency,
+            "token": args.token_latency,
+            "userinfo": args.userinfo_latency,
+        },
+    )
+    with provider:
+        idp_host = urlsplit(provider.url).netloc
+        results, elapsed = asyncio.run(
+            run(args.lms.rstrip("/"), idp_host, args.logins, args.concurrency, args.timeout)
+        )
+        output = json.dumps(report(results, elapsed, provider), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Exercise the shared OIDC discovery/JWKS cache against a local stand-in IdP
+Simulates several uWSGI workers sharing one cache and reports how many IdP
+round-trips the logins cost, with and without the cache, and checks that
+stale documents are served while a single background refresh runs
+"""
+import json
+import sys
+import threading
+import time
+from urllib.request import urlopen
+
+from mock_oidc import MockOIDCProvider
+from tutorssoredirect.sso_redirect.discovery import DocumentCache
+
+
+class SharedCache(object):
+    '''Minimal thread-safe stand-in for the Django cache API'''
+
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            value, expires = self.data.get(key, (default, None))
+            if expires is not None and expires < time.time():
+                del self.data[key]
+                return default
+            return value
+
+    def set(self, key, value, timeout=None):
+        with self.lock:
+            self.data[key] = (value, time.time() + timeout if timeout else None)
+
+    def add(self, key, value, timeout=None):
+        with self.lock:
+            current = self.data.get(key)
+            if current is not None and (current[1] is None or current[1] >= time.time()):
+                return False
+            self.data[key] = (value, time.time() + timeout if timeout else None)
+            return True
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+
+def fetch_json(url):
+    with urlopen(url, timeout=10) as response:
+        return json.loads(response.read())
+
+
+def login(provider, cache):
+    """The IdP documents one login needs before talking to the token endpoint"""
+    url = provider.url + "/.well-known/openid-configuration"
+    config = cache.get(url, fetch_json) if cache else fetch_json(url)
+    jwks_uri = config["jwks_uri"]
+    return cache.get(jwks_uri, fetch_json) if cache else fetch_json(jwks_uri)
+
+
+def run(provider, workers, logins, shared=None):
+    provider.hits.clear()
+    caches = [
+        DocumentCache(shared, ttl=300, stale_ttl=3600) if shared is not None else None
+        for _ in range(workers)
+    ]
+    start = time.perf_counter()
+    threads = [
+        threading.Thread(target=lambda c=c: [login(provider, c) for _ in range(logins)])
+        for c in caches
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return sum(provider.hits.values()), elapsed / (workers * logins) * 1000
+
+
+def main(workers=8, logins=50, latency=0.02):
+    with MockOIDCProvider(latency=latency) as provider:
+        print(f"Stand-in IdP at {provider.url}, {latency * 1000:.0f}ms per response")
+        print(f"{workers} workers x {logins} logins")
+        print("=" * 70)
+
+        hits, per_login = run(provider, workers, logins)
+        print(f"No cache:     {hits:>5} IdP requests, {per_login:8.2f}ms per login")
+
+        shared = SharedCache()
+        hits, per_login = run(provider, workers, logins, shared)
+        print(f"Shared cache: {hits:>5} IdP requests, {per_login:8.2f}ms per login")
+
+        # Past the TTL, stale documents are served and refreshed once
+        cache = DocumentCache(shared, ttl=0.2, stale_ttl=60)
+        url = provider.url + "/.well-known/openid-configuration"
+        cache.refresh(url, fetch_json)
+        time.sleep(0.3)
+        provider.hits.clear()
+        start = time.perf_counter()
+        for _ in range(100):
+            cache.get(url, fetch_json)
+        stale_ms = (time.perf_counter() - start) * 1000 / 100
+        time.sleep(latency * 5)
+        refreshes = provider.hits["/.well-known/openid-configuration"]
+        print(f"Stale reads:  {refreshes:>5} background refresh, {stale_ms:8.3f}ms per read")
+        print("=" * 70)
+        if refreshes != 1:
+            print("✗ Expected exactly one background refresh")
+            return 1
+        print("✓ Stale documents served while a single refresh ran")
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*[int(a) for a in sys.argv[1:3]]))
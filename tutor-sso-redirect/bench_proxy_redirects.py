@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Load test of the legacy login redirects, at Caddy against the LMS view
+Sends the same stream of /login requests to every base URL given and reports
+requests per second and latency percentiles, plus the Location and
+Cache-Control of the responses. Compare the proxy (the public LMS URL, with
+SSO_CADDY_REDIRECTS) with the Django view (the LMS port behind Caddy, or the
+public URL with SSO_CADDY_REDIRECTS=false):
+
+    python bench_proxy_redirects.py http://local.openedx.io http://localhost:8000 \\
+        --requests 5000 --concurrency 100
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import Counter
+from urllib.parse import quote
+
+from bench_login_flow import percentile
+from tutorssoredirect.diagnostics import HTTPClient, REDIRECT_STATUSES
+
+ROUTES = ["/login", "/register", "/signin", "/signup"]
+
+
+async def load(base, requests, concurrency, timeout):
+    client = HTTPClient(connections_per_host=concurrency, timeout=timeout)
+    headers = {"User-Agent": "sso-proxy-bench"}
+    latencies = []
+    statuses = Counter()
+    sample = {}
+    queue = iter(range(requests))
+
+    async def worker():
+        for i in queue:
+            route = ROUTES[i % len(ROUTES)]
+            url = f"{base}{route}?next={quote(f'/courses/{i}')}"
+            try:
+                response = await client.request("GET", url, headers)
+            except Exception as e:
+                statuses[e.__class__.__name__] += 1
+                continue
+            latencies.append(response.latency)
+            statuses[response.status] += 1
+            if not sample:
+                sample.update({
+                    "url": url,
+                    "status": response.status,
+                    "location": response.header("location"),
+                    "cache_control": response.header("cache-control"),
+                    "server": response.header("server"),
+                })
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+    finally:
+        await client.close()
+    elapsed = time.perf_counter() - start
+    ms = [v * 1000 for v in latencies]
+    redirects = sum(n for status, n in statuses.items() if status in REDIRECT_STATUSES)
+    return {
+        "base": base,
+        "requests": requests,
+        "redirects": redirects,
+        "statuses": {str(k): v for k, v in statuses.items()},
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_s": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(ms, 50), 2) if ms else None,
+        "p95_ms": round(percentile(ms, 95), 2) if ms else None,
+        "p99_ms": round(percentile(ms, 99), 2) if ms else None,
+        "connections_opened": client.opened,
+        "sample": sample,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("bases", nargs="+", help="Base URLs, e.g. http://local.openedx.io")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    args = parser.parse_args(argv)
+
+    results = []
+    for base in args.bases:
+        results.append(asyncio.run(load(
+            base.rstrip("/"), args.requests, args.concurrency, args.timeout
+        )))
+    print(json.dumps(results, indent=2))
+
+    print("\n" + "=" * 70, file=sys.stderr)
+    failed = False
+    for result in results:
+        ok = result["redirects"] == result["requests"]
+        failed = failed or not ok
+        print(f"{'✓' if ok else '✗'} {result['base']:<36} {result['requests_per_s']:>10} req/s"
+              f"  p99 {result['p99_ms']} ms  Cache-Control: {result['sample'].get('cache_control')}",
+              file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
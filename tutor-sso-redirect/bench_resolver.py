@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for the URL patterns prepended to the LMS urlpatterns
+Resolves a sample of LMS paths against a stand-in of the LMS root URLconf,
+without the auth patterns, with the four previous re_paths and with the single
+set-backed pattern, in ns/resolve. Needs Django, not the LMS.
+"""
+import sys
+import timeit
+from types import ModuleType
+
+import django
+from django.conf import settings
+
+settings.configure(ROOT_URLCONF="bench_urls", ALLOWED_HOSTS=["*"])
+django.setup()
+
+from django.http import HttpResponse
+from django.urls import Resolver404, include, re_path
+from django.urls.resolvers import URLResolver, RegexPattern
+
+from tutorssoredirect.sso_redirect.urls import auth_redirects
+from tutorssoredirect.sso_redirect.views import mfe_sso_redirect
+
+COURSE = r"(?P<course_id>[^/+]+(/|\+)[^/+]+(/|\+)[^/?]+)"
+USAGE = r"(?P<usage_id>(?:i4x://?[^/]+/[^/]+/[^/]+/[^@]+(?:@[^/]+)?)|(?:[^/]+))"
+
+
+def view(request, *args, **kwargs):
+    return HttpResponse()
+
+
+# Top-level LMS routes in their urls.py order, roughly, most of them include()
+LMS_ROUTES = [
+    r"^$",
+    r"^dashboard/?$",
+    r"^change_enrollment$",
+    r"^heartbeat$",
+    r"^api/user/",
+    r"^user_api/",
+    r"^api/enrollment/v1/",
+    r"^api/course_home/",
+    r"^api/courseware/",
+    r"^api/learning_sequences/",
+    r"^api/mfe_config/v1$",
+    r"^csrf/api/v1/token$",
+    r"^notifications/",
+    r"^i18n/",
+    r"^jsi18n/$",
+    r"^auth/",
+    r"^oauth2/",
+    r"^admin/",
+    r"^logout$",
+    r"^account/",
+    r"^courses/?$",
+    r"^courses/{}/about$".format(COURSE),
+    r"^courses/{}/courseware/?$".format(COURSE),
+    r"^courses/{}/info$".format(COURSE),
+    r"^courses/{}/progress$".format(COURSE),
+    r"^courses/{}/xblock/{}/handler/(?P<handler>[^/]*)(?:/(?P<suffix>.*))?$".format(COURSE, USAGE),
+    r"^courses/{}/jump_to/{}$".format(COURSE, USAGE),
+    r"^courses/{}/discussion/".format(COURSE),
+    r"^courses/{}/instructor$".format(COURSE),
+    r"^event$",
+    r"^xblock/{}$".format(USAGE),
+    r"^static/(?P<path>.*)$",
+    r"^media/(?P<path>.*)$",
+]
+
+PATHS = [
+    "",
+    "dashboard",
+    "heartbeat",
+    "login",
+    "api/courseware/course/course-v1:edX+DemoX+Demo_Course",
+    "api/course_home/outline/course-v1:edX+DemoX+Demo_Course",
+    "csrf/api/v1/token",
+    "courses/course-v1:edX+DemoX+Demo_Course/courseware",
+    "courses/course-v1:edX+DemoX+Demo_Course/xblock/block-v1:edX+DemoX+Demo_Course"
+    "+type@problem+block@123/handler/xmodule_handler/problem_check",
+    "event",
+    "static/css/lms-main-v1.css",
+    "media/course_images/demo.png",
+]
+
+
+def subtree():
+    # Routes under a prefix, so that include()s cost a nested resolve
+    return [re_path(r"^{}$".format(name), view) for name in ("a", "b", "v1/(?P<x>[^/]+)", ".*")]
+
+
+def lms_patterns():
+    patterns = []
+    for regex in LMS_ROUTES:
+        if regex.endswith("/") and not regex.endswith("?/"):
+            patterns.append(re_path(regex, include(subtree())))
+        else:
+            patterns.append(re_path(regex, view))
+    # The LMS's own login view, shadowed by the SSO patterns
+    patterns.append(re_path(r"^login$", view))
+    return patterns
+
+
+def previous_auth_redirects():
+    return [
+        re_path(r"^login/?$", mfe_sso_redirect),
+        re_path(r"^register/?$", mfe_sso_redirect),
+        re_path(r"^signin/?$", mfe_sso_redirect),
+        re_path(r"^signup/?$", mfe_sso_redirect),
+    ]
+
+
+def resolver(patterns):
+    urlconf = ModuleType("bench_urls")
+    urlconf.urlpatterns = patterns
+    return URLResolver(RegexPattern(r"^/"), urlconf)
+
+
+def route(root, path):
+    try:
+        return root.resolve("/" + path).func
+    except Resolver404:
+        return None
+
+
+def measure(roots, path, number, repeat=7):
+    # Variants take turns, so that noise hits all of them alike
+    path = "/" + path
+    best = [float("inf")] * len(roots)
+    for _ in range(repeat):
+        for i, root in enumerate(roots):
+            best[i] = min(best[i], timeit.timeit(lambda: root.resolve(path), number=number))
+    return [t / number * 1e9 for t in best]
+
+
+def main(number=20000):
+    variants = [
+        ("none", resolver(lms_patterns())),
+        ("4 re_paths", resolver(previous_auth_redirects() + lms_patterns())),
+        ("1 set", resolver(list(auth_redirects) + lms_patterns())),
+    ]
+
+    # Both variants must route the same way before timing means anything
+    for path in PATHS + ["login/", "register/", "signup", "loginx", "signin/x", "api/login"]:
+        assert route(variants[1][1], path) == route(variants[2][1], path), path
+
+    print(f"{'path':<60}" + "".join(f"{name:>12}" for name, _ in variants))
+    print("-" * 96)
+    totals = [0.0] * len(variants)
+    other = [0.0] * len(variants)
+    for path in PATHS:
+        times = measure([root for _name, root in variants], path, number)
+        totals = [t + x for t, x in zip(totals, times)]
+        if path != "login":
+            other = [t + x for t, x in zip(other, times)]
+        label = "/" + path if len(path) < 58 else "/" + path[:54] + "..."
+        print(f"{label:<60}" + "".join(f"{t:>10.0f}ns" for t in times))
+    print("-" * 96)
+    print(f"{'mean':<60}" + "".join(f"{t / len(PATHS):>10.0f}ns" for t in totals))
+    # What the patterns cost every request that is not a login
+    count = len(PATHS) - 1
+    print(f"{'overhead on other paths':<60}"
+          + "".join(f"{(t - other[0]) / count:>10.0f}ns" for t in other))
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
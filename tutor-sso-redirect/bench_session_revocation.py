@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Cost of logging a user out everywhere, with and without the session index
+Fills a SQLite django_session table with --rows signed sessions of random
+users. It then finds and deletes the sessions of a few users in two ways:
+through the plugin's SessionIndex, written for these users as the SSO login
+would, and with scan_sessions, which decodes every row as all Django allows
+without an index. The table is kept in --db and reused by the next run with
+the same --rows.
+
+    python bench_session_revocation.py --rows 2000000 --users 5
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+parser.add_argument("--rows", type=int, default=1000000)
+parser.add_argument("--users", type=int, default=5, help="Users to log out")
+parser.add_argument("--sessions-per-user", type=int, default=3)
+parser.add_argument("--db", default="/tmp/sso_bench_sessions.sqlite3")
+args = parser.parse_args()
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+settings.configure(
+    SECRET_KEY="bench",
+    INSTALLED_APPS=["django.contrib.auth", "django.contrib.contenttypes", "django.contrib.sessions", "social_django"],
+    DATABASES={"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": args.db}},
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    SESSION_ENGINE="django.contrib.sessions.backends.db",
+    SSO_METRICS_ENABLED=False,
+    USE_TZ=True,
+)
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.contrib.sessions.backends.db import SessionStore  # noqa: E402
+from django.contrib.sessions.models import Session  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.utils.crypto import get_random_string  # noqa: E402
+from social_django.models import UserSocialAuth  # noqa: E402
+
+from tutorssoredirect.sso_redirect import revocation  # noqa: E402
+from tutorssoredirect.sso_redirect.instrumentation import count_queries  # noqa: E402
+
+BATCH = 50000
+
+
+def fill(rows):
+    """Insert rows sessions of users 1..rows/2, return the time it took"""
+    start = time.perf_counter()
+    store = SessionStore()
+    expire = (datetime.now(timezone.utc) + timedelta(days=14)).isoformat(" ")
+    db = sqlite3.connect(args.db)
+    db.execute("DELETE FROM django_session")
+    for first in range(0, rows, BATCH):
+        batch = []
+        for _ in range(min(BATCH, rows - first)):
+            data = {
+                "_auth_user_id": str(random.randint(1, max(1, rows // 2))),
+                "_auth_user_backend": "django.contrib.auth.backends.ModelBackend",
+                "_auth_user_hash": get_random_string(40),
+            }
+            batch.append((get_random_string(32), store.encode(data), expire))
+        db.executemany(
+            "INSERT INTO django_session (session_key, session_data, expire_date) VALUES (?, ?, ?)",
+            batch,
+        )
+        db.commit()
+    db.close()
+    return time.perf_counter() - start
+
+
+def sso_user(user_id):
+    """User user_id with its association, as the SSO pipeline creates them"""
+    User = get_user_model()
+    User.objects.filter(pk=user_id).delete()
+    user = User.objects.create(pk=user_id, username=f"bench-{user_id}")
+    return user, UserSocialAuth.objects.create(user=user, provider="oidc", uid=f"sub-{user_id}", extra_data={})
+
+
+def login(user, social):
+    """A session of user, indexed as record_login does"""
+    session = SessionStore()
+    session["_auth_user_id"] = str(user.pk)
+    session.create()
+    start = time.perf_counter()
+    revocation.get_index().add(social, session.session_key, sid=get_random_string(16))
+    return session.session_key, time.perf_counter() - start
+
+
+def login_all(users, sessions_per_user):
+    keys, times = [], []
+    for _ in range(sessions_per_user):
+        for user, social in users:
+            key, seconds = login(user, social)
+            keys.append(key)
+            times.append(seconds)
+    return keys, times
+
+
+def main():
+    call_command("migrate", verbosity=0)
+    existing = Session.objects.count() if os.path.exists(args.db) and "django_session" in connection.introspection.table_names() else 0
+    if existing != args.rows:
+        print(f"Filling django_session with {args.rows} rows...")
+        print(f"  {fill(args.rows):.1f}s")
+    print(f"django_session: {Session.objects.count()} rows")
+
+    # Users above the filled range, so that only their own sessions match
+    users = [sso_user(args.rows + 1 + i) for i in range(args.users)]
+    keys, index_write = login_all(users, args.sessions_per_user)
+    print(f"Index write at login: {sum(index_write) / len(index_write) * 1e6:.0f}us per login")
+
+    start = time.perf_counter()
+    with count_queries() as counter:
+        deleted = sum(revocation.revoke_user(user)[0] for user, _social in users)
+    index_time = time.perf_counter() - start
+    left = Session.objects.filter(session_key__in=keys).count()
+    print(f"\nSession index:      {index_time:10.3f}s to find and delete {deleted} sessions of {len(users)} users, "
+          f"{counter.count} queries, {left} left")
+
+    keys, _times = login_all(users, args.sessions_per_user)
+    start = time.perf_counter()
+    with count_queries() as counter:
+        scanned, deleted = revocation.scan_sessions([user.pk for user, _social in users])
+    scan_time = time.perf_counter() - start
+    left = Session.objects.filter(session_key__in=keys).count()
+    print(f"Decode every row:   {scan_time:10.3f}s to scan {scanned} sessions and delete {deleted}, "
+          f"{counter.count} queries, {left} left")
+    # A scan costs the same for one user or many, the index grows with the users
+    print(f"One user:           {scan_time:10.3f}s scanned vs {index_time / len(users) * 1000:.2f}ms indexed")
+    get_user_model().objects.filter(pk__in=[user.pk for user, _social in users]).delete()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Count django_session writes per 1,000 logged-in requests for the stock
+session engines and the plugin's write-coalescing engine
+Run this inside the LMS container
+"""
+
+import os
+import sys
+import django
+
+# Set up Django environment
+sys.path.append('/openedx/edx-platform')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lms.envs.tutor.production')
+django.setup()
+
+from importlib import import_module
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.test import RequestFactory
+
+from lms.djangoapps.sso_redirect.instrumentation import count_queries
+
+ENGINES = [
+    'django.contrib.sessions.backends.db',
+    'django.contrib.sessions.backends.cached_db',
+    'lms.djangoapps.sso_redirect.sessions',
+]
+
+# One request in CHANGE_EVERY modifies the session, like a language switch
+CHANGE_EVERY = 50
+
+
+def is_write(sql):
+    sql = sql.lstrip().upper()
+    return 'DJANGO_SESSION' in sql and sql.startswith(('UPDATE', 'INSERT'))
+
+
+def run(engine, requests):
+    settings.SESSION_ENGINE = engine
+    settings.SESSION_SAVE_EVERY_REQUEST = True
+    store = import_module(engine).SessionStore()
+    store['_auth_user_id'] = '1'
+    store.create()
+
+    def view(request):
+        if view.count % CHANGE_EVERY == 0:
+            request.session['last_page'] = view.count
+        view.count += 1
+        return HttpResponse()
+    view.count = 0
+
+    middleware = SessionMiddleware(view)
+    factory = RequestFactory()
+    writes = 0
+    try:
+        for _ in range(requests):
+            request = factory.get('/dashboard')
+            request.COOKIES[settings.SESSION_COOKIE_NAME] = store.session_key
+            with count_queries() as counter:
+                middleware(request)
+            writes += sum(1 for sql in counter.queries if is_write(sql))
+    finally:
+        store.delete()
+    return writes
+
+
+if __name__ == "__main__":
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    print(f"django_session writes per {requests} requests "
+          f"(1 in {CHANGE_EVERY} changes the session)")
+    print("=" * 70)
+    for engine in ENGINES:
+        print(f"{engine:<50} {run(engine, requests):>8}")
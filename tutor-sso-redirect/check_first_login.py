@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Compare the callback cost of new and returning SSO users, with the
+first-login work in the callback and deferred to Celery
+Runs the pipeline from social_user to the end, each login in a transaction
+as with ATOMIC_REQUESTS, and reports queries and milliseconds per login. The
+deferred work is then run here, as one batch, instead of on the Celery
+workers, and every new user is checked to have a UserProfile. Created users
+are deleted at the end.
+Run this inside the LMS container
+
+    python /openedx/check_first_login.py --logins 50
+"""
+
+import argparse
+import os
+import sys
+import time
+import uuid
+import django
+
+# Set up Django environment
+sys.path.append('/openedx/edx-platform')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lms.envs.tutor.production')
+django.setup()
+
+from statistics import median
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+from social_core.pipeline.social_auth import associate_user, load_extra_data, social_user
+from social_django.utils import load_backend, load_strategy
+
+from common.djangoapps.student.models import UserProfile
+from lms.djangoapps.sso_redirect import deferred
+from lms.djangoapps.sso_redirect.instrumentation import count_queries
+from lms.djangoapps.sso_redirect.pipeline import (
+    create_sso_user, defer_sso_login_work, get_sso_username, login_sso_user,
+)
+
+User = get_user_model()
+
+TAILS = [
+    ("in the callback", [load_extra_data, login_sso_user]),
+    ("deferred", [defer_sso_login_work, login_sso_user]),
+]
+
+
+def login(steps, uid, details):
+    strategy = load_strategy()
+    backend = load_backend(strategy, 'oidc', redirect_uri=None)
+    response = dict(details, sub=uid, access_token='token', token_type='Bearer')
+    kwargs = {'strategy': strategy, 'backend': backend, 'details': details,
+              'response': response, 'uid': uid}
+    with transaction.atomic():
+        for step in [social_user, get_sso_username, create_sso_user, associate_user] + steps:
+            kwargs.update(step(**kwargs) or {})
+    return kwargs['user']
+
+
+def measure(steps, logins, tag):
+    """Return {'new': [(queries, ms)], 'returning': [...]}, and the users"""
+    results = {'new': [], 'returning': []}
+    users = []
+    uids = [f"check-{tag}-{uuid.uuid4().hex[:12]}" for _ in range(logins)]
+    for kind in ('new', 'returning'):
+        for uid in uids:
+            details = {'username': uid[:30], 'email': f"{uid}@example.com",
+                       'first_name': 'Ada', 'last_name': 'Lovelace'}
+            start = time.perf_counter()
+            with count_queries() as counter:
+                user = login(steps, uid, details)
+            results[kind].append((counter.count, (time.perf_counter() - start) * 1000))
+            if kind == 'new':
+                users.append(user)
+    return results, users
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--logins", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    # Items go to a batcher of their own and are run below, not on the workers
+    batcher = deferred.Batcher(caches['default'], interval=3600,
+                               prefix=f"sso:deferred:check:{uuid.uuid4().hex}:")
+    buckets = set()
+    deferred.defer = lambda item: buckets.add(batcher.add(item)[0])
+
+    created = []
+    failed = False
+    try:
+        print(f"{'tail':<18} {'user':<10} {'queries':>8} {'median ms':>10}")
+        for name, steps in TAILS:
+            results, users = measure(steps, args.logins, name.split()[0])
+            created.extend(users)
+            for kind in ('new', 'returning'):
+                queries = max(q for q, _ms in results[kind])
+                print(f"{name:<18} {kind:<10} {queries:>8} {median(ms for _q, ms in results[kind]):>10.1f}")
+
+        batches = [batcher.items(bucket) for bucket in buckets]
+        items = [item for batch, _missing, _last in batches for item in batch]
+        with count_queries() as counter:
+            deferred.run_items(items)
+        print(f"\nDeferred batch of {len(items)} logins: {counter.count} queries")
+        deferred_users = [user.pk for user in created[args.logins:]]
+        with_profile = UserProfile.objects.filter(user_id__in=deferred_users).count()
+        print(f"New users with a profile after the batch: {with_profile}/{len(deferred_users)}")
+        if with_profile != len(deferred_users):
+            failed = True
+        with count_queries() as counter:
+            deferred.run_items(items)
+        print(f"Same batch again: {counter.count} queries, "
+              f"{UserProfile.objects.filter(user_id__in=deferred_users).count()} profiles")
+        for bucket, (_batch, _missing, last) in zip(buckets, batches):
+            batcher.done(bucket, last)
+    finally:
+        User.objects.filter(pk__in=[user.pk for user in created]).delete()
+
+    if failed:
+        print("✗ Some new users have no profile after the deferred batch")
+        return 1
+    print("✓ Every new user has a profile after the deferred batch")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Check that an IdP key rotation costs one shared JWKS refetch
+Several workers, each with its own DocumentCache in front of the shared
+Django cache, verify ID tokens signed with a key the cached JWKS does not
+have yet. The JWKS is served in-process, no IdP is called. Expected: every
+worker accepts the new key after a single refetch, and a token with a key
+the IdP never published is refused without another refetch. Tokens without
+a key ID are checked against every key, and a token that no key verifies is
+refused with AuthTokenError.
+Run this inside the LMS container
+
+    python /openedx/check_jwks_rotation.py --workers 8
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+import django
+
+# Set up Django environment
+sys.path.append('/openedx/edx-platform')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lms.envs.tutor.production')
+django.setup()
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.core.cache import caches
+from django.conf import settings
+from social_core.exceptions import AuthTokenError
+from social_django.utils import load_backend, load_strategy
+
+from lms.djangoapps.sso_redirect import discovery
+
+KEY_IDS = ('old', 'new', 'unpublished')
+
+
+def public_jwk(private_key, kid):
+    key = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    key.update(kid=kid, alg='RS256', use='sig')
+    return key
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    private = {kid: rsa.generate_private_key(public_exponent=65537, key_size=2048) for kid in KEY_IDS}
+    published = ['old']
+    fetches = []
+
+    def get_json(url, *args, **kwargs):
+        fetches.append(url)
+        return {'keys': [public_jwk(private[kid], kid) for kid in published]}
+
+    # A prefix of its own, so that the check neither sees nor touches the live JWKS
+    shared = caches[getattr(settings, 'SSO_OIDC_CACHE_ALIAS', 'default')]
+    prefix = f"sso:oidc:check:{uuid.uuid4().hex}:"
+    workers = []
+    for _ in range(args.workers):
+        backend = load_backend(load_strategy(), 'oidc', redirect_uri=None)
+        backend.get_json = get_json
+        backend.jwks_uri = lambda: 'https://idp.invalid/oauth/v2/keys'
+        workers.append((backend, discovery.DocumentCache(shared, prefix=prefix)))
+
+    def sign(kid, with_kid=True):
+        return jwt.encode({'sub': 'check'}, private[kid], algorithm='RS256',
+                          headers={'kid': kid} if with_kid else None)
+
+    def verify(kid, with_kid=True):
+        token = sign(kid, with_kid)
+        accepted = 0
+        for backend, cache in workers:
+            discovery._document_cache = cache
+            accepted += backend.find_valid_key(token) is not None
+        return accepted
+
+    saved = discovery._document_cache
+    failed = False
+    try:
+        if not workers[0][0].cache_enabled():
+            print("✗ SSO_OIDC_CACHE_TTL is 0, the shared JWKS cache is off")
+            return 1
+        print(f"{'token key':<22} {'accepted':>9} {'JWKS fetches':>13}")
+        for label, kid, with_kid, rotate, expected in (
+            ("old, first logins", 'old', True, False, (args.workers, 1)),
+            ("new, after rotation", 'new', True, True, (args.workers, 1)),
+            ("never published", 'unpublished', True, False, (0, 0)),
+            ("new, no key ID", 'new', False, False, (args.workers, 0)),
+            ("unknown, no key ID", 'unpublished', False, False, (0, 0)),
+        ):
+            if rotate:
+                published[:] = ['old', 'new']
+            fetches.clear()
+            start = time.perf_counter()
+            accepted = verify(kid, with_kid)
+            ms = (time.perf_counter() - start) * 1000
+            print(f"{label:<22} {accepted:>9} {len(fetches):>13}   {ms:.1f}ms")
+            if (accepted, len(fetches)) != expected:
+                failed = True
+
+        # The login refuses a token no key verifies, instead of a server error
+        backend, cache = workers[0]
+        discovery._document_cache = cache
+        try:
+            backend.validate_and_return_id_token(sign('unpublished', with_kid=False), 'access')
+        except AuthTokenError as error:
+            print(f"Unknown key, no key ID: {error}")
+        except Exception as error:
+            print(f"Unknown key, no key ID: {error!r}")
+            failed = True
+    finally:
+        discovery._document_cache = saved
+        url = 'https://idp.invalid/oauth/v2/keys'
+        workers[0][1].clear(url)
+        shared.delete(workers[0][1].key(url) + ':rotated')
+
+    if failed:
+        print("✗ Expected every worker to accept the new key after one shared JWKS fetch, "
+              "and AuthTokenError for a token no key verifies")
+        return 1
+    print("✓ A key rotation costs one JWKS fetch for all the workers")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
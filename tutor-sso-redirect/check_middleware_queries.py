@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Check that the SSO redirect middleware costs no database queries on
+non-auth paths, even for requests that carry a logged-in session cookie
+Run this inside the LMS container
+"""
+
+import os
+import sys
+import django
+
+# Set up Django environment
+sys.path.append('/openedx/edx-platform')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lms.envs.tutor.production')
+django.setup()
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.test import RequestFactory
+
+from lms.djangoapps.sso_redirect.instrumentation import count_queries
+from lms.djangoapps.sso_redirect.middleware import SSORedirectMiddleware
+
+NON_AUTH_PATHS = [
+    "/",
+    "/dashboard",
+    "/heartbeat",
+    "/static/css/lms-main-v1.css",
+    "/courses/course-v1:edX+DemoX+Demo_Course/courseware",
+    "/courses/course-v1:edX+DemoX+Demo_Course/xblock/block-v1:edX+DemoX+Demo_Course+type@problem+block@123/handler/xmodule_handler/problem_check",
+    "/auth/complete/oidc/",
+]
+
+AUTH_PATHS = [
+    "/login",
+    "/register",
+    "/authn/login",
+]
+
+
+def make_request(factory, path, session_key):
+    request = factory.get(path)
+    request.COOKIES[settings.SESSION_COOKIE_NAME] = session_key
+    SessionMiddleware(lambda r: None).process_request(request)
+    AuthenticationMiddleware(lambda r: None).process_request(request)
+    return request
+
+
+def run(classify_first):
+    settings.SSO_REDIRECT_CLASSIFY_FIRST = classify_first
+    settings.SSO_REDIRECT_QUERY_HOOK = ''
+    middleware = SSORedirectMiddleware(lambda r: None)
+    factory = RequestFactory()
+    costs = {}
+    for path in NON_AUTH_PATHS + AUTH_PATHS:
+        request = make_request(factory, path, session_key)
+        with count_queries() as counter:
+            middleware.process_request(request)
+        costs[path] = counter.count
+    return costs
+
+
+# A logged-in session, so that touching request.user would cost queries
+user = get_user_model().objects.filter(is_active=True).first()
+if user is None:
+    print("✗ No active user to build a session for")
+    sys.exit(1)
+store = SessionMiddleware(lambda r: None).SessionStore()
+store['_auth_user_id'] = str(user.pk)
+store['_auth_user_backend'] = 'django.contrib.auth.backends.ModelBackend'
+store['_auth_user_hash'] = user.get_session_auth_hash()
+store.create()
+session_key = store.session_key
+
+print("SSO Redirect middleware query counts")
+print("=" * 70)
+failed = False
+try:
+    before = run(classify_first=False)
+    after = run(classify_first=True)
+    print(f"{'path':<50} {'user first':>10} {'path first':>10}")
+    for path in NON_AUTH_PATHS + AUTH_PATHS:
+        label = path if len(path) <= 48 else path[:45] + "..."
+        print(f"{label:<50} {before[path]:>10} {after[path]:>10}")
+    for path in NON_AUTH_PATHS:
+        if after[path] != 0:
+            print(f"\n✗ {path} cost {after[path]} queries, expected 0")
+            failed = True
+finally:
+    store.delete()
+
+print("\n" + "=" * 70)
+if failed:
+    sys.exit(1)
+print("✓ Non-auth paths cost zero queries")
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Check the number of queries a returning SSO user costs in the social auth
+pipeline, from social_user to the end of the pipeline
+Run this inside the LMS container
+"""
+
+import os
+import sys
+import uuid
+import django
+
+# Set up Django environment
+sys.path.append('/openedx/edx-platform')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lms.envs.tutor.production')
+django.setup()
+
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.test import RequestFactory
+from social_core.pipeline.social_auth import load_extra_data, social_user
+from social_django.models import UserSocialAuth
+from social_django.utils import load_backend, load_strategy
+
+from lms.djangoapps.sso_redirect.instrumentation import count_queries
+from lms.djangoapps.sso_redirect.pipeline import login_sso_user
+
+# Budget for a repeat login: social_user and load_extra_data
+MAX_QUERIES = 2
+
+User = get_user_model()
+
+request = RequestFactory().get('/auth/complete/oidc/')
+SessionMiddleware(lambda r: None).process_request(request)
+strategy = load_strategy(request)
+backend = load_backend(strategy, 'oidc', redirect_uri='/auth/complete/oidc/')
+
+uid = f"check-{uuid.uuid4().hex}"
+user = User.objects.create(
+    username=uid[:30], email=f"{uid}@example.com", first_name="Ada", last_name="Lovelace",
+)
+UserSocialAuth.objects.create(user=user, provider=backend.name, uid=uid)
+details = {
+    'username': user.username,
+    'email': user.email,
+    'first_name': 'Ada',
+    'last_name': 'Lovelace',
+}
+response = {'sub': uid, 'access_token': 'token'}
+
+print("Returning SSO user pipeline query counts")
+print("=" * 70)
+failed = False
+try:
+    with count_queries() as step:
+        login_sso_user(strategy, backend, details, user=user)
+    print(f"login_sso_user alone:             {step.count}")
+    if step.count != 0:
+        failed = True
+
+    with count_queries() as total:
+        kwargs = {'strategy': strategy, 'backend': backend, 'details': details,
+                  'response': response, 'uid': uid}
+        kwargs.update(social_user(backend, uid) or {})
+        load_extra_data(**kwargs)
+        login_sso_user(**kwargs)
+    print(f"social_user .. end of pipeline:   {total.count}")
+    for sql in total.queries:
+        print(f"    {sql[:100]}")
+    if total.count > MAX_QUERIES:
+        failed = True
+finally:
+    user.delete()
+
+print("\n" + "=" * 70)
+if failed:
+    print(f"✗ Returning users cost more than {MAX_QUERIES} queries")
+    sys.exit(1)
+print(f"✓ Returning users cost at most {MAX_QUERIES} queries")
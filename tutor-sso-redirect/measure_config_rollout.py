@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Time how long an authn MFE setting change takes to reach the browsers
+Runs a deploy command, then polls the LMS MFE config API until the setting
+has the expected value, and reports the command time, the time until the
+value was served and the cache lifetime still ahead of browsers. Run it
+once with the build-time deploy and once with the runtime one:
+
+    python measure_config_rollout.py http://local.openedx.io DISABLE_ENTERPRISE_LOGIN false -- \\
+        sh -c "tutor config save && tutor images build mfe && tutor local start -d mfe"
+    python measure_config_rollout.py http://local.openedx.io DISABLE_ENTERPRISE_LOGIN false -- \\
+        sh -c "tutor config save && tutor local restart lms"
+
+For a build-time setting, pass --bundle with the URL of the authn MFE page:
+the value is then looked for in the page and its scripts instead.
+"""
+import argparse
+import json
+import re
+import subprocess
+import sys
+import time
+import urllib.request
+from urllib.error import URLError
+
+CONFIG_PATH = "/api/mfe_config/v1"
+
+
+def fetch(url):
+    request = urllib.request.Request(url, headers={"Accept": "application/json, text/html, */*"})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return response.read().decode("utf-8", "replace"), response.headers
+
+
+def runtime_value(lms, mfe, key):
+    # The cache buster skips the server and proxy caches: the wait they add
+    # is reported separately, from Cache-Control
+    url = f"{lms.rstrip('/')}{CONFIG_PATH}?mfe={mfe}&_={time.time()}"
+    body, headers = fetch(url)
+    return json.loads(body).get(key), headers.get("Cache-Control", "")
+
+
+def bundle_value(page, key):
+    body, headers = fetch(page)
+    sources = [body]
+    for script in re.findall(r'<script[^>]+src="([^"]+)"', body):
+        if not script.startswith("http"):
+            script = urllib.request.urljoin(page, script)
+        sources.append(fetch(script)[0])
+    for source in sources:
+        match = re.search(re.escape(key) + r'''["']?\s*[:=]\s*["']?([^"',}\s]*)''', source)
+        if match:
+            return match.group(1), headers.get("Cache-Control", "")
+    return None, headers.get("Cache-Control", "")
+
+
+def same(value, expected):
+    return str(value).lower() == expected.lower()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("lms", help="LMS base URL")
+    parser.add_argument("key", help="Setting, e.g. DISABLE_ENTERPRISE_LOGIN")
+    parser.add_argument("expected", help="Value to wait for, e.g. false")
+    parser.add_argument("command", nargs=argparse.REMAINDER, help="Deploy command, after --")
+    parser.add_argument("--mfe", default="authn")
+    parser.add_argument("--bundle", help="Look for the value in this MFE page and its scripts")
+    parser.add_argument("--timeout", type=float, default=3600)
+    parser.add_argument("--interval", type=float, default=1.0)
+    args = parser.parse_args(argv)
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+
+    def current():
+        if args.bundle:
+            return bundle_value(args.bundle, args.key)
+        return runtime_value(args.lms, args.mfe, args.key)
+
+    start = time.perf_counter()
+    if command:
+        subprocess.run(command, check=True)
+    deployed = time.perf_counter()
+
+    value, cache_control = None, ""
+    while time.perf_counter() - start < args.timeout:
+        try:
+            value, cache_control = current()
+        except (URLError, ValueError, OSError):
+            value = None
+        if same(value, args.expected):
+            break
+        time.sleep(args.interval)
+    else:
+        print(f"{args.key} still {value!r} after {args.timeout:.0f}s")
+        return 1
+    served = time.perf_counter()
+
+    max_age = re.search(r"max-age=(\d+)", cache_control)
+    print(f"deploy command:     {deployed - start:10.1f}s")
+    print(f"value served after: {served - start:10.1f}s")
+    print(f"cached copies:      up to {int(max_age.group(1)) if max_age else 0}s more ({cache_control or 'no Cache-Control'})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
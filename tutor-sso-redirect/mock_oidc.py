@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Zitadel OIDC provider
+Implements the authorization code flow (discovery, authorize, token,
+userinfo, JWKS) well enough for the LMS to log users in, counts hits and
+server-side time per endpoint, and can be made slow per endpoint, so that
+the SSO components can be exercised and benchmarked without a live IdP.
+
+ID tokens are signed with RS256 by an RSA key generated at startup, with its
+key ID in the header, and the public key is published at /oauth/v2/keys, so
+that the LMS verifies them through the JWKS as it does Zitadel's. A new key is
+a key rotation for the LMS, which refetches the JWKS at most once a minute:
+pass the same --key-file to consecutive runs to keep the key.
+
+    python mock_oidc.py --port 8090 --client-id lms --client-secret secret \\
+        --token-latency 0.05 --userinfo-latency 0.02
+"""
+import argparse
+import base64
+import hashlib
+import itertools
+import os
+import json
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+
+
+def b64url(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def b64url_uint(value):
+    return b64url(value.to_bytes((value.bit_length() + 7) // 8, "big"))
+
+
+def sign_rs256(claims, private_key, kid):
+    header = b64url(json.dumps({"alg": "RS256", "typ": "JWT", "kid": kid}).encode("utf-8"))
+    payload = b64url(json.dumps(claims).encode("utf-8"))
+    signing_input = f"{header}.{payload}".encode("ascii")
+    signature = private_key.sign(signing_input, padding.PKCS1v15(), hashes.SHA256())
+    return f"{header}.{payload}.{b64url(signature)}"
+
+
+def load_key(path=None):
+    """RSA signing key from the PEM file at path, generated and saved if missing"""
+    if path and os.path.exists(path):
+        with open(path, "rb") as f:
+            return serialization.load_pem_private_key(f.read(), password=None)
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    if path:
+        with open(path, "wb") as f:
+            f.write(private_key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption(),
+            ))
+    return private_key
+
+
+def key_id(private_key):
+    """Key ID derived from the public key, the same for every run with that key"""
+    n = private_key.public_key().public_numbers().n
+    return b64url(hashlib.sha256(n.to_bytes((n.bit_length() + 7) // 8, "big")).digest())[:16]
+
+
+def public_jwk(private_key, kid):
+    numbers = private_key.public_key().public_numbers()
+    return {"kty": "RSA", "use": "sig", "alg": "RS256", "kid": kid,
+            "n": b64url_uint(numbers.n), "e": b64url_uint(numbers.e)}
+
+
+class MockOIDCProvider(object):
+    '''OIDC provider stand-in running in a background thread'''
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, issuer=None,
+                 client_id="lms", client_secret="secret", users=1000, latencies=None,
+                 key_file=None):
+        self.latency = latency
+        # Extra latency per endpoint name: authorize, token, userinfo, jwks, discovery
+        self.latencies = dict(latencies or {})
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.users = users
+        self.private_key = load_key(key_file)
+        self.key_id = key_id(self.private_key)
+        self.hits = Counter()
+        self.timings = defaultdict(list)
+        self._issuer = issuer
+        self._codes = {}
+        self._tokens = {}
+        self._subjects = itertools.count()
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        if self._issuer:
+            return self._issuer.rstrip("/")
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def routes(self):
+        return {
+            "/.well-known/openid-configuration": ("discovery", self.discovery),
+            "/oauth/v2/keys": ("jwks", self.jwks),
+            "/oauth/v2/authorize": ("authorize", self.authorize),
+            "/oauth/v2/token": ("token", self.token),
+            "/oidc/v1/userinfo": ("userinfo", self.userinfo),
+        }
+
+    def discovery(self, request):
+        return 200, {
+            "issuer": self.url,
+            "authorization_endpoint": f"{self.url}/oauth/v2/authorize",
+            "token_endpoint": f"{self.url}/oauth/v2/token",
+            "userinfo_endpoint": f"{self.url}/oidc/v1/userinfo",
+            "jwks_uri": f"{self.url}/oauth/v2/keys",
+            "end_session_endpoint": f"{self.url}/oidc/v1/end_session",
+            "response_types_supported": ["code"],
+            "subject_types_supported": ["public"],
+            "id_token_signing_alg_values_supported": ["RS256"],
+        }, {}
+
+    def jwks(self, request):
+        return 200, {"keys": [public_jwk(self.private_key, self.key_id)]}, {}
+
+    def claims(self, sub):
+        return {
+            "sub": sub,
+            "preferred_username": sub,
+            "email": f"{sub}@example.com",
+            "email_verified": True,
+            "name": f"Mock {sub}",
+            "given_name": "Mock",
+            "family_name": sub,
+        }
+
+    def authorize(self, request):
+        """Log in the next mock user without any form and go back to the RP"""
+        params = request["query"]
+        code = uuid.uuid4().hex
+        sub = f"mock-user-{next(self._subjects) % self.users}"
+        with self._lock:
+            self._codes[code] = {"sub": sub, "nonce": params.get("nonce")}
+        query = {"code": code}
+        if params.get("state"):
+            query["state"] = params["state"]
+        location = f"{params.get('redirect_uri', '/')}?{urlencode(query)}"
+        return 302, None, {"Location": location}
+
+    def token(self, request):
+        params = request["form"]
+        with self._lock:
+            grant = self._codes.pop(params.get("code"), None)
+        if grant is None:
+            return 400, {"error": "invalid_grant"}, {}
+        now = int(time.time())
+        claims = dict(self.claims(grant["sub"]), iss=self.url, aud=self.client_id,
+                      iat=now, exp=now + 3600, auth_time=now)
+        if grant["nonce"]:
+            claims["nonce"] = grant["nonce"]
+        access_token = uuid.uuid4().hex
+        with self._lock:
+            self._tokens[access_token] = grant["sub"]
+        return 200, {
+            "access_token": access_token,
+            "token_type": "Bearer",
+            "expires_in": 3600,
+            "id_token": sign_rs256(claims, self.private_key, self.key_id),
+        }, {}
+
+    def userinfo(self, request):
+        token = request["headers"].get("authorization", "")[len("Bearer "):]
+        with self._lock:
+            sub = self._tokens.get(token)
+        if sub is None:
+            return 401, {"error": "invalid_token"}, {}
+        return 200, self.claims(sub), {}
+
+    def _handler(self):
+        provider = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are written separately: without this, Nagle and
+            # delayed ACKs add ~40ms to every keep-alive response
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                provider.handle(self)
+
+            def do_POST(self):
+                provider.handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def handle(self, handler):
+        start = time.perf_counter()
+        parts = urlsplit(handler.path)
+        length = int(handler.headers.get("Content-Length") or 0)
+        body = handler.rfile.read(length).decode("utf-8") if length else ""
+        request = {
+            "query": {k: v[0] for k, v in parse_qs(parts.query).items()},
+            "form": {k: v[0] for k, v in parse_qs(body).items()},
+            "headers": {k.lower(): v for k, v in handler.headers.items()},
+        }
+        name, route = self.routes().get(parts.path, (parts.path, None))
+        self.hits[parts.path] += 1
+        delay = self.latency + self.latencies.get(name, 0.0)
+        if delay:
+            time.sleep(delay)
+        if route is None:
+            status, payload, headers = 404, {"error": "not_found"}, {}
+        else:
+            status, payload, headers = route(request)
+        self.respond(handler, status, payload, headers)
+        with self._lock:
+            self.timings[name].append(time.perf_counter() - start)
+
+    def respond(self, handler, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        handler.send_response(status)
+        if payload is not None:
+            handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        try:
+            handler.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up waiting, e.g. on its read timeout
+            pass
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in OIDC provider")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--issuer", help="Public URL, as the LMS and browsers reach it")
+    parser.add_argument("--client-id", default="lms")
+    parser.add_argument("--client-secret", default="secret")
+    parser.add_argument("--users", type=int, default=1000, help="Distinct mock users")
+    parser.add_argument("--key-file", help="PEM file of the signing key, created if missing")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    for name in ("authorize", "token", "userinfo", "jwks", "discovery"):
+        parser.add_argument(f"--{name}-latency", type=float, default=0.0,
+                            help=f"Seconds added to {name} responses")
+    return parser.parse_args(argv)
+
+
+def from_args(args):
+    return MockOIDCProvider(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        issuer=args.issuer,
+        client_id=args.client_id,
+        client_secret=args.client_secret,
+        users=args.users,
+        key_file=args.key_file,
+        latencies={
+            name: getattr(args, f"{name}_latency")
+            for name in ("authorize", "token", "userinfo", "jwks", "discovery")
+        },
+    )
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    provider = from_args(args)
+    print(f"Mock OIDC provider at {provider.url} (client {args.client_id})")
+    provider.server.serve_forever()
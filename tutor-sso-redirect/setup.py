@@ -43,7 +43,10 @@ setup(
     entry_points={
         "tutor.plugin.v1": [
             "sso-redirect = tutorssoredirect.plugin"
-        ]
+        ],
+        "console_scripts": [
+            "sso-redirect-diagnose = tutorssoredirect.diagnostics:main"
+        ],
     },
     classifiers=[
         "Development Status :: 4 - Beta",
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Stress the username steps of the SSO pipeline with concurrent signups
+Runs social_core get_username + create_user, then the plugin's
+get_sso_username + create_sso_user, from parallel workers signing up users
+who share a few usernames, and reports failed signups and auth_user queries
+per signup. Created users are deleted at the end.
+Run this inside the LMS container
+
+    python /openedx/stress_usernames.py --workers 16 --signups 50
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+import uuid
+import django
+
+# Set up Django environment
+sys.path.append('/openedx/edx-platform')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lms.envs.tutor.production')
+django.setup()
+
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from social_core.pipeline.user import create_user, get_username
+from social_django.utils import load_backend, load_strategy
+
+from lms.djangoapps.sso_redirect.instrumentation import count_queries
+from lms.djangoapps.sso_redirect.pipeline import create_sso_user, get_sso_username
+
+User = get_user_model()
+
+STEPS = [
+    ("social_core get_username + create_user", get_username, create_user),
+    ("sso get_sso_username + create_sso_user", get_sso_username, create_sso_user),
+]
+
+
+def signup(get_step, create_step, details, uid):
+    strategy = load_strategy()
+    backend = load_backend(strategy, 'oidc', redirect_uri=None)
+    kwargs = {'strategy': strategy, 'backend': backend, 'details': details, 'uid': uid}
+    kwargs.update(get_step(**kwargs) or {})
+    return create_step(**kwargs)['user']
+
+
+def run(name, get_step, create_step, args, prefix):
+    barrier = threading.Barrier(args.workers)
+    results = []
+    lock = threading.Lock()
+
+    def worker(index):
+        for i in range(args.signups):
+            uid = f"{prefix}-{index}-{i}-{uuid.uuid4().hex[:8]}"
+            # Every round, all workers sign up users sharing --names usernames
+            details = {
+                'username': f"{prefix}{i % args.names}",
+                'email': f"{uid}@example.com",
+                'first_name': 'Stress',
+                'last_name': 'Test',
+            }
+            barrier.wait()
+            error = None
+            with count_queries() as counter:
+                try:
+                    user = signup(get_step, create_step, details, uid)
+                except Exception as e:
+                    user, error = None, e.__class__.__name__
+            user_queries = sum(1 for sql in counter.queries if 'auth_user' in sql)
+            with lock:
+                results.append((user.username if user else None, error, user_queries))
+        connection.close()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    errors = Counter(error for _username, error, _queries in results if error)
+    usernames = [username for username, _error, _queries in results if username]
+    queries = sorted(q for _username, _error, q in results)
+    print(f"\n{name}")
+    print(f"  signups:            {len(results)} in {elapsed:.2f}s")
+    print(f"  failed:             {sum(errors.values())} {dict(errors) if errors else ''}")
+    print(f"  shared accounts:    {len(usernames) - len(set(usernames))}")
+    print(f"  auth_user queries:  mean {sum(queries) / len(queries):.2f}, max {queries[-1]}")
+    return sum(errors.values())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--signups", type=int, default=50, help="Per worker")
+    parser.add_argument("--names", type=int, default=5, help="Distinct usernames signed up")
+    args = parser.parse_args(argv)
+
+    print("Concurrent SSO signups")
+    print("=" * 70)
+    print(f"{args.workers} workers x {args.signups} signups, {args.names} shared usernames")
+    failed = 0
+    for index, (name, get_step, create_step) in enumerate(STEPS):
+        prefix = f"stress{uuid.uuid4().hex[:6]}"
+        try:
+            failed = run(name, get_step, create_step, args, prefix)
+        finally:
+            User.objects.filter(username__startswith=prefix).delete()
+
+    print("\n" + "=" * 70)
+    if failed:
+        print("✗ Concurrent signups failed with the plugin's username steps")
+        return 1
+    print("✓ Every concurrent signup got its own account")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Break down the slowest logins from SSO_PIPELINE_TRACE records
+Reads LMS logs, finds the JSON trace records of the tracing logger, groups
+them by trace ID and prints the slowest logins with their IdP calls and
+pipeline steps
+
+    tutor local logs --tail 100000 lms | python trace_report.py --top 10
+"""
+import argparse
+import json
+import sys
+from collections import defaultdict
+
+
+def parse(lines):
+    """Return {trace_id: [record]} from log lines"""
+    traces = defaultdict(list)
+    for line in lines:
+        start = line.find('{"')
+        if start < 0 or '"trace_id"' not in line:
+            continue
+        try:
+            record = json.loads(line[start:])
+        except ValueError:
+            continue
+        if record.get("trace_id"):
+            traces[record["trace_id"]].append(record)
+    return traces
+
+
+def summary(records):
+    records = sorted(records, key=lambda r: r.get("ts", 0))
+    pipeline = [r for r in records if r["event"] == "pipeline"]
+    idp = sum(r["duration_ms"] for r in records if r["event"] == "idp_call")
+    total = sum(r["duration_ms"] for r in pipeline) + idp
+    return {"total_ms": round(total, 3), "idp_ms": round(idp, 3), "records": records}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("files", nargs="*", help="Log files (default: stdin)")
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--trace", help="Only this trace ID")
+    args = parser.parse_args(argv)
+
+    lines = []
+    for name in args.files or ["-"]:
+        stream = sys.stdin if name == "-" else open(name)
+        lines.extend(stream)
+    traces = parse(lines)
+    if args.trace:
+        traces = {args.trace: traces.get(args.trace, [])}
+
+    summaries = sorted(
+        ((trace_id, summary(records)) for trace_id, records in traces.items()),
+        key=lambda item: item[1]["total_ms"],
+        reverse=True,
+    )
+    print(f"{len(traces)} traced logins")
+    for trace_id, info in summaries[:args.top]:
+        print(f"\n{trace_id}  {info['total_ms']:.1f}ms (IdP {info['idp_ms']:.1f}ms)")
+        for record in info["records"]:
+            event = record["event"]
+            if event == "idp_call":
+                print(f"    idp {record['call']:<44} {record['duration_ms']:>10.1f}ms")
+            elif event == "pipeline_step":
+                error = f"  {record['error']}" if record.get("error") else ""
+                print(f"    {record['step']:<48} {record['duration_ms']:>10.1f}ms"
+                      f" {record['queries']:>4} queries{error}")
+            elif event == "pipeline":
+                print(f"    = pipeline {record['outcome']:<37} {record['duration_ms']:>10.1f}ms"
+                      f" {record['queries']:>4} queries")
+            else:
+                print(f"    {event} {record.get('path', '')}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,358 @@
+"""
+Concurrent diagnostics for the SSO redirect flow
+
+Traces the redirect chains of the auth routes of many LMS/MFE hosts in
+parallel and prints a JSON report with every hop and its latency. Requests go
+through a small asyncio HTTP/1.1 client that keeps connections alive and
+reuses them per host, so checking a fleet does not pay one TCP (and TLS)
+handshake per hop.
+
+    sso-redirect-diagnose http://lms.example.com http://apps.example.com:1999
+"""
+import argparse
+import asyncio
+import json
+import ssl
+import statistics
+import sys
+import time
+from urllib.parse import urljoin, urlsplit
+
+# Routes that should all end up at SSO
+DEFAULT_ROUTES = [
+    "/login",
+    "/register",
+    "/signin",
+    "/signup",
+    "/authn/login",
+    "/authn/register",
+    "/authn/logistration",
+    "/create_account",
+    "/user_api/v1/account/login_session/",
+]
+
+# A chain has reached SSO once a URL contains one of these. In direct mode the
+# LMS redirects straight to the IdP authorize endpoint.
+DEFAULT_EXPECT = ("/auth/login/oidc/", "/oauth/v2/authorize")
+
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+
+class Response(object):
+
+    def __init__(self, status, headers, body, latency, reused):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.latency = latency
+        self.reused = reused
+
+    def header(self, name, default=None):
+        return self.headers.get(name.lower(), default)
+
+    @property
+    def cookies(self):
+        cookies = {}
+        for value in self.headers.get("set-cookie-all", []):
+            pair = value.split(";", 1)[0]
+            if "=" in pair:
+                name, value = pair.split("=", 1)
+                cookies[name.strip()] = value.strip()
+        return cookies
+
+
+class HTTPClient(object):
+    '''Minimal asyncio HTTP/1.1 client with per-host keep-alive pools'''
+
+    def __init__(self, connections_per_host=10, timeout=10.0, verify=True):
+        self.connections_per_host = connections_per_host
+        self.timeout = timeout
+        self.ssl_context = ssl.create_default_context()
+        if not verify:
+            self.ssl_context.check_hostname = False
+            self.ssl_context.verify_mode = ssl.CERT_NONE
+        self._idle = {}
+        self._limits = {}
+        self.opened = 0
+
+    def _origin(self, parts):
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        return parts.scheme, parts.hostname, port
+
+    async def _connect(self, origin):
+        scheme, host, port = origin
+        self.opened += 1
+        return await asyncio.open_connection(
+            host, port, ssl=self.ssl_context if scheme == "https" else None
+        )
+
+    async def request(self, method, url, headers=None):
+        parts = urlsplit(url)
+        origin = self._origin(parts)
+        limit = self._limits.setdefault(origin, asyncio.Semaphore(self.connections_per_host))
+        async with limit:
+            idle = self._idle.setdefault(origin, [])
+            connection, reused = (idle.pop(), True) if idle else (None, False)
+            try:
+                return await asyncio.wait_for(
+                    self._exchange(origin, connection, method, parts, headers, reused),
+                    self.timeout,
+                )
+            except (ConnectionError, asyncio.IncompleteReadError):
+                if not reused:
+                    raise
+                # The server closed the idle connection, retry on a new one
+                return await asyncio.wait_for(
+                    self._exchange(origin, None, method, parts, headers, False),
+                    self.timeout,
+                )
+
+    async def _exchange(self, origin, connection, method, parts, headers, reused):
+        start = time.perf_counter()
+        if connection is None:
+            connection = await self._connect(origin)
+        try:
+            status, response_headers, body, keep_alive = await self._roundtrip(
+                connection, method, parts, headers
+            )
+        except BaseException:
+            connection[1].close()
+            raise
+        if keep_alive:
+            self._idle[origin].append(connection)
+        else:
+            connection[1].close()
+        latency = time.perf_counter() - start
+        return Response(status, response_headers, body, latency, reused)
+
+    async def _roundtrip(self, connection, method, parts, headers):
+        reader, writer = connection
+        target = parts.path or "/"
+        if parts.query:
+            target += "?" + parts.query
+        lines = [f"{method} {target} HTTP/1.1", f"Host: {parts.netloc}"]
+        for name, value in (headers or {}).items():
+            lines.append(f"{name}: {value}")
+        lines.append("Connection: keep-alive")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("connection closed by server")
+        status = int(status_line.split()[1])
+        response_headers = {"set-cookie-all": []}
+        while True:
+            line = (await reader.readline()).decode("latin-1").rstrip("\r\n")
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            name, value = name.strip().lower(), value.strip()
+            if name == "set-cookie":
+                response_headers["set-cookie-all"].append(value)
+            response_headers[name] = value
+
+        keep_alive = response_headers.get("connection", "").lower() != "close"
+        if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+            body = b""
+        elif response_headers.get("transfer-encoding", "").lower() == "chunked":
+            body = await self._read_chunked(reader)
+        elif "content-length" in response_headers:
+            body = await reader.readexactly(int(response_headers["content-length"]))
+        else:
+            body = await reader.read()
+            keep_alive = False
+        return status, response_headers, body, keep_alive
+
+    @staticmethod
+    async def _read_chunked(reader):
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b";")[0].strip(), 16)
+            if size == 0:
+                # Trailers end with an empty line
+                while (await reader.readline()).strip():
+                    pass
+                return b"".join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+
+    async def close(self):
+        for connections in self._idle.values():
+            for _reader, writer in connections:
+                writer.close()
+        self._idle.clear()
+
+
+def matches(url, expect):
+    if isinstance(expect, str):
+        expect = (expect,)
+    return any(marker in url for marker in expect or ())
+
+
+async def trace(client, url, max_redirects=10, expect=DEFAULT_EXPECT):
+    """Follow the redirect chain from url and describe every hop"""
+    result = {
+        "url": url,
+        "hops": [],
+        "final_url": url,
+        "final_status": None,
+        "redirects": 0,
+        "loop": False,
+        "reached_sso": False,
+        "hops_to_sso": None,
+        "error": None,
+    }
+    cookies = {}
+    visited = set()
+    current = url
+    start = time.perf_counter()
+    try:
+        while True:
+            host = urlsplit(current).netloc
+            jar = cookies.setdefault(host, {})
+            headers = {"User-Agent": "sso-redirect-diagnose"}
+            if jar:
+                headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in jar.items())
+            response = await client.request("GET", current, headers)
+            jar.update(response.cookies)
+            visited.add(current)
+            location = response.header("location")
+            hop = {
+                "url": current,
+                "status": response.status,
+                "latency_ms": round(response.latency * 1000, 2),
+                "reused_connection": response.reused,
+            }
+            if location is not None:
+                location = urljoin(current, location)
+                hop["location"] = location
+            result["hops"].append(hop)
+            result["final_url"] = current
+            result["final_status"] = response.status
+            if not result["reached_sso"] and matches(current, expect):
+                result["reached_sso"] = True
+                result["hops_to_sso"] = len(result["hops"]) - 1
+            if response.status not in REDIRECT_STATUSES or location is None:
+                break
+            if not result["reached_sso"] and matches(location, expect):
+                # Requests the browser made before it is sent to SSO
+                result["reached_sso"] = True
+                result["hops_to_sso"] = len(result["hops"])
+            if location in visited:
+                result["loop"] = True
+                break
+            if result["redirects"] >= max_redirects:
+                result["error"] = f"more than {max_redirects} redirects"
+                break
+            result["redirects"] += 1
+            current = location
+    except Exception as e:  # Reported per check, the other checks go on
+        result["error"] = f"{e.__class__.__name__}: {e}"
+    result["total_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return result
+
+
+async def run_checks(hosts, routes, concurrency=20, connections_per_host=None,
+                     timeout=10.0, max_redirects=10, expect=DEFAULT_EXPECT, verify=True):
+    """Trace every route of every host, at most `concurrency` at a time"""
+    if isinstance(expect, str):
+        expect = (expect,)
+    client = HTTPClient(
+        connections_per_host=connections_per_host or concurrency,
+        timeout=timeout,
+        verify=verify,
+    )
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def check(host, route):
+        async with semaphore:
+            result = await trace(client, host.rstrip("/") + route, max_redirects, expect)
+        result["host"] = host
+        result["route"] = route
+        return result
+
+    start = time.perf_counter()
+    try:
+        checks = await asyncio.gather(*[check(h, r) for h in hosts for r in routes])
+    finally:
+        await client.close()
+    elapsed = time.perf_counter() - start
+    hops_to_sso = sorted(c["hops_to_sso"] for c in checks if c["hops_to_sso"] is not None)
+    return {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "expect": list(expect),
+        "concurrency": concurrency,
+        "checks": list(checks),
+        "summary": {
+            "checks": len(checks),
+            "reached_sso": sum(1 for c in checks if c["reached_sso"]),
+            "loops": sum(1 for c in checks if c["loop"]),
+            "errors": sum(1 for c in checks if c["error"]),
+            "requests": sum(len(c["hops"]) for c in checks),
+            "max_hops_to_sso": hops_to_sso[-1] if hops_to_sso else None,
+            "median_hops_to_sso": statistics.median(hops_to_sso) if hops_to_sso else None,
+            "connections_opened": client.opened,
+            "elapsed_ms": round(elapsed * 1000, 2),
+        },
+    }
+
+
+def failed(check):
+    return bool(check["error"] or check["loop"] or not check["reached_sso"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="sso-redirect-diagnose",
+        description="Trace the SSO redirect chains of LMS/MFE hosts in parallel",
+    )
+    parser.add_argument("hosts", nargs="+", help="Base URLs, e.g. http://localhost:8000")
+    parser.add_argument(
+        "-r", "--route", action="append", dest="routes",
+        help="Route to check on every host, repeatable (default: the auth routes)",
+    )
+    parser.add_argument("-c", "--concurrency", type=int, default=20)
+    parser.add_argument("--connections-per-host", type=int, default=None)
+    parser.add_argument("--timeout", type=float, default=10.0, help="Seconds per request")
+    parser.add_argument("--max-redirects", type=int, default=10)
+    parser.add_argument(
+        "--expect", action="append",
+        help="Substring of the URL every chain should reach, repeatable "
+             "(default: {})".format(", ".join(DEFAULT_EXPECT)),
+    )
+    parser.add_argument("--insecure", action="store_true", help="Skip TLS verification")
+    parser.add_argument("-o", "--output", help="Write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_checks(
+        args.hosts,
+        args.routes or DEFAULT_ROUTES,
+        concurrency=args.concurrency,
+        connections_per_host=args.connections_per_host,
+        timeout=args.timeout,
+        max_redirects=args.max_redirects,
+        expect=args.expect or DEFAULT_EXPECT,
+        verify=not args.insecure,
+    ))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    failures = [check for check in report["checks"] if failed(check)]
+    for check in failures:
+        if check["error"]:
+            reason = check["error"]
+        elif check["loop"]:
+            reason = "redirect loop"
+        else:
+            reason = "never reached {}".format(" or ".join(report["expect"]))
+        print(f"✗ {check['url']}: {reason}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,13 +2,15 @@
 Tutor plugin for SSO redirect
 Disables Open edX login/register and redirects all auth to SSO
 """
-from glob import glob
-import os
-import pkg_resources
+import shlex
 
+import click
 from tutor import hooks
 
 from .__about__ import __version__
+from .runtime import patch_files, runtime_patch
+from .sso_redirect import classifier
+from .sso_redirect.sites import SiteRouter
 
 # Configuration
 hooks.Filters.CONFIG_DEFAULTS.add_items([
@@ -17,15 +19,141 @@ hooks.Filters.CONFIG_DEFAULTS.add_items([
     ("SSO_OIDC_KEY", ""),
     ("SSO_OIDC_SECRET", ""),
     ("SSO_OIDC_ENDPOINT", ""),
+    # Redirect middleware: off by default so the MFE flow keeps working
+    ("SSO_REDIRECT_MIDDLEWARE", False),
+    ("SSO_REDIRECT_AUTH_PATTERNS", list(classifier.DEFAULT_AUTH_PATTERNS)),
+    ("SSO_REDIRECT_SKIP_PATTERNS", list(classifier.DEFAULT_SKIP_PATTERNS)),
+    ("SSO_REDIRECT_EXACT_PATHS", list(classifier.DEFAULT_EXACT_PATHS)),
+    ("SSO_REDIRECT_CLASSIFY_FIRST", True),
+    ("SSO_REDIRECT_QUERY_HOOK", ""),
+    # "mfe" sends /login to the authn MFE with tpa_hint, "direct" starts the
+    # OIDC login server-side and redirects straight to the IdP
+    ("SSO_REDIRECT_MODE", "mfe"),
+    ("SSO_AUTHN_MFE_URL", "http://91.107.146.137:1999/authn"),
+    ("SSO_ALLOWED_ORIGINS", [
+        "http://91.107.146.137:8000",
+        "http://91.107.146.137:8001",
+        "http://91.107.146.137:1999",
+    ]),
+    # Authn MFE settings, served by the LMS MFE config API instead of being
+    # built into the MFE image, and cached this many seconds
+    ("SSO_MFE_CONFIG", {
+        "LOGIN_ISSUE_SUPPORT_LINK": "",
+        "DISABLE_ENTERPRISE_LOGIN": True,
+        "ENABLE_PROGRESSIVE_PROFILING_ON_AUTHN": False,
+        "INFO_EMAIL": "",
+        "AUTHN_MINIMAL_HEADER": True,
+        "SHOW_CONFIGURABLE_EDX_FIELDS": False,
+        "MARKETING_EMAILS_OPT_IN": False,
+    }),
+    ("SSO_MFE_CONFIG_CACHE_TIMEOUT", 300),
+    # Per-host routing: {"host": {"mfe_url", "provider", "backend", "mode",
+    # "login_url", "origins"}}, unset keys are those of the settings above
+    ("SSO_SITES", {}),
+    # Answer the legacy login URLs in Caddy, the LMS view stays as a fallback
+    ("SSO_CADDY_REDIRECTS", True),
+    ("SSO_CADDY_CACHE_CONTROL", "no-store"),
+    # OIDC backend, discovery document and JWKS cache (TTL 0 disables it)
+    ("SSO_OIDC_BACKEND", "lms.djangoapps.sso_redirect.backends.SSOOpenIdConnectAuth"),
+    ("SSO_OIDC_CACHE_ALIAS", "default"),
+    ("SSO_OIDC_CACHE_TTL", 3600),
+    ("SSO_OIDC_CACHE_STALE_TTL", 86400),
+    # User details from the validated ID token, userinfo is only called when
+    # one of the required claims is missing from it
+    ("SSO_OIDC_CLAIMS_FROM_ID_TOKEN", True),
+    ("SSO_OIDC_REQUIRED_CLAIMS", ["preferred_username", "email", "name"]),
+    # Calls to the IdP: keep-alive pool per worker, timeouts in seconds,
+    # retries with exponential backoff plus up to SSO_IDP_RETRY_JITTER
+    ("SSO_IDP_POOLED", True),
+    ("SSO_IDP_POOL_SIZE", 10),
+    ("SSO_IDP_CONNECT_TIMEOUT", 3.05),
+    ("SSO_IDP_READ_TIMEOUT", 10),
+    ("SSO_IDP_RETRIES", 2),
+    ("SSO_IDP_RETRY_BACKOFF", 0.2),
+    ("SSO_IDP_RETRY_JITTER", 0.2),
+    # IdP circuit breaker: opens when, over SSO_BREAKER_MIN_CALLS calls or
+    # more in the last SSO_BREAKER_WINDOW seconds, the share of failed calls
+    # or of calls slower than SSO_BREAKER_SLOW_CALL seconds reaches its rate.
+    # Logins then fail fast to SSO_LOGIN_ERROR_URL for SSO_BREAKER_OPEN_SECONDS,
+    # before SSO_BREAKER_PROBES probe calls in a row may close it
+    ("SSO_BREAKER_ENABLED", True),
+    ("SSO_BREAKER_WINDOW", 30),
+    ("SSO_BREAKER_MIN_CALLS", 10),
+    ("SSO_BREAKER_ERROR_RATE", 0.5),
+    ("SSO_BREAKER_SLOW_CALL", 2.0),
+    ("SSO_BREAKER_SLOW_RATE", 0.5),
+    ("SSO_BREAKER_OPEN_SECONDS", 30),
+    ("SSO_BREAKER_PROBES", 3),
+    ("SSO_LOGIN_ERROR_URL", "/"),
+    # Admission control: at most SSO_ADMISSION_LIMIT /auth/complete/
+    # requests at a time across the LMS workers. Others wait up to
+    # SSO_ADMISSION_QUEUE_SECONDS for a slot, then get a 503 page that
+    # reloads itself after SSO_ADMISSION_RETRY_AFTER seconds
+    ("SSO_ADMISSION_ENABLED", True),
+    ("SSO_ADMISSION_LIMIT", 20),
+    ("SSO_ADMISSION_QUEUE_SECONDS", 2.0),
+    ("SSO_ADMISSION_RETRY_AFTER", 5),
+    # Seconds before the slot of a killed worker is freed; 0 derives it from
+    # the IdP timeouts and retries, so that it outlasts the longest callback
+    ("SSO_ADMISSION_LEASE", 0),
+    # Seconds between the background IdP checks behind /sso/ready
+    ("SSO_READY_INTERVAL", 10),
+    # Session engine, e.g. "lms.djangoapps.sso_redirect.sessions" to only
+    # write sessions when they change (empty keeps the Open edX default)
+    ("SSO_SESSION_ENGINE", ""),
+    ("SSO_SESSION_REFRESH_INTERVAL", 3600),
+    # Index the sessions of SSO logins in UserSocialAuth.extra_data, so that
+    # /sso/backchannel-logout and "tutor local do sso-revoke" find them
+    ("SSO_SESSION_INDEX", True),
+    ("SSO_BACKCHANNEL_LOGOUT", True),
+    # Single write-free pipeline step for returning users
+    ("SSO_PIPELINE_FAST_LOGIN", True),
+    # Usernames derived from the IdP username or email and sub, collisions
+    # resolved with one query and retried on concurrent signups
+    ("SSO_PIPELINE_USERNAMES", True),
+    # Leave the UserProfile of new users, the extra_data refresh and the
+    # SSO_DEFERRED_HOOKS (dotted paths of hook(user, claims, is_new)) to a
+    # Celery task batching the logins of every SSO_DEFERRED_INTERVAL seconds
+    ("SSO_PIPELINE_DEFERRED", False),
+    ("SSO_DEFERRED_INTERVAL", 2),
+    ("SSO_DEFERRED_HOOKS", []),
+    # Log a JSON trace of every login: IdP calls, duration and queries of
+    # each pipeline step, tied together by an ID carried in the OIDC state
+    ("SSO_PIPELINE_TRACE", False),
+    # Logging of the SSO components: "production", "debug", "quiet", or ""
+    # to leave the LMS logging untouched. Levels override the profile's per
+    # logger, sampling and rate limiting only apply to debug records.
+    ("SSO_LOG_PROFILE", "production"),
+    ("SSO_LOG_LEVELS", {}),
+    ("SSO_LOG_SAMPLE_RATE", 1.0),
+    ("SSO_LOG_RATE_LIMIT", 50),
+    ("SSO_LOG_QUEUE_SIZE", 10000),
+    # Metrics of all the workers, scraped at /sso/metrics. Without a token the
+    # endpoint only answers requests that did not come through Caddy.
+    ("SSO_METRICS_ENABLED", True),
+    ("SSO_METRICS_CACHE_ALIAS", "default"),
+    ("SSO_METRICS_FLUSH_INTERVAL", 10),
+    ("SSO_METRICS_TOKEN", ""),
 ])
 
 # LMS common settings patch content
 LMS_COMMON_SETTINGS = """
 # SSO Redirect Plugin Settings
 
+# SSO sites, compiled once into a host-keyed table
+SSO_DEFAULT_SITE = {
+    'mfe_url': '{{ SSO_AUTHN_MFE_URL }}',
+    'mode': '{{ SSO_REDIRECT_MODE }}',
+    'login_url': '{{ SSO_REDIRECT_URL }}',
+    'origins': {{ SSO_ALLOWED_ORIGINS }},
+}
+SSO_SITES = {{ SSO_SITES }}
+from lms.djangoapps.sso_redirect import sites as _sso_sites
+_sso_router = _sso_sites.SiteRouter.from_config(SSO_SITES, SSO_DEFAULT_SITE)
+
 # Enable MFE
-AUTHN_MICROFRONTEND_URL = "http://91.107.146.137:1999/authn"
-AUTHN_MICROFRONTEND_DOMAIN = "91.107.146.137:1999"
+AUTHN_MICROFRONTEND_URL = _sso_router.default.mfe_url
+AUTHN_MICROFRONTEND_DOMAIN = _sso_router.default.mfe_domain
 ENABLE_AUTHN_MICROFRONTEND = True
 FEATURES['ENABLE_AUTHN_MICROFRONTEND'] = True
 
@@ -39,9 +167,41 @@ SOCIAL_AUTH_OIDC_OIDC_ENDPOINT = '{{ SSO_OIDC_ENDPOINT }}'
 SOCIAL_AUTH_OIDC_KEY = '{{ SSO_OIDC_KEY }}'
 SOCIAL_AUTH_OIDC_SECRET = '{{ SSO_OIDC_SECRET }}'
 
+# Discovery document and JWKS, shared by all workers through the cache
+SSO_OIDC_CACHE_ALIAS = '{{ SSO_OIDC_CACHE_ALIAS }}'
+SSO_OIDC_CACHE_TTL = {{ SSO_OIDC_CACHE_TTL }}
+SSO_OIDC_CACHE_STALE_TTL = {{ SSO_OIDC_CACHE_STALE_TTL }}
+
+# User details from the ID token claims, userinfo only as a fallback
+SSO_OIDC_CLAIMS_FROM_ID_TOKEN = {{ SSO_OIDC_CLAIMS_FROM_ID_TOKEN }}
+SSO_OIDC_REQUIRED_CLAIMS = {{ SSO_OIDC_REQUIRED_CLAIMS }}
+
+# Calls to the IdP, through a keep-alive pool per worker
+SSO_IDP_POOLED = {{ SSO_IDP_POOLED }}
+SSO_IDP_POOL_SIZE = {{ SSO_IDP_POOL_SIZE }}
+SSO_IDP_CONNECT_TIMEOUT = {{ SSO_IDP_CONNECT_TIMEOUT }}
+SSO_IDP_READ_TIMEOUT = {{ SSO_IDP_READ_TIMEOUT }}
+SSO_IDP_RETRIES = {{ SSO_IDP_RETRIES }}
+SSO_IDP_RETRY_BACKOFF = {{ SSO_IDP_RETRY_BACKOFF }}
+SSO_IDP_RETRY_JITTER = {{ SSO_IDP_RETRY_JITTER }}
+
+# Circuit breaker around the IdP calls, shared by the workers through the cache
+SSO_BREAKER_ENABLED = {{ SSO_BREAKER_ENABLED }}
+SSO_BREAKER_WINDOW = {{ SSO_BREAKER_WINDOW }}
+SSO_BREAKER_MIN_CALLS = {{ SSO_BREAKER_MIN_CALLS }}
+SSO_BREAKER_ERROR_RATE = {{ SSO_BREAKER_ERROR_RATE }}
+SSO_BREAKER_SLOW_CALL = {{ SSO_BREAKER_SLOW_CALL }}
+SSO_BREAKER_SLOW_RATE = {{ SSO_BREAKER_SLOW_RATE }}
+SSO_BREAKER_OPEN_SECONDS = {{ SSO_BREAKER_OPEN_SECONDS }}
+SSO_BREAKER_PROBES = {{ SSO_BREAKER_PROBES }}
+SOCIAL_AUTH_LOGIN_ERROR_URL = '{{ SSO_LOGIN_ERROR_URL }}'
+
+# /sso/ready, answered from a snapshot refreshed in the background
+SSO_READY_INTERVAL = {{ SSO_READY_INTERVAL }}
+
 # Authentication backends
 AUTHENTICATION_BACKENDS = (
-    'social_core.backends.open_id_connect.OpenIdConnectAuth',
+    '{{ SSO_OIDC_BACKEND }}',
     'django.contrib.auth.backends.ModelBackend',
 )
 
@@ -50,7 +210,7 @@ SOCIAL_AUTH_STRATEGY = 'social_django.strategy.DjangoStrategy'
 SOCIAL_AUTH_STORAGE = 'social_django.models.DjangoStorage'
 
 # Backend configuration
-THIRD_PARTY_AUTH_BACKENDS = ['social_core.backends.open_id_connect.OpenIdConnectAuth']
+THIRD_PARTY_AUTH_BACKENDS = ['{{ SSO_OIDC_BACKEND }}']
 
 # Pipeline
 SOCIAL_AUTH_PIPELINE = (
@@ -58,17 +218,45 @@ SOCIAL_AUTH_PIPELINE = (
     'social_core.pipeline.social_auth.social_uid',
     'social_core.pipeline.social_auth.auth_allowed',
     'social_core.pipeline.social_auth.social_user',
+{% if SSO_PIPELINE_USERNAMES %}
+    'lms.djangoapps.sso_redirect.pipeline.get_sso_username',
+    'lms.djangoapps.sso_redirect.pipeline.create_sso_user',
+{% else %}
     'social_core.pipeline.user.get_username',
     'social_core.pipeline.user.create_user',
+{% endif %}
     'social_core.pipeline.social_auth.associate_user',
+{% if SSO_PIPELINE_DEFERRED %}
+    'lms.djangoapps.sso_redirect.pipeline.defer_sso_login_work',
+{% else %}
     'social_core.pipeline.social_auth.load_extra_data',
+{% endif %}
+{% if SSO_PIPELINE_FAST_LOGIN %}
+    'lms.djangoapps.sso_redirect.pipeline.login_sso_user',
+{% else %}
     'social_core.pipeline.user.user_details',
     'social_django.pipeline.login_user',
+{% endif %}
 )
 
+# Deferred login work, batched through the LMS Celery workers
+SSO_DEFERRED_INTERVAL = {{ SSO_DEFERRED_INTERVAL }}
+SSO_DEFERRED_HOOKS = {{ SSO_DEFERRED_HOOKS }}
+
+# JSON trace of every login on the lms.djangoapps.sso_redirect.tracing logger
+SSO_PIPELINE_TRACE = {{ SSO_PIPELINE_TRACE }}
+
 # Session settings
 SESSION_SAVE_EVERY_REQUEST = True
 SESSION_COOKIE_SAMESITE = 'Lax'
+{% if SSO_SESSION_ENGINE %}
+SESSION_ENGINE = '{{ SSO_SESSION_ENGINE }}'
+{% endif %}
+# Unchanged sessions are written at most once per interval
+SSO_SESSION_REFRESH_INTERVAL = {{ SSO_SESSION_REFRESH_INTERVAL }}
+# Sessions indexed by user for back-channel logout and revocation
+SSO_SESSION_INDEX = {{ SSO_SESSION_INDEX }}
+SSO_BACKCHANNEL_LOGOUT = {{ SSO_BACKCHANNEL_LOGOUT }}
 
 # Login URLs
 LOGIN_URL = '/login'
@@ -77,58 +265,189 @@ SOCIAL_AUTH_LOGIN_REDIRECT_URL = '/dashboard'
 
 # CORS
 CORS_ALLOW_CREDENTIALS = True
-CORS_ALLOWED_ORIGINS = [
-    "http://91.107.146.137:8000",
-    "http://91.107.146.137:8001",
-    "http://91.107.146.137:1999",
-]
+CORS_ALLOWED_ORIGINS = _sso_router.origins()
+CSRF_TRUSTED_ORIGINS = _sso_router.origins(CSRF_TRUSTED_ORIGINS)
+SOCIAL_AUTH_ALLOWED_REDIRECT_HOSTS = _sso_router.hosts()
 
 # User creation
 SOCIAL_AUTH_AUTO_CREATE_USERS = True
 FEATURES['SKIP_EMAIL_VERIFICATION'] = True
+
+# Logging: SSO loggers go through a non-blocking queue handler
+from lms.djangoapps.sso_redirect.logs import configure_logging as _sso_configure_logging
+LOGGING = _sso_configure_logging(
+    LOGGING,
+    '{{ SSO_LOG_PROFILE }}',
+    levels={{ SSO_LOG_LEVELS }},
+    sample_rate={{ SSO_LOG_SAMPLE_RATE }},
+    rate_limit={{ SSO_LOG_RATE_LIMIT }},
+    queue_size={{ SSO_LOG_QUEUE_SIZE }},
+)
+
+# Admission control of the social auth callbacks, slots shared in the cache
+SSO_ADMISSION_LIMIT = {{ SSO_ADMISSION_LIMIT }}
+SSO_ADMISSION_QUEUE_SECONDS = {{ SSO_ADMISSION_QUEUE_SECONDS }}
+SSO_ADMISSION_RETRY_AFTER = {{ SSO_ADMISSION_RETRY_AFTER }}
+SSO_ADMISSION_LEASE = {{ SSO_ADMISSION_LEASE }}
+{% if SSO_ADMISSION_ENABLED %}
+# Before the session and auth middleware: a rejected callback costs no query
+MIDDLEWARE = ['lms.djangoapps.sso_redirect.middleware.SSOAdmissionMiddleware'] + list(MIDDLEWARE)
+{% endif %}
+
+# Metrics, flushed by every worker to the shared cache
+SSO_METRICS_ENABLED = {{ SSO_METRICS_ENABLED }}
+SSO_METRICS_CACHE_ALIAS = '{{ SSO_METRICS_CACHE_ALIAS }}'
+SSO_METRICS_FLUSH_INTERVAL = {{ SSO_METRICS_FLUSH_INTERVAL }}
+SSO_METRICS_TOKEN = '{{ SSO_METRICS_TOKEN }}'
+{% if SSO_METRICS_ENABLED %}
+# First, so that the timings of /auth/ requests include every middleware
+MIDDLEWARE = ['lms.djangoapps.sso_redirect.middleware.SSOMetricsMiddleware'] + list(MIDDLEWARE)
+{% endif %}
+
+# Redirect middleware, patterns are compiled once per worker
+SSO_REDIRECT_ENABLED = {{ SSO_REDIRECT_ENABLED }}
+SSO_REDIRECT_URL = '{{ SSO_REDIRECT_URL }}'
+SSO_REDIRECT_AUTH_PATTERNS = {{ SSO_REDIRECT_AUTH_PATTERNS }}
+SSO_REDIRECT_SKIP_PATTERNS = {{ SSO_REDIRECT_SKIP_PATTERNS }}
+SSO_REDIRECT_EXACT_PATHS = {{ SSO_REDIRECT_EXACT_PATHS }}
+SSO_REDIRECT_CLASSIFY_FIRST = {{ SSO_REDIRECT_CLASSIFY_FIRST }}
+SSO_REDIRECT_QUERY_HOOK = '{{ SSO_REDIRECT_QUERY_HOOK }}'
+SSO_REDIRECT_MODE = '{{ SSO_REDIRECT_MODE }}'
+{% if SSO_REDIRECT_MIDDLEWARE %}
+# Right after AuthenticationMiddleware: request.user exists but stays lazy
+# until the middleware has decided that the path is an auth URL
+MIDDLEWARE = list(MIDDLEWARE)
+MIDDLEWARE.insert(
+    MIDDLEWARE.index('django.contrib.auth.middleware.AuthenticationMiddleware') + 1,
+    'lms.djangoapps.sso_redirect.middleware.SSORedirectMiddleware',
+)
+{% endif %}
 """
 
 # URL redirect patch content
 URL_REDIRECT_PATCH = """
-from django.urls import re_path
-from django.http import HttpResponseRedirect
-from django.conf import settings
-
-def mfe_sso_redirect(request):
-    mfe_url = getattr(settings, 'AUTHN_MICROFRONTEND_URL', 'http://91.107.146.137:1999/authn')
-    next_url = request.GET.get('next', '/dashboard')
-    return HttpResponseRedirect(f"{mfe_url}/login?next={next_url}&tpa_hint=oidc")
-
-auth_redirects = [
-    re_path(r'^login/?$', mfe_sso_redirect),
-    re_path(r'^register/?$', mfe_sso_redirect),
-    re_path(r'^signin/?$', mfe_sso_redirect),
-    re_path(r'^signup/?$', mfe_sso_redirect),
-]
-
-urlpatterns = auth_redirects + urlpatterns
+# One pattern for all the legacy auth URLs, checked with a set lookup
+from lms.djangoapps.sso_redirect import urls as sso_urls
+
+urlpatterns = sso_urls.auth_redirects + urlpatterns + sso_urls.urlpatterns
+"""
+
+# Caddy patch, inside the LMS site block. Same targets as
+# views.mfe_sso_redirect, without reaching uWSGI. In direct mode the begin step
+# needs the session, so the proxy sends the browser to /auth/login/<backend>/.
+CADDY_REDIRECT_PATCH = """
+{% if SSO_CADDY_REDIRECTS %}
+# SSO redirects for the legacy login URLs, to the login target of each host
+map {host} {sso_login_target} {
+{%- for host, target in SSO_SITES|sso_caddy_targets(SSO_AUTHN_MFE_URL, SSO_REDIRECT_MODE, SSO_REDIRECT_URL) %}
+    {{ host }} "{{ target }}"
+{%- endfor %}
+}
+@sso_auth_redirect path /login /login/ /register /register/ /signin /signin/ /signup /signup/
+handle @sso_auth_redirect {
+    header Cache-Control "{{ SSO_CADDY_CACHE_CONTROL }}"
+    redir {sso_login_target}{query} 302
+}
+{% endif %}
+{% if SSO_MFE_CONFIG_CACHE_TIMEOUT %}
+# Same for every user, so shared caches may keep it too
+@sso_mfe_config path /api/mfe_config/v1 /api/mfe_config/v1/
+header @sso_mfe_config {
+    Cache-Control "public, max-age={{ SSO_MFE_CONFIG_CACHE_TIMEOUT }}"
+    defer
+}
+{% endif %}
+"""
+
+
+def sso_caddy_targets(sites, mfe_url, mode, login_url):
+    """(host, redirect target without the query) of every site, default last"""
+    router = SiteRouter.from_config(sites, {'mfe_url': mfe_url, 'mode': mode, 'login_url': login_url})
+    targets = []
+    for site in router.all():
+        if site.mode == "direct":
+            target = "{}?auth_entry=login&".format(site.login_url)
+        else:
+            target = "{}/login?tpa_hint={}&".format(site.mfe_url, site.provider)
+        # Caddy's {host} has no port
+        host = site.host.rsplit(":", 1)[0] if site.host else "default"
+        targets.append((host, target))
+    return targets[1:] + targets[:1]
+
+
+hooks.Filters.ENV_TEMPLATE_FILTERS.add_item(("sso_caddy_targets", sso_caddy_targets))
+
+# Runtime MFE configuration, extends the settings of the tutor-mfe plugin.
+# /api/mfe_config/v1?mfe=authn returns MFE_CONFIG updated with these values,
+# so changing them takes "tutor config save" and an LMS restart, no MFE build.
+MFE_CONFIG_SETTINGS = """
+ENABLE_MFE_CONFIG_API = True
+MFE_CONFIG_API_CACHE_TIMEOUT = {{ SSO_MFE_CONFIG_CACHE_TIMEOUT }}
+MFE_CONFIG_OVERRIDES.setdefault("authn", {}).update({{ SSO_MFE_CONFIG }})
 """
 
 # Add patches
+@hooks.Filters.ENV_PATCHES.add()
+def _add_runtime_patch(patches):
+    # Module sources are read when the environment is rendered, not on import
+    patches.append(("openedx-lms-common-settings", runtime_patch()))
+    return patches
+
+
 hooks.Filters.ENV_PATCHES.add_items([
     ("openedx-lms-common-settings", LMS_COMMON_SETTINGS),
 ])
 
 hooks.Filters.ENV_PATCHES.add_items([
     ("openedx-lms-urls", URL_REDIRECT_PATCH),
+    ("caddyfile-lms", CADDY_REDIRECT_PATCH),
 ])
 
-# MFE environment patches
+# Authn MFE configuration, served at runtime by the LMS MFE config API
 hooks.Filters.ENV_PATCHES.add_items([
-    ("mfe-env-production", """
-LOGIN_ISSUE_SUPPORT_LINK=''
-DISABLE_ENTERPRISE_LOGIN=true
-ENABLE_PROGRESSIVE_PROFILING_ON_AUTHN=false
-"""),
+    ("mfe-lms-common-settings", MFE_CONFIG_SETTINGS),
 ])
 
-# Load additional patches from files
-patches_dir = pkg_resources.resource_filename("tutorssoredirect", "patches")
-for patch_file in glob(os.path.join(patches_dir, "*.yml")):
-    with open(patch_file) as f:
-        hooks.Filters.ENV_PATCHES.add_item((os.path.basename(patch_file)[:-4], f.read()))
\ No newline at end of file
+
+# Bulk pre-provisioning, run in the LMS container by "tutor local do sso-provision"
+@click.command(name="sso-provision", help="Create the SSO users of an exported list ahead of their first login")
+@click.argument("path")
+@click.option("--format", "fmt", type=click.Choice(["json", "csv"]), help="Default: guessed from the content")
+@click.option("--provider", default="oidc", show_default=True)
+@click.option("--chunk-size", type=int, default=500, show_default=True, help="Users per transaction")
+@click.option("--dry-run", is_flag=True, help="Roll every chunk back")
+def sso_provision(path, fmt, provider, chunk_size, dry_run):
+    # path is read inside the LMS job container, see "tutor mounts add"
+    argv = [path, "--provider", provider, "--chunk-size", str(chunk_size)]
+    if fmt:
+        argv += ["--format", fmt]
+    if dry_run:
+        argv.append("--dry-run")
+    script = "from lms.djangoapps.sso_redirect import provisioning; provisioning.main({!r})".format(argv)
+    yield ("lms", "./manage.py lms shell -c {}".format(shlex.quote(script)))
+
+
+hooks.Filters.CLI_DO_COMMANDS.add_item(sso_provision)
+
+
+# Revocation of deprovisioned users, run in the LMS container by "tutor local do sso-revoke"
+@click.command(name="sso-revoke", help="Delete every indexed LMS session of SSO users")
+@click.argument("subs", nargs=-1, required=True)
+@click.option("--provider", default="oidc", show_default=True)
+@click.option("--scan", is_flag=True, help="Also decode every session, for those the index does not cover")
+def sso_revoke(subs, provider, scan):
+    argv = list(subs) + ["--provider", provider]
+    if scan:
+        argv.append("--scan")
+    script = "from lms.djangoapps.sso_redirect import revocation; revocation.main({!r})".format(argv)
+    yield ("lms", "./manage.py lms shell -c {}".format(shlex.quote(script)))
+
+
+hooks.Filters.CLI_DO_COMMANDS.add_item(sso_revoke)
+
+
+# Load additional patches from files, when the environment is rendered
+@hooks.Filters.ENV_PATCHES.add()
+def _add_file_patches(patches):
+    patches.extend(patch_files())
+    return patches
@@ -9,6 +9,7 @@ import pkg_resources
 from tutor import hooks
 
 from .__about__ import __version__
+from .runtime import runtime_patch
 
 ########################################
 # CONFIGURATION
@@ -30,6 +31,7 @@ hooks.Filters.CONFIG_DEFAULTS.add_items([
 
 # Add patches to openedx-lms-common-settings
 hooks.Filters.ENV_PATCHES.add_items([
+    ("openedx-lms-common-settings", runtime_patch()),
     ("openedx-lms-common-settings", r"""# SSO Redirect Plugin Settings - Enable MFE with auto-redirect to SSO
 
 # ENABLE MFE
@@ -302,133 +304,11 @@ JWT_AUTH_COOKIE_SECURE = False  # Set to True for HTTPS
 # Ensure JWT authentication is enabled
 JWT_AUTH_BACKEND = 'django.contrib.auth.backends.ModelBackend'
 
-# Define the SSO redirect middleware inline
-from django.conf import settings
-from django.shortcuts import redirect
-from django.utils.deprecation import MiddlewareMixin
-from django.http import HttpResponsePermanentRedirect
-import logging
-
-logger = logging.getLogger(__name__)
-
-class SSORedirectMiddleware(MiddlewareMixin):
-    '''Middleware to redirect authentication requests to SSO'''
-    
-    def process_request(self, request):
-        if not getattr(settings, 'SSO_REDIRECT_ENABLED', True):
-            return None
-            
-        path = request.path.lower().rstrip('/')
-        
-        # Skip if user is already authenticated
-        if hasattr(request, 'user') and request.user.is_authenticated:
-            return None
-            
-        # List of auth-related URLs to intercept
-        auth_patterns = [
-            '/login',
-            '/signin', 
-            '/register',
-            '/signup',
-            '/logistration',
-            '/authn',  # Intercept MFE URLs too
-            '/user_api/v1/account/login_session',
-            '/api/user/v1/account/login_session',
-            '/create_account',
-            '/ui/login',
-            '/account',  # Account pages
-        ]
-        
-        # Check if this is an auth URL
-        is_auth_url = False
-        for pattern in auth_patterns:
-            if pattern in path or path.endswith(pattern):
-                is_auth_url = True
-                break
-        
-        if is_auth_url:
-            # Skip if it's an API endpoint we need to keep
-            skip_patterns = [
-                '/api/csrf/', 
-                '/static/', 
-                '/media/', 
-                '/admin/', 
-                '/oauth2/', 
-                '/auth/complete/', 
-                '/logout', 
-                '/auth/login/oidc/',
-                '/login_refresh',  # Skip login refresh to avoid CORS issues
-                '/api/user/v2/account/login_session/',  # API endpoints
-                '/api/mobile/',
-                '/heartbeat',
-            ]
-            if any(skip in path for skip in skip_patterns):
-                return None
-            
-            # Get the full SSO URL
-            sso_url = getattr(settings, 'SSO_REDIRECT_URL', '/auth/login/oidc/')
-            
-            # Make it absolute if it's relative
-            if sso_url.startswith('/'):
-                protocol = 'https' if request.is_secure() else 'http'
-                host = request.get_host()
-                sso_url = f"{protocol}://{host}{sso_url}"
-            
-            # Check if this is already the SSO URL
-            if request.build_absolute_uri().startswith(sso_url):
-                return None
-            
-            # Log the redirect
-            logger.info(f"SSO Redirect: INTERCEPTING {request.path} -> {sso_url}")
-            
-            # Preserve next parameter
-            next_url = request.GET.get('next', '')
-            if next_url:
-                redirect_url = f"{sso_url}?next={next_url}"
-            else:
-                redirect_url = sso_url
-            
-            # Use permanent redirect
-            return HttpResponsePermanentRedirect(redirect_url)
-        
-        return None
-
-# Create a module to hold the middleware
-import sys
-from types import ModuleType
-
-# Create the module
-sso_redirect_module = ModuleType('lms.djangoapps.sso_redirect')
-sso_redirect_module.SSORedirectMiddleware = SSORedirectMiddleware
-
-# Add the activate_user function
-def activate_user(backend, user, *args, **kwargs):
-    if user:
-        user.is_active = True
-        user.save()
-        
-# Add the set_logged_in_cookies function
-def set_logged_in_cookies(backend, user, request, *args, **kwargs):
-    """Ensure proper session and authentication cookies are set"""
-    if user and request:
-        from django.contrib.auth import login
-        from common.djangoapps.student.models import UserProfile
-        
-        # Ensure user profile exists
-        UserProfile.objects.get_or_create(user=user)
-        
-        # Force login
-        login(request, user, backend='django.contrib.auth.backends.ModelBackend')
-        request.session.save()
-        
-sso_redirect_module.activate_user = activate_user
-sso_redirect_module.set_logged_in_cookies = set_logged_in_cookies
-
-# Add to sys.modules
-sys.modules['lms.djangoapps.sso_redirect'] = sso_redirect_module
+# The SSO redirect middleware and the activate_user/set_logged_in_cookies
+# pipeline steps live in lms.djangoapps.sso_redirect, see tutorssoredirect.runtime
 
 # Disable middleware temporarily to ensure callbacks work
-# MIDDLEWARE = ['lms.djangoapps.sso_redirect.SSORedirectMiddleware'] + MIDDLEWARE
+# MIDDLEWARE = ['lms.djangoapps.sso_redirect.middleware.SSORedirectMiddleware'] + MIDDLEWARE
 
 # Disable password reset
 FEATURES['ENABLE_PASSWORD_RESET'] = False
@@ -497,7 +377,7 @@ LOGIN_URL = '/login'
 
 # Insert middleware at the beginning for CMS too
 # Disable middleware to allow MFE flow
-# MIDDLEWARE = ['lms.djangoapps.sso_redirect.SSORedirectMiddleware'] + MIDDLEWARE
+# MIDDLEWARE = ['lms.djangoapps.sso_redirect.middleware.SSORedirectMiddleware'] + MIDDLEWARE
 """),
 ])
 
@@ -0,0 +1,112 @@
+"""
+Ship the LMS-side ``sso_redirect`` package inside the settings patch
+
+The LMS image does not have this plugin installed, so the modules of
+``tutorssoredirect/sso_redirect`` are embedded in the settings patch and
+registered under ``lms.djangoapps.sso_redirect`` when the settings are loaded.
+This keeps the previous "module in sys.modules" approach, without having to
+maintain the code as a string.
+
+Tutor imports every enabled plugin on each CLI invocation, so package files
+are only read when a patch is rendered, and read once.
+"""
+from functools import lru_cache
+
+PACKAGE = "lms.djangoapps.sso_redirect"
+
+# Load order: a module may only import the modules listed before it
+MODULES = [
+    "classifier",
+    "instrumentation",
+    "logs",
+    "metrics",
+    "breaker",
+    "admission",
+    "tracing",
+    "sites",
+    "middleware",
+    "discovery",
+    "idp_client",
+    "readiness",
+    "backends",
+    "sessions",
+    "revocation",
+    "deferred",
+    "pipeline",
+    "provisioning",
+    "views",
+    "urls",
+    "__init__",
+]
+
+INSTALLER = """
+def _sso_install_runtime(package, sources):
+    import importlib
+    import sys
+    from types import ModuleType
+
+    parent, _, child = package.rpartition('.')
+    root = ModuleType(package)
+    root.__path__ = []
+    root.__package__ = package
+    sys.modules[package] = root
+    setattr(importlib.import_module(parent), child, root)
+    for name, source in sources:
+        if name == '__init__':
+            module = root
+        else:
+            module = ModuleType(package + '.' + name)
+            module.__package__ = package
+            sys.modules[module.__name__] = module
+            setattr(root, name, module)
+        filename = 'tutorssoredirect/sso_redirect/' + name + '.py'
+        exec(compile(source, filename, 'exec'), module.__dict__)
+
+_sso_install_runtime({package!r}, _sso_runtime_sources)
+del _sso_install_runtime, _sso_runtime_sources
+"""
+
+
+def resources():
+    try:
+        from importlib.resources import files
+    except ImportError:  # Python 3.8
+        from importlib_resources import files
+    return files("tutorssoredirect")
+
+
+def read_module(name):
+    return (resources() / "sso_redirect" / "{}.py".format(name)).read_text("utf-8")
+
+
+@lru_cache(maxsize=None)
+def patch_files():
+    """Return the (name, content) patches of the patches/*.yml files"""
+    import yaml
+
+    directory = resources().joinpath("patches")
+    if not directory.is_dir():
+        return ()
+    patches = []
+    for path in sorted(directory.iterdir(), key=lambda p: p.name):
+        if path.name.endswith(".yml"):
+            # Each file is a mapping with the patch name and its content
+            patch = yaml.safe_load(path.read_text("utf-8"))
+            patches.append((patch.get("name") or path.name[:-4], patch["content"]))
+    return tuple(patches)
+
+
+@lru_cache(maxsize=None)
+def runtime_patch():
+    """Return the settings patch that installs lms.djangoapps.sso_redirect"""
+    lines = [
+        "# SSO Redirect runtime package ({})".format(PACKAGE),
+        # Module sources must reach the settings file verbatim
+        "{% raw %}",
+        "_sso_runtime_sources = [",
+    ]
+    for name in MODULES:
+        lines.append("    ({!r}, {!r}),".format(name, read_module(name)))
+    lines.append("]")
+    lines.append("{% endraw %}")
+    return "\n".join(lines) + INSTALLER.format(package=PACKAGE)
@@ -0,0 +1,11 @@
+"""
+LMS-side code of the SSO redirect plugin
+
+These modules run inside the LMS, where they are installed as
+``lms.djangoapps.sso_redirect`` by the settings patch (see
+``tutorssoredirect.runtime``). Tutor itself imports the package when the
+plugin loads, for the defaults of ``classifier`` and the site table of
+``sites``. That also runs this ``__init__`` and ``pipeline``. These modules
+therefore import nothing from Django or the LMS at module level.
+"""
+from .pipeline import activate_user, set_logged_in_cookies
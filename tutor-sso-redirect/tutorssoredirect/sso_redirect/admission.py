@@ -0,0 +1,122 @@
+"""
+Admission control for the social auth callbacks
+
+Every ``/auth/complete/`` request creates or updates a user, its social auth
+association and its profile. During a login storm the callbacks of all the
+workers hit MySQL at once, and latency and errors grow for every request of the
+LMS. The limiter lets at most ``limit`` callbacks run at a time across the
+deployment: a callback takes one of ``limit`` slots in the Django cache with
+an atomic ``add``, and gives it back when it is done. A callback finding no
+free slot waits up to ``queue_timeout`` seconds for one, then gets a small
+"try again" page that reloads itself after ``retry_after`` seconds. The
+authorization code has not been redeemed by then, so the reload completes the
+login.
+
+A slot expires after ``lease`` seconds, so a worker killed in the middle of a
+callback does not keep it. The lease must outlast the longest callback, or a
+slow callback loses its slot while it runs and more than ``limit`` run at
+once: by default it covers the IdP calls of a callback with all their retries,
+plus the database work.
+"""
+import random
+import time
+import uuid
+
+DEFAULT_PREFIX = 'sso:admission:'
+# IdP calls a callback can make one after the other: the token request, the
+# JWKS refetch after a key rotation, and userinfo
+CALLBACK_IDP_CALLS = 3
+# Seconds the lease outlives the IdP calls, for the database work
+LEASE_MARGIN = 15
+
+RETRY_PAGE = '''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><meta http-equiv="refresh" content="{retry_after}">
+<title>Signing you in</title></head>
+<body><p>Many people are signing in right now. This page will try again in a few seconds.</p></body></html>
+'''
+
+
+class Limiter(object):
+    '''Concurrency limit shared by the workers through the cache'''
+
+    def __init__(self, cache, limit=20, queue_timeout=2.0, retry_after=5, lease=30,
+                 poll=0.05, prefix=DEFAULT_PREFIX):
+        self.cache = cache
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.lease = lease
+        self.poll = poll
+        self.prefix = prefix
+        self.slots = [prefix + 'slot:{}'.format(i) for i in range(limit)]
+
+    def try_acquire(self):
+        """Take a free slot, return (slot, token) or None"""
+        taken = self.cache.get_many(self.slots)
+        free = [slot for slot in self.slots if slot not in taken]
+        # Start from a random free slot, so that the workers do not all race
+        # for the first one
+        random.shuffle(free)
+        token = uuid.uuid4().hex
+        for slot in free:
+            if self.cache.add(slot, token, timeout=self.lease):
+                return slot, token
+        return None
+
+    def acquire(self):
+        """Return (slot, token, seconds waited), slot is None when over capacity"""
+        start = time.perf_counter()
+        deadline = start + self.queue_timeout
+        while True:
+            acquired = self.try_acquire()
+            if acquired is not None:
+                return acquired + (time.perf_counter() - start,)
+            if time.perf_counter() >= deadline:
+                return None, None, time.perf_counter() - start
+            # Jitter spreads the retries of the waiting workers
+            time.sleep(self.poll * (0.5 + random.random()))
+
+    def release(self, slot, token):
+        # Not atomic, but a slot only changes hands after its lease expired
+        if self.cache.get(slot) == token:
+            self.cache.delete(slot)
+
+    def in_use(self):
+        return len(self.cache.get_many(self.slots))
+
+    def retry_page(self):
+        return RETRY_PAGE.format(retry_after=int(self.retry_after))
+
+    def reject(self):
+        """503 answered to a callback over capacity"""
+        from django.http import HttpResponse
+
+        response = HttpResponse(self.retry_page(), status=503)
+        response['Retry-After'] = str(int(self.retry_after))
+        response['Cache-Control'] = 'no-store'
+        return response
+
+
+_limiter = None
+
+
+def get_limiter():
+    """Return the per-worker Limiter configured by the SSO_ADMISSION_* settings"""
+    global _limiter
+    if _limiter is None:
+        from django.conf import settings
+        from django.core.cache import caches
+
+        from . import idp_client
+
+        lease = getattr(settings, 'SSO_ADMISSION_LEASE', 0) or (
+            CALLBACK_IDP_CALLS * int(idp_client.get_max_call_seconds()) + LEASE_MARGIN
+        )
+        _limiter = Limiter(
+            caches[getattr(settings, 'SSO_OIDC_CACHE_ALIAS', 'default')],
+            limit=getattr(settings, 'SSO_ADMISSION_LIMIT', 20),
+            queue_timeout=getattr(settings, 'SSO_ADMISSION_QUEUE_SECONDS', 2.0),
+            retry_after=getattr(settings, 'SSO_ADMISSION_RETRY_AFTER', 5),
+            lease=lease,
+        )
+    return _limiter
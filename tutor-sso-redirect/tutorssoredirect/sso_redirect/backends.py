@@ -0,0 +1,274 @@
+"""
+OIDC backend used for the Zitadel login
+
+Keeps the backend name ``oidc``, so existing provider configurations in the
+Django admin keep working.
+"""
+import time
+
+import jwt
+from requests import ConnectionError, HTTPError, RequestException
+from social_core.backends.open_id_connect import OpenIdConnectAuth
+from social_core.exceptions import AuthFailed, AuthTokenError
+from social_core.utils import module_member, user_agent
+
+from . import breaker, idp_client, metrics, tracing
+from .discovery import DISCOVERY_PATH, get_document_cache
+
+DEFAULT_REQUIRED_CLAIMS = ('preferred_username', 'email', 'name')
+
+# ID token claims about the token itself rather than the user
+PROTOCOL_CLAIMS = frozenset([
+    'iss', 'aud', 'azp', 'exp', 'iat', 'nbf', 'jti', 'nonce', 'at_hash',
+    'c_hash', 'auth_time', 'amr', 'acr', 'sid',
+])
+
+BACKCHANNEL_LOGOUT_EVENT = 'http://schemas.openid.net/event/backchannel-logout'
+
+# A token signed with an unknown key refetches the JWKS at most this often
+JWKS_MIN_REFRESH = 60
+
+
+class IdPUnavailable(AuthFailed):
+    '''The IdP circuit breaker is open, the call was not made'''
+
+    def __str__(self):
+        return "The identity provider is unavailable, try again in a moment"
+
+
+def is_idp_failure(exc):
+    """Whether an IdP call failed because of the IdP, not e.g. a reused code"""
+    if isinstance(exc, HTTPError):
+        status = exc.response.status_code if exc.response is not None else 500
+        return status >= 500 or status == 429
+    return isinstance(exc, (RequestException, AuthFailed))
+
+
+class SSOOpenIdConnectAuth(OpenIdConnectAuth):
+    '''OpenIdConnectAuth sharing its discovery document and JWKS across workers'''
+
+    def cache_enabled(self):
+        return get_document_cache().ttl > 0
+
+    def oidc_config(self):
+        if not self.cache_enabled():
+            return super().oidc_config()
+        url = self.oidc_endpoint() + DISCOVERY_PATH
+        return get_document_cache().get(url, self.get_json)
+
+    def get_jwks_keys(self):
+        if not self.cache_enabled():
+            return super().get_jwks_keys()
+        # The keys of the parent method, without its one-day per-worker memo
+        # that would hide key rotations from the shared cache
+        return self.get_remote_jwks_keys()
+
+    def get_remote_jwks_keys(self):
+        if not self.cache_enabled():
+            return super().get_remote_jwks_keys()
+        document = get_document_cache().get(self.jwks_uri(), self.get_json)
+        # Copy, find_valid_key sets a default alg on the keys
+        return [dict(key) for key in document['keys']]
+
+    # The parent find_valid_key calls get_jwks_keys.invalidate() for an
+    # unknown key ID; this clears the per-worker memo used without the cache
+    get_jwks_keys.invalidate = OpenIdConnectAuth.get_jwks_keys.invalidate
+
+    def find_valid_key(self, id_token):
+        kid = jwt.get_unverified_header(id_token).get('kid')
+        if self.cache_enabled() and kid is not None and not self.has_jwks_key(kid):
+            return None
+        return super().find_valid_key(id_token)
+
+    def has_jwks_key(self, kid):
+        """
+        Whether the JWKS has the key kid. For an unknown key, e.g. after a
+        key rotation, one worker refetches the shared JWKS, at most every
+        JWKS_MIN_REFRESH seconds.
+        """
+        cache = get_document_cache()
+        url = self.jwks_uri()
+
+        def known(document):
+            return document is not None and any(key.get('kid') == kid for key in document['keys'])
+
+        if known(cache.get(url, self.get_json)):
+            return True
+        # Another worker may have refetched it since this worker's copy
+        if known(cache.shared(url)):
+            return True
+        if not cache.claim(url, 'rotated', JWKS_MIN_REFRESH):
+            return False
+        return known(cache.refresh(url, self.get_json))
+
+    def validate_logout_token(self, token):
+        """Claims of a back-channel logout token, raise AuthTokenError if it is not valid"""
+        client_id, _client_secret = self.get_key_and_secret()
+        try:
+            key = self.find_valid_key(token)
+            if not key:
+                raise AuthTokenError(self, "Signature verification failed")
+            claims = jwt.decode(
+                token,
+                jwt.PyJWK(key).key,
+                algorithms=self.setting('JWT_ALGORITHMS', self.JWT_ALGORITHMS),
+                audience=client_id,
+                issuer=self.id_token_issuer(),
+                options={'require': ['iat']},
+            )
+        except jwt.PyJWTError as error:
+            raise AuthTokenError(self, str(error))
+        if time.time() > claims['iat'] + self.setting('ID_TOKEN_MAX_AGE', self.ID_TOKEN_MAX_AGE):
+            raise AuthTokenError(self, "Incorrect logout token: iat")
+        if BACKCHANNEL_LOGOUT_EVENT not in (claims.get('events') or {}):
+            raise AuthTokenError(self, "Incorrect logout token: events")
+        if 'nonce' in claims:
+            raise AuthTokenError(self, "Incorrect logout token: nonce")
+        if not claims.get('sub') and not claims.get('sid'):
+            raise AuthTokenError(self, "Incorrect logout token: no sub or sid")
+        return claims
+
+    def idp_call(self, url):
+        """Name of the IdP endpoint at url, as a metric label"""
+        if url.endswith(DISCOVERY_PATH):
+            return 'discovery'
+        # The discovery document is loaded by then, from the cache
+        config = self.oidc_config()
+        for key, name in (
+            ('token_endpoint', 'token'),
+            ('userinfo_endpoint', 'userinfo'),
+            ('jwks_uri', 'jwks'),
+        ):
+            if config.get(key) == url:
+                return name
+        return 'other'
+
+    def start(self):
+        try:
+            return super().start()
+        except IdPUnavailable:
+            return self.idp_unavailable()
+
+    def auth_complete(self, *args, **kwargs):
+        try:
+            return super().auth_complete(*args, **kwargs)
+        except IdPUnavailable:
+            # do_complete returns anything that is not a user as the response
+            return self.idp_unavailable()
+
+    def idp_unavailable(self):
+        """Fail fast to SOCIAL_AUTH_LOGIN_ERROR_URL while the breaker is open"""
+        return self.strategy.redirect(self.setting('LOGIN_ERROR_URL') or '/')
+
+    def request(self, url, method='GET', *args, **kwargs):
+        call = self.idp_call(url)
+        start = time.perf_counter()
+        rejected = False
+        try:
+            with breaker.get_breaker().call(is_idp_failure):
+                return self.send(url, method, *args, **kwargs)
+        except breaker.CircuitOpen:
+            rejected = True
+            raise IdPUnavailable(self)
+        except Exception:
+            metrics.inc('sso_idp_errors_total', call=call)
+            raise
+        finally:
+            if not rejected:
+                duration = time.perf_counter() - start
+                metrics.observe('sso_idp_request_duration_seconds', duration, call=call)
+                if tracing.is_enabled():
+                    tracing.emit(self.trace_id(), 'idp_call', call=call,
+                                 duration_ms=round(duration * 1000, 3))
+
+    def send(self, url, method='GET', *args, **kwargs):
+        """Same as BaseAuth.request, through the pooled session of this worker"""
+        if not idp_client.is_enabled():
+            return super().request(url, method, *args, **kwargs)
+        kwargs.setdefault('headers', {})
+        if self.setting('PROXIES') is not None:
+            kwargs.setdefault('proxies', self.setting('PROXIES'))
+        if self.setting('VERIFY_SSL') is not None:
+            kwargs.setdefault('verify', self.setting('VERIFY_SSL'))
+        kwargs.setdefault('timeout', idp_client.get_timeout())
+        if self.SEND_USER_AGENT and 'User-Agent' not in kwargs['headers']:
+            kwargs['headers']['User-Agent'] = self.setting('USER_AGENT') or user_agent()
+        try:
+            response = idp_client.get_session().request(method, url, *args, **kwargs)
+        except ConnectionError as err:
+            raise AuthFailed(self, str(err))
+        response.raise_for_status()
+        return response
+
+    def user_data(self, access_token, *args, **kwargs):
+        # self.id_token holds the claims of the ID token request_access_token
+        # validated against the cached JWKS; userinfo is only called when
+        # they lack a claim the user details are built from
+        claims = self.id_token_user_data()
+        if claims is not None:
+            metrics.inc('sso_user_claims_total', source='id_token')
+            return claims
+        metrics.inc('sso_user_claims_total', source='userinfo')
+        return super().user_data(access_token, *args, **kwargs)
+
+    def id_token_user_data(self):
+        """User claims of the validated ID token, or None if userinfo is needed"""
+        from django.conf import settings
+
+        if not getattr(settings, 'SSO_OIDC_CLAIMS_FROM_ID_TOKEN', True) or not self.id_token:
+            return None
+        required = getattr(settings, 'SSO_OIDC_REQUIRED_CLAIMS', DEFAULT_REQUIRED_CLAIMS)
+        required = set(required) | {self.ID_KEY, self.setting('USERNAME_KEY', self.USERNAME_KEY)}
+        if any(not self.id_token.get(claim) for claim in required):
+            return None
+        return {
+            claim: value for claim, value in self.id_token.items()
+            if claim not in PROTOCOL_CLAIMS
+        }
+
+    def state_token(self):
+        state = super().state_token()
+        if tracing.is_enabled():
+            # Carries the trace ID to /auth/complete/ through the IdP
+            state = tracing.with_state(tracing.session_trace_id(self.strategy), state)
+        return state
+
+    def trace_id(self):
+        """Trace ID of this login, from the state sent back by the IdP or the session"""
+        return (tracing.from_state(self.data.get('state'))
+                or self.strategy.session_get(tracing.TRACE_ID_KEY))
+
+    def run_pipeline(self, pipeline, pipeline_index=0, *args, **kwargs):
+        # Same as the parent method, timing every step, and tracing it when
+        # SSO_PIPELINE_TRACE is on
+        out = kwargs.copy()
+        out.setdefault('strategy', self.strategy)
+        out.setdefault('backend', out.pop(self.name, None) or self)
+        out.setdefault('request', self.strategy.request_data())
+        out.setdefault('details', {})
+
+        if (
+            not isinstance(pipeline_index, int)
+            or pipeline_index < 0
+            or pipeline_index >= len(pipeline)
+        ):
+            pipeline_index = 0
+
+        enabled = tracing.is_enabled()
+        trace = tracing.PipelineTrace(self.trace_id() if enabled else None, enabled)
+        outcome = 'error'
+        try:
+            for idx, name in enumerate(pipeline[pipeline_index:]):
+                out['pipeline_index'] = pipeline_index + idx
+                func = module_member(name)
+                with trace.step(name, pipeline_index + idx):
+                    result = func(*args, **out) or {}
+                if not isinstance(result, dict):
+                    # A step interrupted the pipeline, e.g. with a redirect
+                    outcome = 'partial'
+                    return result
+                out.update(result)
+            outcome = 'complete'
+            return out
+        finally:
+            trace.finish(outcome)
@@ -0,0 +1,210 @@
+"""
+Circuit breaker for the calls from the LMS to the IdP
+
+The outcome of every IdP call is counted in the Django cache, in buckets of a
+rolling window shared by all the workers. When, over at least
+``min_calls`` calls, the share of failed calls or of calls slower than
+``slow_call`` seconds reaches its threshold, the breaker opens: calls fail at
+once instead of holding a uWSGI worker for the socket timeout. After
+``open_for`` seconds it lets one probe call through at a time, and closes
+again after ``probes`` successful probes.
+"""
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+DEFAULT_PREFIX = 'sso:breaker:'
+FIELDS = ('calls', 'failures', 'slow')
+# Seconds the probe lock outlives the longest IdP call
+PROBE_MARGIN = 5
+
+
+class CircuitOpen(Exception):
+    '''The breaker is open, the call was not made'''
+
+
+class CircuitBreaker(object):
+    '''Rolling-window breaker whose state and counters live in the cache'''
+
+    def __init__(self, cache, window=30, buckets=6, min_calls=10, error_rate=0.5,
+                 slow_call=2.0, slow_rate=0.5, open_for=30, probes=3, probe_timeout=30,
+                 prefix=DEFAULT_PREFIX):
+        self.cache = cache
+        self.window = window
+        self.bucket_size = max(1, window // buckets)
+        self.buckets = max(1, window // self.bucket_size)
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call = slow_call
+        self.slow_rate = slow_rate
+        self.open_for = open_for
+        self.probes = probes
+        # Held by the probe until it returns, so longer than any IdP call
+        self.probe_timeout = probe_timeout
+        self.prefix = prefix
+
+    def key(self, name):
+        return self.prefix + name
+
+    def get_state(self):
+        return self.cache.get(self.key('state')) or {'state': CLOSED, 'since': 0}
+
+    def set_state(self, state, **fields):
+        previous = self.get_state()['state']
+        value = dict(fields, state=state, since=time.time())
+        # Outlives the open period, so that the probes find it
+        self.cache.set(self.key('state'), value, timeout=self.window + self.open_for * 10)
+        if state != previous:
+            logger.warning("SSO IdP circuit breaker: %s -> %s %s", previous, state, fields)
+            metrics.inc('sso_breaker_transitions_total', state=state)
+        return value
+
+    def state(self):
+        """closed, open or half_open, as the next call would find it"""
+        state = self.get_state()
+        if state['state'] == OPEN and time.time() >= state['until']:
+            return HALF_OPEN
+        return state['state']
+
+    def before_call(self):
+        """Return the token of the probe, or None, raise CircuitOpen to skip the call"""
+        state = self.get_state()
+        if state['state'] == CLOSED:
+            return None
+        if state['state'] == OPEN and time.time() < state['until']:
+            metrics.inc('sso_breaker_rejected_total')
+            raise CircuitOpen(state)
+        # Half-open: one probe at a time
+        token = uuid.uuid4().hex
+        if self.cache.add(self.key('probe'), token, timeout=self.probe_timeout):
+            return token
+        metrics.inc('sso_breaker_rejected_total')
+        raise CircuitOpen(state)
+
+    def after_call(self, duration, failed, probe=None):
+        slow = duration >= self.slow_call
+        if probe:
+            # A probe that outlived its lock leaves the next probe's alone
+            if self.cache.get(self.key('probe')) == probe:
+                self.cache.delete(self.key('probe'))
+            if failed or slow:
+                self.trip(reason='probe failed' if failed else 'probe slow')
+                return
+            successes = self.get_state().get('successes', 0) + 1
+            if successes >= self.probes:
+                self.set_state(CLOSED)
+            else:
+                self.set_state(HALF_OPEN, successes=successes, until=0)
+            return
+        bucket = int(time.time() // self.bucket_size)
+        self.incr(bucket, 'calls')
+        if failed:
+            self.incr(bucket, 'failures')
+        if slow:
+            self.incr(bucket, 'slow')
+        if failed or slow:
+            self.evaluate(bucket)
+
+    def incr(self, bucket, field):
+        key = self.key('{}:{}'.format(bucket, field))
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            if not self.cache.add(key, 1, timeout=self.window + self.bucket_size):
+                self.cache.incr(key)
+
+    def rates(self, bucket=None):
+        """Return (calls, failure rate, slow rate) over the window since the last close"""
+        if bucket is None:
+            bucket = int(time.time() // self.bucket_size)
+        since = int(self.get_state().get('since', 0) // self.bucket_size)
+        first = max(bucket - self.buckets + 1, since)
+        keys = [
+            self.key('{}:{}'.format(b, field))
+            for b in range(first, bucket + 1) for field in FIELDS
+        ]
+        values = self.cache.get_many(keys)
+        totals = dict.fromkeys(FIELDS, 0)
+        for key, value in values.items():
+            totals[key.rsplit(':', 1)[1]] += value
+        calls = totals['calls']
+        if not calls:
+            return 0, 0.0, 0.0
+        return calls, totals['failures'] / calls, totals['slow'] / calls
+
+    def evaluate(self, bucket=None):
+        if self.get_state()['state'] != CLOSED:
+            return
+        calls, failure_rate, slow_rate = self.rates(bucket)
+        if calls < self.min_calls:
+            return
+        if failure_rate >= self.error_rate:
+            self.trip(reason='failure rate {:.0%} over {} calls'.format(failure_rate, calls))
+        elif slow_rate >= self.slow_rate:
+            self.trip(reason='slow call rate {:.0%} over {} calls'.format(slow_rate, calls))
+
+    def trip(self, reason):
+        self.set_state(OPEN, until=time.time() + self.open_for, reason=reason)
+
+    @contextmanager
+    def call(self, is_failure=lambda exc: True):
+        """Run the block through the breaker, is_failure(exc) tells errors the IdP is to blame for"""
+        probe = self.before_call()
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except Exception as e:
+            failed = is_failure(e)
+            raise
+        finally:
+            self.after_call(time.perf_counter() - start, failed, probe)
+
+
+class NullBreaker(object):
+    '''Stands in for CircuitBreaker when SSO_BREAKER_ENABLED is off'''
+
+    def state(self):
+        return CLOSED
+
+    @contextmanager
+    def call(self, is_failure=None):
+        yield
+
+
+_breaker = None
+
+
+def get_breaker():
+    """Return the per-worker CircuitBreaker configured by the SSO_BREAKER_* settings"""
+    global _breaker
+    if _breaker is None:
+        from django.conf import settings
+        from django.core.cache import caches
+
+        from . import idp_client
+
+        if not getattr(settings, 'SSO_BREAKER_ENABLED', True):
+            _breaker = NullBreaker()
+        else:
+            _breaker = CircuitBreaker(
+                caches[getattr(settings, 'SSO_OIDC_CACHE_ALIAS', 'default')],
+                window=getattr(settings, 'SSO_BREAKER_WINDOW', 30),
+                min_calls=getattr(settings, 'SSO_BREAKER_MIN_CALLS', 10),
+                error_rate=getattr(settings, 'SSO_BREAKER_ERROR_RATE', 0.5),
+                slow_call=getattr(settings, 'SSO_BREAKER_SLOW_CALL', 2.0),
+                slow_rate=getattr(settings, 'SSO_BREAKER_SLOW_RATE', 0.5),
+                open_for=getattr(settings, 'SSO_BREAKER_OPEN_SECONDS', 30),
+                probes=getattr(settings, 'SSO_BREAKER_PROBES', 3),
+                probe_timeout=int(idp_client.get_max_call_seconds()) + PROBE_MARGIN,
+            )
+    return _breaker
@@ -0,0 +1,124 @@
+"""
+Path classifier for the SSO redirect middleware
+
+The auth and skip pattern lists are compiled once into a single regular
+expression each, instead of being rebuilt and scanned on every request. Hot
+paths are answered from an exact-match table whose verdicts are computed at
+compile time, and every other path is memoised in a bounded dict.
+"""
+import re
+
+# Verdicts
+PASS = 0
+REDIRECT = 1
+
+# Substrings that mark a path as an auth URL
+DEFAULT_AUTH_PATTERNS = (
+    '/login',
+    '/signin',
+    '/register',
+    '/signup',
+    '/logistration',
+    '/authn',  # Intercept MFE URLs too
+    '/user_api/v1/account/login_session',
+    '/api/user/v1/account/login_session',
+    '/create_account',
+    '/ui/login',
+    '/account',  # Account pages
+)
+
+# Substrings of auth URLs that must keep working
+DEFAULT_SKIP_PATTERNS = (
+    '/api/csrf/',
+    '/static/',
+    '/media/',
+    '/admin/',
+    '/oauth2/',
+    '/auth/complete/',
+    '/logout',
+    '/auth/login/oidc/',
+    '/login_refresh',  # Skip login refresh to avoid CORS issues
+    '/api/user/v2/account/login_session/',  # API endpoints
+    '/api/mobile/',
+    '/heartbeat',
+)
+
+# Paths that are looked up without touching the regular expressions
+DEFAULT_EXACT_PATHS = (
+    '/',
+    '/dashboard',
+    '/heartbeat',
+    '/login',
+    '/register',
+    '/signin',
+    '/signup',
+    '/logout',
+    '/auth/login/oidc/',
+    '/auth/complete/oidc/',
+)
+
+# Upper bound on the number of memoised paths
+DEFAULT_CACHE_SIZE = 4096
+
+
+def compile_patterns(patterns):
+    """Compile substring patterns into one case-sensitive alternation"""
+    patterns = sorted(set(patterns), key=len, reverse=True)
+    if not patterns:
+        # An empty alternation would match everything
+        return re.compile(r'(?!)')
+    return re.compile('|'.join(re.escape(pattern) for pattern in patterns))
+
+
+class PathClassifier(object):
+    '''Decide whether a request path should be sent to SSO'''
+
+    def __init__(self, auth_patterns=DEFAULT_AUTH_PATTERNS,
+                 skip_patterns=DEFAULT_SKIP_PATTERNS,
+                 exact_paths=DEFAULT_EXACT_PATHS,
+                 cache_size=DEFAULT_CACHE_SIZE):
+        self._auth = compile_patterns(pattern.lower() for pattern in auth_patterns)
+        self._skip = compile_patterns(pattern.lower() for pattern in skip_patterns)
+        self._cache_size = cache_size
+        self._seen = {}
+        self._exact = {}
+        for path in exact_paths:
+            for variant in (path, path.rstrip('/') or '/', path.rstrip('/') + '/'):
+                self._exact[variant] = self.match(variant)
+
+    def match(self, path):
+        """Classify a path against the compiled patterns, bypassing the caches"""
+        path = path.lower().rstrip('/')
+        if self._auth.search(path) is None:
+            return PASS
+        if self._skip.search(path) is not None:
+            return PASS
+        return REDIRECT
+
+    def classify(self, path):
+        """Return REDIRECT for auth URLs that should go to SSO, PASS otherwise"""
+        verdict = self._exact.get(path)
+        if verdict is not None:
+            return verdict
+        verdict = self._seen.get(path)
+        if verdict is None:
+            verdict = self.match(path)
+            if len(self._seen) >= self._cache_size:
+                # Unique paths (course keys, usage ids) would otherwise grow
+                # the memo without bound; starting over is cheaper than LRU.
+                self._seen.clear()
+            self._seen[path] = verdict
+        return verdict
+
+    def is_auth_url(self, path):
+        return self.classify(path) == REDIRECT
+
+
+def from_settings(settings):
+    """Build a classifier from the SSO_REDIRECT_* Django settings"""
+    return PathClassifier(
+        auth_patterns=getattr(settings, 'SSO_REDIRECT_AUTH_PATTERNS', DEFAULT_AUTH_PATTERNS),
+        skip_patterns=getattr(settings, 'SSO_REDIRECT_SKIP_PATTERNS', DEFAULT_SKIP_PATTERNS),
+        exact_paths=getattr(settings, 'SSO_REDIRECT_EXACT_PATHS', DEFAULT_EXACT_PATHS),
+        cache_size=getattr(settings, 'SSO_REDIRECT_CLASSIFIER_CACHE_SIZE', DEFAULT_CACHE_SIZE),
+    )
@@ -0,0 +1,255 @@
+"""
+Login work deferred to the LMS Celery workers
+
+With ``SSO_PIPELINE_DEFERRED``, the callback only creates the user and its
+association and logs it in. The rest goes through here: the UserProfile of a
+new user, the refresh of the association's ``extra_data`` and the
+``SSO_DEFERRED_HOOKS`` called with the IdP claims.
+
+Logins are batched: every login is added to the bucket of the current
+``SSO_DEFERRED_INTERVAL`` seconds in the Django cache, and the first login of a
+bucket schedules one task for when it closes. The task handles all the logins
+of the bucket with a few queries. Every step is idempotent, so a task that is
+retried, or a login that is handled twice, does no harm. A task only deletes
+the logins it handled: a login added while it ran is handled by the same task
+or, when it scheduled the bucket again itself, by the next one.
+"""
+import logging
+import time
+
+from celery import shared_task
+
+from . import metrics
+from .instrumentation import load_hook
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PREFIX = 'sso:deferred:'
+DEFAULT_INTERVAL = 2
+# Seconds a task waits after its bucket closed, for the last cache writes
+GRACE = 1
+# Pending logins outlive a broker outage of this many seconds
+ITEM_TIMEOUT = 86400
+
+# Response keys that are not claims
+TOKEN_KEYS = frozenset(['access_token', 'id_token', 'refresh_token', 'token_type', 'expires_in'])
+
+
+def work_item(user, social, response, extra_data, is_new):
+    """What the task needs to know about one login, JSON serializable"""
+    return {
+        'user_id': user.pk,
+        'social_id': social.pk if social else None,
+        'is_new': bool(is_new),
+        'extra_data': extra_data,
+        'claims': {k: v for k, v in (response or {}).items() if k not in TOKEN_KEYS},
+        'time': time.time(),
+    }
+
+
+class Batcher(object):
+    '''Logins grouped by time bucket in the cache, one task per bucket'''
+
+    def __init__(self, cache, interval=DEFAULT_INTERVAL, prefix=DEFAULT_PREFIX):
+        self.cache = cache
+        self.interval = interval
+        self.prefix = prefix
+
+    def key(self, bucket, name):
+        return '{}{}:{}'.format(self.prefix, bucket, name)
+
+    def bucket(self):
+        return int(time.time() // self.interval)
+
+    def delay(self, bucket):
+        """Seconds until the task of bucket may run"""
+        return max(0, (bucket + 1) * self.interval - time.time()) + GRACE
+
+    def add(self, item):
+        """Add item to the current bucket, return (bucket, whether to schedule it)"""
+        bucket = self.bucket()
+        count = self.key(bucket, 'count')
+        try:
+            index = self.cache.incr(count)
+        except ValueError:
+            index = 1 if self.cache.add(count, 1, timeout=ITEM_TIMEOUT) else self.cache.incr(count)
+        self.cache.set(self.key(bucket, index), item, timeout=ITEM_TIMEOUT)
+        # add is atomic: one login per bucket schedules the task
+        return bucket, self.cache.add(self.key(bucket, 'scheduled'), 1, timeout=ITEM_TIMEOUT)
+
+    def unschedule(self, bucket):
+        self.cache.delete(self.key(bucket, 'scheduled'))
+
+    def items(self, bucket):
+        """Return (items of bucket not run yet, number of them not written yet, last index)"""
+        count = self.cache.get(self.key(bucket, 'count')) or 0
+        ran = self.cache.get(self.key(bucket, 'ran')) or 0
+        keys = [self.key(bucket, index) for index in range(ran + 1, count + 1)]
+        found = self.cache.get_many(keys)
+        return [found[key] for key in keys if key in found], len(keys) - len(found), count
+
+    def pending(self, bucket):
+        """Items of bucket not run inline yet, which are then marked as run"""
+        count = self.cache.get(self.key(bucket, 'count')) or 0
+        ran = self.cache.get(self.key(bucket, 'ran')) or 0
+        keys = [self.key(bucket, index) for index in range(ran + 1, count + 1)]
+        found = self.cache.get_many(keys)
+        # Only up to the first item not written yet, which the next call runs
+        written = next((i for i, key in enumerate(keys) if key not in found), len(keys))
+        self.cache.set(self.key(bucket, 'ran'), ran + written, timeout=ITEM_TIMEOUT)
+        return [found[key] for key in keys if key in found]
+
+    def done(self, bucket, last):
+        """
+        Delete the items of bucket up to last, which were run. Return whether
+        items were added since and the caller took the bucket back to run them.
+        """
+        self.cache.delete_many([self.key(bucket, index) for index in range(1, last + 1)])
+        # The count and the watermark expire with the items: indexes are not reused
+        self.cache.set(self.key(bucket, 'ran'), last, timeout=ITEM_TIMEOUT)
+        # Unscheduled before the count is read again: a login added from now
+        # on schedules the bucket itself, one added before is left to the caller
+        self.unschedule(bucket)
+        count = self.cache.get(self.key(bucket, 'count')) or 0
+        # add is atomic: either the caller or such a login runs the new items
+        return count > last and self.cache.add(self.key(bucket, 'scheduled'), 1, timeout=ITEM_TIMEOUT)
+
+
+def create_profiles(user_ids):
+    """UserProfile of the users that have none, with two queries"""
+    from common.djangoapps.student.models import UserProfile
+
+    existing = set(
+        UserProfile.objects.filter(user_id__in=user_ids).values_list('user_id', flat=True)
+    )
+    missing = [user_id for user_id in user_ids if user_id not in existing]
+    # ignore_conflicts: a profile created meanwhile, e.g. by a retry, wins
+    UserProfile.objects.bulk_create(
+        [UserProfile(user_id=user_id) for user_id in missing], ignore_conflicts=True,
+    )
+    return len(missing)
+
+
+def refresh_extra_data(items):
+    """Same as load_extra_data, for the latest login of each association, with one update"""
+    from django.utils import timezone
+    from social_core.storage import UserMixin
+    from social_django.models import UserSocialAuth
+
+    latest = {}
+    for item in sorted(items, key=lambda item: item['time']):
+        if item['social_id'] and item['extra_data']:
+            latest[item['social_id']] = item['extra_data']
+    changed = []
+    for social in UserSocialAuth.objects.filter(id__in=list(latest)):
+        # The merge of load_extra_data, without the save of each row
+        if UserMixin.set_extra_data(social, latest[social.id]):
+            social.modified = timezone.now()
+            changed.append(social)
+    UserSocialAuth.objects.bulk_update(changed, ['extra_data', 'modified'], batch_size=100)
+    return len(changed)
+
+
+def run_hooks(items, hooks):
+    """Call hook(user, claims, is_new) for every login, errors are logged"""
+    from django.contrib.auth import get_user_model
+
+    users = get_user_model().objects.in_bulk([item['user_id'] for item in items])
+    failed = 0
+    for item in items:
+        user = users.get(item['user_id'])
+        if user is None:
+            continue
+        for hook in hooks:
+            try:
+                hook(user, item['claims'], item['is_new'])
+            except Exception:
+                failed += 1
+                logger.exception("SSO deferred hook %s failed for user %s", hook, user.pk)
+    return failed
+
+
+def run_items(items, hooks=None):
+    """Run the deferred work of items, safe to run more than once"""
+    if hooks is None:
+        hooks = get_hooks()
+    if not items:
+        return
+    start = time.perf_counter()
+    new_users = list(dict.fromkeys(item['user_id'] for item in items if item['is_new']))
+    if new_users:
+        create_profiles(new_users)
+    refresh_extra_data(items)
+    failed = run_hooks(items, hooks) if hooks else 0
+    metrics.inc('sso_deferred_logins_total', len(items))
+    if failed:
+        metrics.inc('sso_deferred_hook_errors_total', failed)
+    metrics.observe('sso_deferred_batch_duration_seconds', time.perf_counter() - start)
+
+
+@shared_task(bind=True, name='lms.djangoapps.sso_redirect.deferred.run_batch',
+             max_retries=5, acks_late=True)
+def run_batch(self, bucket):
+    """Run the deferred work of the logins of bucket"""
+    batcher = get_batcher()
+    while True:
+        items, missing, last = batcher.items(bucket)
+        if missing and not self.request.retries:
+            # A login was counted but its item not written yet
+            raise self.retry(countdown=GRACE)
+        try:
+            run_items(items)
+        except Exception as exc:
+            raise self.retry(exc=exc, countdown=2 ** self.request.retries * batcher.interval)
+        if not batcher.done(bucket, last):
+            return
+
+
+def defer(item):
+    """Add item to the current batch, run the batch here if Celery cannot be reached"""
+    batcher = get_batcher()
+    bucket, schedule = batcher.add(item)
+    if not schedule:
+        return
+    try:
+        run_batch.apply_async(args=[bucket], countdown=batcher.delay(bucket))
+    except Exception:
+        logger.warning("SSO deferred logins: cannot schedule the task, running inline",
+                       exc_info=True)
+        run_pending(batcher, bucket)
+
+
+def run_pending(batcher, bucket):
+    """Run here the logins of bucket that no earlier fallback ran"""
+    # Unscheduled first: the logins added from now on see it, and schedule
+    # the bucket, or run it here, themselves
+    batcher.unschedule(bucket)
+    run_items(batcher.pending(bucket))
+
+
+_batcher = None
+_hooks = None
+
+
+def get_batcher():
+    """Return the per-worker Batcher configured by the SSO_DEFERRED_* settings"""
+    global _batcher
+    if _batcher is None:
+        from django.conf import settings
+        from django.core.cache import caches
+
+        _batcher = Batcher(
+            caches[getattr(settings, 'SSO_OIDC_CACHE_ALIAS', 'default')],
+            interval=getattr(settings, 'SSO_DEFERRED_INTERVAL', DEFAULT_INTERVAL),
+        )
+    return _batcher
+
+
+def get_hooks():
+    """Callables of SSO_DEFERRED_HOOKS"""
+    global _hooks
+    if _hooks is None:
+        from django.conf import settings
+
+        _hooks = [load_hook(path) for path in getattr(settings, 'SSO_DEFERRED_HOOKS', []) if path]
+    return _hooks
@@ -0,0 +1,125 @@
+"""
+Shared cache for the OIDC discovery document and JWKS
+
+Documents are kept in the Django cache so that every uWSGI worker shares a
+single copy, with a short-lived per-worker copy in front of it. A document
+older than its TTL is still served during the stale window while one worker
+refreshes it in the background; only a missing or expired document makes a
+request wait for the IdP.
+"""
+import hashlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 3600
+DEFAULT_STALE_TTL = 86400
+DEFAULT_PREFIX = 'sso:oidc:'
+
+DISCOVERY_PATH = '/.well-known/openid-configuration'
+
+
+class DocumentCache(object):
+    '''JSON documents keyed by URL, with TTL and stale-while-revalidate'''
+
+    def __init__(self, cache, ttl=DEFAULT_TTL, stale_ttl=DEFAULT_STALE_TTL,
+                 prefix=DEFAULT_PREFIX, lock_timeout=30):
+        self.cache = cache
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.prefix = prefix
+        self.lock_timeout = lock_timeout
+        self._local = {}
+
+    def key(self, url):
+        # URLs can be longer than memcached keys allow
+        return self.prefix + hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def get(self, url, fetch):
+        """Return the document at url, calling fetch(url) only when needed"""
+        now = time.time()
+        entry = self._local.get(url)
+        if entry is None or now - entry['fetched_at'] >= self.ttl:
+            entry = self.cache.get(self.key(url))
+            if entry is not None:
+                self._local[url] = entry
+        if entry is not None:
+            age = now - entry['fetched_at']
+            if age < self.ttl:
+                return entry['value']
+            if age < self.ttl + self.stale_ttl:
+                self.refresh_in_background(url, fetch)
+                return entry['value']
+        return self.refresh(url, fetch)
+
+    def age(self, url):
+        """Seconds since the document was fetched, or None if it is not cached"""
+        entry = self._local.get(url) or self.cache.get(self.key(url))
+        if entry is None:
+            return None
+        return time.time() - entry['fetched_at']
+
+    def shared(self, url):
+        """The document as last stored by any worker, or None if it is not cached"""
+        entry = self.cache.get(self.key(url))
+        if entry is None:
+            return None
+        self._local[url] = entry
+        return entry['value']
+
+    def claim(self, url, name, timeout):
+        """Whether this worker is the one to do name for url, for timeout seconds"""
+        # cache.add is atomic, only one worker gets the claim
+        return self.cache.add('{}:{}'.format(self.key(url), name), 1, timeout=timeout)
+
+    def refresh(self, url, fetch):
+        """Fetch the document now and share it with the other workers"""
+        value = fetch(url)
+        entry = {'fetched_at': time.time(), 'value': value}
+        self.cache.set(self.key(url), entry, timeout=self.ttl + self.stale_ttl)
+        self._local[url] = entry
+        return value
+
+    def refresh_in_background(self, url, fetch):
+        # cache.add is atomic, so only one worker refreshes a given document
+        lock = self.key(url) + ':refreshing'
+        if not self.cache.add(lock, 1, timeout=self.lock_timeout):
+            return None
+        thread = threading.Thread(
+            target=self._refresh_and_unlock, args=(url, fetch, lock), daemon=True
+        )
+        thread.start()
+        return thread
+
+    def _refresh_and_unlock(self, url, fetch, lock):
+        try:
+            self.refresh(url, fetch)
+        except Exception:
+            # Keep serving the stale copy, the next request past TTL retries
+            logger.warning("SSO OIDC cache: refreshing %s failed", url, exc_info=True)
+        finally:
+            self.cache.delete(lock)
+
+    def clear(self, url):
+        self._local.pop(url, None)
+        self.cache.delete(self.key(url))
+
+
+_document_cache = None
+
+
+def get_document_cache():
+    """Return the per-worker DocumentCache configured by the SSO_OIDC_* settings"""
+    global _document_cache
+    if _document_cache is None:
+        from django.conf import settings
+        from django.core.cache import caches
+
+        _document_cache = DocumentCache(
+            caches[getattr(settings, 'SSO_OIDC_CACHE_ALIAS', 'default')],
+            ttl=getattr(settings, 'SSO_OIDC_CACHE_TTL', DEFAULT_TTL),
+            stale_ttl=getattr(settings, 'SSO_OIDC_CACHE_STALE_TTL', DEFAULT_STALE_TTL),
+        )
+    return _document_cache
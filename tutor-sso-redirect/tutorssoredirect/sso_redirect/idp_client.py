@@ -0,0 +1,132 @@
+"""
+Pooled HTTP session for the calls from the LMS to the IdP
+
+Every worker keeps one ``requests.Session`` whose connections to the IdP are
+kept alive and reused, so a login does not pay a TCP and TLS handshake per
+call. Connect and read timeouts are explicit, and failed calls are retried
+with exponential backoff and jitter. Only connection errors are retried for
+POST: the token request redeems a single-use code.
+"""
+import os
+import random
+import threading
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 10
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 0.2
+DEFAULT_JITTER = 0.2
+
+RETRY_STATUSES = (502, 503, 504)
+
+
+def retry_class():
+    from urllib3.util.retry import Retry
+
+    class JitterRetry(Retry):
+        '''Retry whose backoff gets a random delay added, urllib3 1.x and 2.x'''
+
+        jitter = 0
+
+        def new(self, **kw):
+            retry = super().new(**kw)
+            retry.jitter = self.jitter
+            return retry
+
+        def get_backoff_time(self):
+            backoff = super().get_backoff_time()
+            if backoff <= 0 or not self.jitter:
+                return backoff
+            return backoff + random.uniform(0, self.jitter)
+
+    return JitterRetry
+
+
+def build_session(pool_size=DEFAULT_POOL_SIZE, retries=DEFAULT_RETRIES,
+                  backoff=DEFAULT_BACKOFF, jitter=DEFAULT_JITTER):
+    """Return a requests.Session with a bounded keep-alive pool and retries"""
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    retry = retry_class()(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(['GET', 'HEAD', 'OPTIONS']),
+        raise_on_status=False,
+    )
+    retry.jitter = jitter
+    session = requests.Session()
+    # One host in practice, pool_maxsize bounds the connections kept to it
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class SessionPool(object):
+    '''One session per process: uWSGI forks after the settings are loaded'''
+
+    def __init__(self, **options):
+        self.options = options
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._session = build_session(**self.options)
+                    self._pid = os.getpid()
+        return self._session
+
+
+_pool = None
+
+
+def is_enabled():
+    from django.conf import settings
+    return getattr(settings, 'SSO_IDP_POOLED', True)
+
+
+def get_session():
+    """Return the pooled session of this process, configured by the SSO_IDP_* settings"""
+    global _pool
+    if _pool is None:
+        from django.conf import settings
+
+        _pool = SessionPool(
+            pool_size=getattr(settings, 'SSO_IDP_POOL_SIZE', DEFAULT_POOL_SIZE),
+            retries=getattr(settings, 'SSO_IDP_RETRIES', DEFAULT_RETRIES),
+            backoff=getattr(settings, 'SSO_IDP_RETRY_BACKOFF', DEFAULT_BACKOFF),
+            jitter=getattr(settings, 'SSO_IDP_RETRY_JITTER', DEFAULT_JITTER),
+        )
+    return _pool.get()
+
+
+def get_timeout():
+    """Return the (connect, read) timeout of the IdP calls"""
+    from django.conf import settings
+
+    return (
+        getattr(settings, 'SSO_IDP_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT),
+        getattr(settings, 'SSO_IDP_READ_TIMEOUT', DEFAULT_READ_TIMEOUT),
+    )
+
+
+def get_max_call_seconds():
+    """Longest an IdP call can take: the timeouts of every attempt and the backoffs"""
+    from django.conf import settings
+
+    connect, read = get_timeout()
+    if not is_enabled():
+        return connect + read
+    retries = getattr(settings, 'SSO_IDP_RETRIES', DEFAULT_RETRIES)
+    backoff = getattr(settings, 'SSO_IDP_RETRY_BACKOFF', DEFAULT_BACKOFF)
+    jitter = getattr(settings, 'SSO_IDP_RETRY_JITTER', DEFAULT_JITTER)
+    return (retries + 1) * (connect + read) + sum(backoff * 2 ** i + jitter for i in range(retries))
@@ -0,0 +1,52 @@
+"""
+Database query counting for the SSO components
+"""
+from contextlib import contextmanager
+
+
+class QueryCounter(object):
+    '''Execute wrapper that records every query run through a connection'''
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+
+@contextmanager
+def count_queries(using=None):
+    """
+    Count the queries run inside the block, on one database alias or on all of
+    them (the LMS has several)
+    """
+    from contextlib import ExitStack
+    from django.db import connections
+
+    counter = QueryCounter()
+    aliases = [using] if using else list(connections)
+    with ExitStack() as stack:
+        for alias in aliases:
+            stack.enter_context(connections[alias].execute_wrapper(counter))
+        yield counter
+
+
+def load_hook(path):
+    """Import a ``module.attribute`` hook, or return None for an empty path"""
+    if not path:
+        return None
+    from django.utils.module_loading import import_string
+    return import_string(path)
+
+
+def log_query_count(request, counter):
+    """Query hook that logs the number of queries of every decision"""
+    import logging
+    logging.getLogger(__name__).info(
+        "SSO Redirect: %s cost %d queries", request.path, counter.count
+    )
@@ -0,0 +1,191 @@
+"""
+Logging profiles for the SSO components
+
+Records go through a bounded queue to a listener thread that does the
+console I/O, so a request never waits on stdout. When the queue is full,
+records are dropped rather than blocking. Debug output can be sampled and
+rate limited per logger.
+
+``configure_logging`` is called from the settings patch, on the LMS
+``LOGGING`` dict, before Django applies it.
+"""
+import atexit
+import copy
+import itertools
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+PACKAGE = 'lms.djangoapps.sso_redirect'
+
+SSO_LOGGERS = (
+    PACKAGE,
+    'social',
+    'oauth2_provider',
+    'common.djangoapps.third_party_auth',
+)
+
+# Levels per logger, an empty profile leaves the LMS logging untouched
+PROFILES = {
+    'production': {
+        PACKAGE: 'INFO',
+        'social': 'WARNING',
+        'oauth2_provider': 'WARNING',
+        'common.djangoapps.third_party_auth': 'INFO',
+    },
+    'debug': {name: 'DEBUG' for name in SSO_LOGGERS},
+    'quiet': {name: 'WARNING' for name in SSO_LOGGERS},
+}
+
+DEFAULT_QUEUE_SIZE = 10000
+
+_default_formatter = logging.Formatter()
+
+
+class AsyncHandler(QueueHandler):
+    '''QueueHandler that never blocks, with a listener thread per process'''
+
+    def __init__(self, queue_size=DEFAULT_QUEUE_SIZE, stream=None):
+        super().__init__(queue.Queue(queue_size))
+        self.target = logging.StreamHandler(stream or sys.stderr)
+        self.dropped = 0
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        # uWSGI forks the workers after the settings are loaded: threads of
+        # the master are not inherited, so every process starts its own
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self.queue = queue.Queue(self.queue.maxsize)
+            self._listener = QueueListener(self.queue, self.target, respect_handler_level=False)
+            self._listener.start()
+            self._pid = os.getpid()
+            atexit.register(self.stop)
+
+    def stop(self):
+        """Write what is queued and stop the listener of this process"""
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+            self._pid = None
+
+    def setFormatter(self, fmt):
+        # Formatting (time, location) is done by the listener thread
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Arguments may change once the call returns, so the message is
+        # interpolated here, and the traceback rendered while it is current
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = (self.target.formatter or _default_formatter).formatException(
+                record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            self.start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class SampleFilter(logging.Filter):
+    '''Let one debug record out of every ``1 / rate``, other levels pass'''
+
+    def __init__(self, rate=1.0, level=logging.DEBUG):
+        super().__init__()
+        self.every = max(1, int(round(1 / rate))) if rate > 0 else 0
+        self.level = level
+        self._counter = itertools.count()
+
+    def filter(self, record):
+        if record.levelno > self.level:
+            return True
+        if not self.every:
+            return False
+        return next(self._counter) % self.every == 0
+
+
+class RateLimitFilter(logging.Filter):
+    '''Token bucket per logger for debug records, other levels pass'''
+
+    def __init__(self, per_second=50, burst=None, level=logging.DEBUG):
+        super().__init__()
+        self.per_second = per_second
+        self.burst = burst or per_second
+        self.level = level
+        self.suppressed = 0
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > self.level or not self.per_second:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(record.name, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.per_second)
+            if tokens < 1:
+                self._buckets[record.name] = (tokens, now)
+                self.suppressed += 1
+                return False
+            self._buckets[record.name] = (tokens - 1, now)
+        return True
+
+
+def configure_logging(config, profile, levels=None, sample_rate=1.0, rate_limit=0,
+                      queue_size=DEFAULT_QUEUE_SIZE, formatter='standard'):
+    """
+    Route the SSO loggers of a ``LOGGING`` dict through the async handler, at
+    the levels of the profile overridden by ``levels``, and return the dict
+    """
+    if not profile and not levels:
+        return config
+    if profile and profile not in PROFILES:
+        raise ValueError("Unknown SSO_LOG_PROFILE {!r}, expected one of {}".format(
+            profile, ", ".join(sorted(PROFILES))))
+    config.setdefault('filters', {})
+    config.setdefault('handlers', {})
+    config.setdefault('loggers', {})
+
+    filters = []
+    if sample_rate < 1:
+        config['filters']['sso_sample'] = {
+            '()': SampleFilter, 'rate': sample_rate,
+        }
+        filters.append('sso_sample')
+    if rate_limit:
+        config['filters']['sso_rate_limit'] = {
+            '()': RateLimitFilter, 'per_second': rate_limit,
+        }
+        filters.append('sso_rate_limit')
+
+    handler = {
+        '()': AsyncHandler,
+        'queue_size': queue_size,
+        'filters': filters,
+    }
+    if formatter in config.get('formatters', {}):
+        handler['formatter'] = formatter
+    config['handlers']['sso_async'] = handler
+
+    merged = dict(PROFILES.get(profile, {}))
+    merged.update(levels or {})
+    for name, level in merged.items():
+        config['loggers'][name] = {
+            'handlers': ['sso_async'],
+            'level': level,
+            'propagate': False,
+        }
+    return config
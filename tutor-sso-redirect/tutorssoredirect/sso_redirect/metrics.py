@@ -0,0 +1,261 @@
+"""
+Counters and histograms for the SSO components
+
+Every process records into a local registry, a dict update under a lock
+held for a few instructions, and adds what it recorded to the Django cache with
+``incr`` at most once per flush interval. The cache is shared by all uWSGI
+workers, so the scrape view renders the totals of the whole LMS in the
+Prometheus text exposition format.
+"""
+import atexit
+import hashlib
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PREFIX = 'sso:metrics:'
+DEFAULT_FLUSH_INTERVAL = 10
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+COUNTER = 'counter'
+HISTOGRAM = 'histogram'
+
+# Histogram sums are kept in microseconds, the cache only adds integers
+SUM_SCALE = 1000000
+
+METRICS = {
+    'sso_redirects_total': (COUNTER, "Requests sent to SSO by the plugin"),
+    'sso_auth_requests_total': (COUNTER, "Social auth begin and complete requests"),
+    'sso_auth_request_duration_seconds': (
+        HISTOGRAM, "Duration of the social auth begin and complete requests"),
+    'sso_pipeline_step_duration_seconds': (
+        HISTOGRAM, "Duration of each SOCIAL_AUTH_PIPELINE step"),
+    'sso_idp_request_duration_seconds': (HISTOGRAM, "Duration of the calls to the IdP"),
+    'sso_idp_errors_total': (COUNTER, "Failed calls to the IdP"),
+    'sso_user_claims_total': (COUNTER, "Logins by source of the user claims"),
+    'sso_breaker_transitions_total': (COUNTER, "IdP circuit breaker state changes"),
+    'sso_breaker_rejected_total': (COUNTER, "IdP calls failed fast by the open circuit breaker"),
+    'sso_admission_total': (COUNTER, "Social auth callbacks by admission outcome"),
+    'sso_admission_wait_seconds': (HISTOGRAM, "Time social auth callbacks waited for a slot"),
+    'sso_deferred_logins_total': (COUNTER, "Logins whose deferred work ran"),
+    'sso_deferred_hook_errors_total': (COUNTER, "Failed SSO_DEFERRED_HOOKS calls"),
+    'sso_deferred_batch_duration_seconds': (HISTOGRAM, "Duration of the deferred login batches"),
+    'sso_sessions_revoked_total': (COUNTER, "Sessions deleted by back-channel logout or revocation"),
+    'sso_revocations_incomplete_total': (COUNTER, "Revocations of users who may have sessions the index does not cover"),
+}
+
+
+def series_id(name, labels):
+    return name + '{' + ','.join('{}={}'.format(k, labels[k]) for k in sorted(labels)) + '}'
+
+
+class Registry(object):
+    '''Metrics of one process, added to the shared cache every flush interval'''
+
+    def __init__(self, cache, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 buckets=DEFAULT_BUCKETS, prefix=DEFAULT_PREFIX):
+        self.cache = cache
+        self.flush_interval = flush_interval
+        self.buckets = tuple(buckets)
+        self.prefix = prefix
+        self.index_key = prefix + 'index'
+        self._series = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+
+    def key(self, field):
+        # Label values can contain characters memcached does not accept
+        return self.prefix + hashlib.sha1(field.encode('utf-8')).hexdigest()
+
+    def _register(self, name, labels, kind):
+        series = series_id(name, labels)
+        if series not in self._series:
+            self._series[series] = {'name': name, 'labels': labels, 'kind': kind}
+        return series
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            series = self._register(name, labels, COUNTER)
+            self._pending[series] = self._pending.get(series, 0) + value
+        self.maybe_flush()
+
+    def observe(self, name, seconds, **labels):
+        # Bucket counts are stored per bucket and made cumulative when scraped
+        bucket = bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._register(name, labels, HISTOGRAM)
+            pending = self._pending
+            for field, value in (
+                ('{}|{}'.format(series, bucket), 1),
+                (series + '|count', 1),
+                (series + '|sum', int(seconds * SUM_SCALE)),
+            ):
+                pending[field] = pending.get(field, 0) + value
+        self.maybe_flush()
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def maybe_flush(self):
+        if time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Add what this process recorded to the shared cache"""
+        with self._lock:
+            self._flushed_at = time.monotonic()
+            pending, self._pending = self._pending, {}
+            series = dict(self._series)
+        if not pending:
+            return
+        try:
+            self._update_index(series)
+            for field, delta in pending.items():
+                self._add(self.key(field), delta)
+        except Exception:  # Metrics never break a request
+            logger.warning("SSO metrics: flushing to the cache failed", exc_info=True)
+            with self._lock:
+                for field, delta in pending.items():
+                    self._pending[field] = self._pending.get(field, 0) + delta
+
+    def _add(self, key, delta):
+        try:
+            self.cache.incr(key, delta)
+        except ValueError:
+            # Missing key: create it, unless another worker just did
+            if not self.cache.add(key, delta, timeout=None):
+                self.cache.incr(key, delta)
+
+    def _update_index(self, series):
+        # Read on every flush, so that series lost to a concurrent write of
+        # another worker are added back
+        index = self.cache.get(self.index_key) or {}
+        missing = {s: meta for s, meta in series.items() if s not in index}
+        if missing:
+            index.update(missing)
+            self.cache.set(self.index_key, index, timeout=None)
+
+    def collect(self):
+        """Return [(series, meta, value)] from the shared cache"""
+        self.flush()
+        index = self.cache.get(self.index_key) or {}
+        fields = []
+        for series, meta in index.items():
+            if meta['kind'] == COUNTER:
+                fields.append(series)
+            else:
+                fields.extend('{}|{}'.format(series, b) for b in range(len(self.buckets) + 1))
+                fields.extend((series + '|count', series + '|sum'))
+        values = self.cache.get_many([self.key(f) for f in fields])
+        results = []
+        for series, meta in sorted(index.items()):
+            if meta['kind'] == COUNTER:
+                value = values.get(self.key(series), 0)
+            else:
+                value = {
+                    'buckets': [values.get(self.key('{}|{}'.format(series, b)), 0)
+                                for b in range(len(self.buckets) + 1)],
+                    'count': values.get(self.key(series + '|count'), 0),
+                    'sum': values.get(self.key(series + '|sum'), 0) / SUM_SCALE,
+                }
+            results.append((series, meta, value))
+        return results
+
+    def render(self):
+        """Return the metrics in the Prometheus text exposition format"""
+        lines = []
+        described = set()
+        for _series, meta, value in self.collect():
+            name = meta['name']
+            if name not in described:
+                kind, help_text = METRICS.get(name, (meta['kind'], name))
+                lines.append('# HELP {} {}'.format(name, help_text))
+                lines.append('# TYPE {} {}'.format(name, kind))
+                described.add(name)
+            labels = meta['labels']
+            if meta['kind'] == COUNTER:
+                lines.append('{}{} {}'.format(name, format_labels(labels), value))
+                continue
+            cumulative = 0
+            bounds = [repr(float(b)) for b in self.buckets] + ['+Inf']
+            for bound, count in zip(bounds, value['buckets']):
+                cumulative += count
+                lines.append('{}_bucket{} {}'.format(
+                    name, format_labels(dict(labels, le=bound)), cumulative))
+            lines.append('{}_sum{} {}'.format(name, format_labels(labels), value['sum']))
+            lines.append('{}_count{} {}'.format(name, format_labels(labels), value['count']))
+        return '\n'.join(lines) + '\n'
+
+
+class NullRegistry(object):
+    '''Registry used when metrics are disabled'''
+
+    def inc(self, name, value=1, **labels):
+        pass
+
+    def observe(self, name, seconds, **labels):
+        pass
+
+    @contextmanager
+    def timer(self, name, **labels):
+        yield
+
+    def flush(self):
+        pass
+
+    def render(self):
+        return ''
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for k, v in sorted(labels.items())
+    )
+    return '{' + ','.join('{}="{}"'.format(k, v) for k, v in escaped) + '}'
+
+
+_registry = None
+
+
+def get_registry():
+    """Return the per-process registry configured by the SSO_METRICS_* settings"""
+    global _registry
+    if _registry is None:
+        from django.conf import settings
+        from django.core.cache import caches
+
+        if not getattr(settings, 'SSO_METRICS_ENABLED', True):
+            _registry = NullRegistry()
+        else:
+            _registry = Registry(
+                caches[getattr(settings, 'SSO_METRICS_CACHE_ALIAS', 'default')],
+                flush_interval=getattr(settings, 'SSO_METRICS_FLUSH_INTERVAL',
+                                       DEFAULT_FLUSH_INTERVAL),
+            )
+            atexit.register(_registry.flush)
+    return _registry
+
+
+def inc(name, value=1, **labels):
+    get_registry().inc(name, value, **labels)
+
+
+def observe(name, seconds, **labels):
+    get_registry().observe(name, seconds, **labels)
+
+
+def timer(name, **labels):
+    return get_registry().timer(name, **labels)
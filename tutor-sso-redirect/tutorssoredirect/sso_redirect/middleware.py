@@ -0,0 +1,136 @@
+"""
+Middleware that sends authentication requests straight to SSO
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.http import HttpResponsePermanentRedirect
+from django.utils.deprecation import MiddlewareMixin
+
+from . import admission, classifier, metrics, sites
+from .instrumentation import count_queries, load_hook
+
+logger = logging.getLogger(__name__)
+
+
+class SSORedirectMiddleware(MiddlewareMixin):
+    '''Middleware to redirect authentication requests to SSO'''
+
+    def __init__(self, get_response=None):
+        super().__init__(get_response)
+        # Settings do not change for the lifetime of a worker, so the patterns
+        # are compiled once here rather than on every request.
+        self.enabled = getattr(settings, 'SSO_REDIRECT_ENABLED', True)
+        # SSO URL of each host, the default site has SSO_REDIRECT_URL
+        self.sites = sites.get_router()
+        self.classifier = classifier.from_settings(settings)
+        # Classify the path before looking at request.user, so that the lazy
+        # session and auth_user lookups only happen for candidate auth URLs
+        self.classify_first = getattr(settings, 'SSO_REDIRECT_CLASSIFY_FIRST', True)
+        # Optional callable(request, counter) told how many queries each
+        # decision cost
+        self.query_hook = load_hook(getattr(settings, 'SSO_REDIRECT_QUERY_HOOK', ''))
+
+    def process_request(self, request):
+        if not self.enabled:
+            return None
+        if self.query_hook is None:
+            return self.redirect(request)
+        with count_queries() as counter:
+            response = self.redirect(request)
+        self.query_hook(request, counter)
+        return response
+
+    def redirect(self, request):
+        """Return the SSO redirect for this request, if any"""
+        if self.classify_first:
+            if self.classifier.classify(request.path) != classifier.REDIRECT:
+                return None
+            if self.is_authenticated(request):
+                return None
+        else:
+            if self.is_authenticated(request):
+                return None
+            if self.classifier.classify(request.path) != classifier.REDIRECT:
+                return None
+
+        # Make the SSO URL absolute if it's relative
+        sso_url = self.sites.for_request(request).login_url
+        if sso_url.startswith('/'):
+            protocol = 'https' if request.is_secure() else 'http'
+            sso_url = f"{protocol}://{request.get_host()}{sso_url}"
+
+        # Check if this is already the SSO URL
+        if request.build_absolute_uri().startswith(sso_url):
+            return None
+
+        logger.info("SSO Redirect: INTERCEPTING %s -> %s", request.path, sso_url)
+        metrics.inc('sso_redirects_total', source='middleware')
+
+        # Preserve next parameter
+        next_url = request.GET.get('next', '')
+        if next_url:
+            redirect_url = f"{sso_url}?next={next_url}"
+        else:
+            redirect_url = sso_url
+
+        # Use permanent redirect
+        return HttpResponsePermanentRedirect(redirect_url)
+
+    @staticmethod
+    def is_authenticated(request):
+        # Evaluating request.user loads the session and the user row
+        return hasattr(request, 'user') and request.user.is_authenticated
+
+
+class SSOMetricsMiddleware(object):
+    '''Time the social auth begin and complete requests'''
+
+    PREFIXES = (
+        ('/auth/complete/', 'complete'),
+        ('/auth/login/', 'begin'),
+    )
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        path = request.path
+        if not path.startswith('/auth/'):
+            return self.get_response(request)
+        for prefix, view in self.PREFIXES:
+            if path.startswith(prefix):
+                break
+        else:
+            return self.get_response(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        metrics.observe('sso_auth_request_duration_seconds', time.perf_counter() - start, view=view)
+        metrics.inc('sso_auth_requests_total', view=view,
+                    status='{}xx'.format(response.status_code // 100))
+        return response
+
+
+class SSOAdmissionMiddleware(object):
+    '''Limit the /auth/complete/ requests running at once, see admission'''
+
+    PREFIX = '/auth/complete/'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.limiter = admission.get_limiter()
+
+    def __call__(self, request):
+        if not request.path.startswith(self.PREFIX):
+            return self.get_response(request)
+        slot, token, waited = self.limiter.acquire()
+        metrics.observe('sso_admission_wait_seconds', waited)
+        if slot is None:
+            metrics.inc('sso_admission_total', outcome='rejected')
+            return self.limiter.reject()
+        metrics.inc('sso_admission_total', outcome='queued' if waited >= self.limiter.poll else 'admitted')
+        try:
+            return self.get_response(request)
+        finally:
+            self.limiter.release(slot, token)
@@ -0,0 +1,194 @@
+"""
+Custom SOCIAL_AUTH_PIPELINE steps
+"""
+import hashlib
+import re
+from uuid import uuid4
+
+# Same as the username cleaning of social-auth-core
+CLEAN_USERNAME_REGEX = re.compile(r'[^\w.@+_-]+', re.UNICODE)
+
+# Lengths of the sub digest appended when the plain username is taken
+SUFFIX_LENGTHS = (6, 12, 40)
+
+
+def activate_user(backend, user, *args, **kwargs):
+    if user:
+        user.is_active = True
+        user.save()
+
+
+def set_logged_in_cookies(backend, user, request, *args, **kwargs):
+    """Ensure proper session and authentication cookies are set"""
+    if user and request:
+        from django.contrib.auth import login
+        from common.djangoapps.student.models import UserProfile
+
+        # Ensure user profile exists
+        UserProfile.objects.get_or_create(user=user)
+
+        # Force login
+        login(request, user, backend='django.contrib.auth.backends.ModelBackend')
+        request.session.save()
+
+
+# Fields the identity provider is never allowed to overwrite
+PROTECTED_FIELDS = (
+    'username', 'id', 'pk', 'email', 'password', 'is_active', 'is_staff', 'is_superuser',
+)
+
+
+def changed_user_fields(strategy, backend, user, details):
+    """Apply the IdP details to user and return the names of the changed fields"""
+    protected = PROTECTED_FIELDS + tuple(strategy.setting('PROTECTED_USER_FIELDS', []))
+    immutable = tuple(strategy.setting('IMMUTABLE_USER_FIELDS', []))
+    field_mapping = strategy.setting('USER_FIELD_MAPPING', {}, backend)
+    # Only model fields can be written with update_fields
+    fields = {field.name for field in user._meta.concrete_fields}
+    changed = []
+    for name, value in details.items():
+        name = field_mapping.get(name, name)
+        if value is None or name in protected or name not in fields:
+            continue
+        current = getattr(user, name, None)
+        if current == value or (name in immutable and current):
+            continue
+        setattr(user, name, value)
+        changed.append(name)
+    return changed
+
+
+def login_sso_user(strategy, backend, details, user=None, is_new=False,
+                   new_association=False, deferred=False, *args, **kwargs):
+    """
+    Replaces user_details, activate_user, set_logged_in_cookies and
+    login_user. A returning user whose details did not change costs no query
+    here, and is logged in exactly once, by social-auth after the pipeline.
+    """
+    if not user:
+        return None
+
+    changed = changed_user_fields(strategy, backend, user, details)
+    if not user.is_active:
+        user.is_active = True
+        changed.append('is_active')
+    if changed:
+        user.save(update_fields=changed)
+
+    # Returning users went through this when their association was created,
+    # deferred logins get their profile from the Celery task
+    if (is_new or new_association) and not deferred:
+        from common.djangoapps.student.models import UserProfile
+        UserProfile.objects.get_or_create(user=user)
+    return None
+
+
+def defer_sso_login_work(backend, details, response, uid, user=None, social=None,
+                         is_new=False, new_association=False, *args, **kwargs):
+    """
+    Replaces load_extra_data. The extra data, the UserProfile of a new user
+    and the SSO_DEFERRED_HOOKS are left to a batched Celery task, queued once
+    the login transaction is committed, see deferred.
+    """
+    if not user:
+        return None
+    from django.db import transaction
+
+    from . import deferred
+
+    extra_data = backend.extra_data(user, uid, response or {}, details) if social else None
+    item = deferred.work_item(user, social, response, extra_data, is_new or new_association)
+    transaction.on_commit(lambda: deferred.defer(item))
+    return {'deferred': True}
+
+
+def base_username(details, uid, email_as_username=False):
+    email = details.get('email') or ''
+    if email_as_username and email:
+        username = email
+    else:
+        username = details.get('username') or email.split('@')[0] or uid or ''
+    return CLEAN_USERNAME_REGEX.sub('', username)
+
+
+def username_candidates(details, uid, email_as_username=False, max_length=30):
+    """Usernames to try in order, the same for a given sub on every signup"""
+    base = base_username(details, uid, email_as_username)
+    digest = hashlib.sha1((uid or '').encode('utf-8')).hexdigest()
+    candidates = [base[:max_length]] if base else []
+    for length in SUFFIX_LENGTHS:
+        suffix = digest[:length]
+        stem = base[:max_length - length - 1]
+        candidates.append('{}_{}'.format(stem, suffix) if stem else suffix[:max_length])
+    # Keep the order, drop the duplicates of short bases
+    return list(dict.fromkeys(candidates))
+
+
+def free_username(candidates, exclude=()):
+    """First candidate no user has, checked with one query, or None"""
+    from django.contrib.auth import get_user_model
+
+    taken = set(
+        get_user_model().objects.filter(username__in=candidates)
+        .values_list('username', flat=True)
+    )
+    taken.update(exclude)
+    for candidate in candidates:
+        if candidate not in taken:
+            return candidate
+    return None
+
+
+def sso_username_candidates(strategy, details, uid):
+    max_length = strategy.storage.user.username_max_length()
+    return username_candidates(
+        details, uid, strategy.setting('USERNAME_IS_FULL_EMAIL', False), max_length or 30,
+    )
+
+
+def get_sso_username(strategy, details, backend, uid=None, user=None, *args, **kwargs):
+    """
+    Replaces social_core get_username. The username is derived from the IdP
+    username or email and, when taken, suffixed with a digest of sub; all
+    the candidates are checked with a single query.
+    """
+    if 'username' not in backend.setting('USER_FIELDS', ['username', 'email']):
+        return None
+    if user:
+        return {'username': strategy.storage.user.get_username(user)}
+    candidates = sso_username_candidates(strategy, details, uid)
+    return {'username': free_username(candidates) or uuid4().hex[:30]}
+
+
+def create_sso_user(strategy, details, backend, uid=None, user=None, *args, **kwargs):
+    """
+    Replaces social_core create_user. When a concurrent signup took the
+    username between get_sso_username and the insert, the next free
+    candidate is used instead of failing the login.
+    """
+    if user:
+        return {'is_new': False}
+    from django.db import IntegrityError
+
+    fields = {
+        name: kwargs.get(name, details.get(name))
+        for name in backend.setting('USER_FIELDS', ['username', 'email'])
+    }
+    if not fields:
+        return None
+    tried = []
+    candidates = None
+    while True:
+        try:
+            # Runs in a savepoint, and returns the existing user when the
+            # same username and email were just created by a twin request
+            return {'is_new': True, 'user': strategy.create_user(**fields)}
+        except IntegrityError:
+            if 'username' not in fields:
+                raise
+            tried.append(fields['username'])
+            if candidates is None:
+                candidates = sso_username_candidates(strategy, details, uid)
+            fields['username'] = free_username(candidates, exclude=tried)
+            if fields['username'] is None:
+                raise
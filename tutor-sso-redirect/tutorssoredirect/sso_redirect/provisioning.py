@@ -0,0 +1,278 @@
+"""
+Bulk pre-provisioning of SSO users
+
+Creates the ``User``, ``UserProfile`` and ``UserSocialAuth`` rows of an
+exported user list ahead of a login peak, a chunk of users per transaction,
+so that their first login takes the returning-user path of the pipeline.
+Running it again only writes the users whose email or names changed.
+
+Run in the LMS container by ``tutor local do sso-provision``::
+
+    ./manage.py lms shell -c "from lms.djangoapps.sso_redirect import provisioning; provisioning.main([...])"
+"""
+import argparse
+import csv
+import io
+import json
+
+from .pipeline import username_candidates
+
+DEFAULT_PROVIDER = 'oidc'
+DEFAULT_CHUNK_SIZE = 500
+
+
+def read_users(stream, fmt=None):
+    """Return the user records of a JSON list or a CSV file with a header row"""
+    content = stream.read()
+    if fmt is None:
+        fmt = 'json' if content.lstrip()[:1] in ('[', '{') else 'csv'
+    if fmt == 'json':
+        users = json.loads(content)
+        if isinstance(users, dict):
+            # {"users": [...]} or {"result": [...]}, as list exports often are
+            users = users.get('users') or users.get('result') or []
+    else:
+        users = list(csv.DictReader(io.StringIO(content)))
+    return [normalize(user) for user in users]
+
+
+def normalize(user):
+    """Return the record with the claims the pipeline uses, blanks as empty strings"""
+    def value(*names):
+        for name in names:
+            if user.get(name):
+                return str(user[name]).strip()
+        return ''
+
+    return {
+        'sub': value('sub', 'id', 'userId'),
+        'email': value('email').lower(),
+        'preferred_username': value('preferred_username', 'username', 'userName'),
+        'name': value('name', 'displayName'),
+        'given_name': value('given_name', 'firstName'),
+        'family_name': value('family_name', 'lastName'),
+    }
+
+
+def chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def get_models():
+    from django.contrib.auth import get_user_model
+    from social_django.models import UserSocialAuth
+    from common.djangoapps.student.models import UserProfile
+
+    return get_user_model(), UserProfile, UserSocialAuth
+
+
+class Provisioner(object):
+    '''Creates and updates the users of one provider, a chunk at a time'''
+
+    def __init__(self, provider=DEFAULT_PROVIDER, chunk_size=DEFAULT_CHUNK_SIZE,
+                 dry_run=False, models=None):
+        self.provider = provider
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        self.User, self.UserProfile, self.UserSocialAuth = models or get_models()
+        self.stats = {'created': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0}
+
+    def run(self, users):
+        from django.db import transaction
+
+        valid = {}
+        for user in users:
+            if not user['sub'] or not user['email']:
+                self.stats['skipped'] += 1
+                continue
+            valid[user['sub']] = user
+        for chunk in chunks(list(valid.values()), self.chunk_size):
+            with transaction.atomic():
+                self.provision_chunk(chunk)
+                if self.dry_run:
+                    transaction.set_rollback(True)
+        return self.stats
+
+    def provision_chunk(self, users):
+        by_sub = {user['sub']: user for user in users}
+        existing = {
+            social.uid: social.user
+            for social in self.UserSocialAuth.objects.filter(
+                provider=self.provider, uid__in=list(by_sub)
+            ).select_related('user')
+        }
+        self.update(existing, by_sub)
+        self.create([user for sub, user in by_sub.items() if sub not in existing])
+
+    def update(self, existing, by_sub):
+        skipped = self.email_conflicts(existing, by_sub)
+        changed_users = []
+        names = {}
+        fields = set()
+        for sub, account in existing.items():
+            if sub in skipped:
+                continue
+            user = by_sub[sub]
+            changed = False
+            for field, value in (
+                ('email', user['email']),
+                ('first_name', user['given_name']),
+                ('last_name', user['family_name']),
+            ):
+                if value and getattr(account, field) != value:
+                    setattr(account, field, value)
+                    fields.add(field)
+                    changed = True
+            if changed:
+                changed_users.append(account)
+            if user['name']:
+                names[account.pk] = user['name']
+
+        profiles = []
+        updated = {account.pk for account in changed_users}
+        if names:
+            for profile in self.UserProfile.objects.filter(user_id__in=list(names)):
+                if profile.name != names[profile.user_id]:
+                    profile.name = names[profile.user_id]
+                    profiles.append(profile)
+                    updated.add(profile.user_id)
+
+        if changed_users:
+            self.User.objects.bulk_update(changed_users, sorted(fields))
+        if profiles:
+            self.UserProfile.objects.bulk_update(profiles, ['name'])
+        self.stats['updated'] += len(updated)
+        self.stats['unchanged'] += len(existing) - len(updated) - len(skipped)
+        self.stats['skipped'] += len(skipped)
+
+    def email_conflicts(self, existing, by_sub):
+        """
+        Subs of the accounts whose new email address is used by another
+        account, or by an earlier account of the chunk. Their update is left
+        for the login to resolve, as create() leaves their creation.
+        """
+        new_emails = {
+            sub: by_sub[sub]['email'] for sub, account in existing.items()
+            if by_sub[sub]['email'] and account.email != by_sub[sub]['email']
+        }
+        if not new_emails:
+            return set()
+        owners = {}
+        for pk, email in self.User.objects.filter(
+            email__in=set(new_emails.values())
+        ).values_list('pk', 'email'):
+            owners.setdefault(email, set()).add(pk)
+        conflicts = set()
+        for sub, email in new_emails.items():
+            pk = existing[sub].pk
+            if owners.get(email, set()) - {pk}:
+                conflicts.add(sub)
+            else:
+                owners.setdefault(email, set()).add(pk)
+        return conflicts
+
+    def create(self, users):
+        if not users:
+            return
+        # Email addresses already used by an account that is not linked to
+        # the provider, or by an earlier user of the chunk with another sub,
+        # are left for the login to resolve
+        taken_emails = set(
+            self.User.objects.filter(email__in=[user['email'] for user in users])
+            .values_list('email', flat=True)
+        )
+        kept = []
+        for user in users:
+            if user['email'] not in taken_emails:
+                taken_emails.add(user['email'])
+                kept.append(user)
+        self.stats['skipped'] += len(users) - len(kept)
+        users = kept
+        if not users:
+            return
+
+        usernames = self.usernames(users)
+        from django.contrib.auth.hashers import make_password
+
+        password = make_password(None)
+        self.User.objects.bulk_create([
+            self.User(
+                username=usernames[user['sub']],
+                email=user['email'],
+                first_name=user['given_name'],
+                last_name=user['family_name'],
+                password=password,
+                is_active=True,
+            )
+            for user in users
+        ])
+        # MySQL does not return the primary keys of bulk inserted rows
+        ids = dict(
+            self.User.objects.filter(username__in=list(usernames.values()))
+            .values_list('username', 'pk')
+        )
+        self.UserProfile.objects.bulk_create([
+            self.UserProfile(user_id=ids[usernames[user['sub']]], name=user['name'])
+            for user in users
+        ])
+        self.UserSocialAuth.objects.bulk_create([
+            self.UserSocialAuth(
+                user_id=ids[usernames[user['sub']]],
+                provider=self.provider,
+                uid=user['sub'],
+                extra_data={},
+            )
+            for user in users
+        ])
+        self.stats['created'] += len(users)
+
+    def usernames(self, users):
+        """Return {sub: username}, the ones get_sso_username would pick"""
+        from django.conf import settings
+
+        email_as_username = getattr(settings, 'SOCIAL_AUTH_USERNAME_IS_FULL_EMAIL', False)
+        max_length = self.User._meta.get_field('username').max_length
+        candidates = {
+            user['sub']: username_candidates(
+                {'username': user['preferred_username'], 'email': user['email']},
+                user['sub'], email_as_username, max_length,
+            )
+            for user in users
+        }
+        # One query for the candidates of the whole chunk
+        taken = set(
+            self.User.objects.filter(
+                username__in=[name for names in candidates.values() for name in names]
+            ).values_list('username', flat=True)
+        )
+        usernames = {}
+        for sub, names in candidates.items():
+            for name in names:
+                if name not in taken:
+                    break
+            else:
+                raise ValueError("No free username for {}".format(sub))
+            taken.add(name)
+            usernames[sub] = name
+        return usernames
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='sso-provision', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('path', help="JSON or CSV export with sub, email and name")
+    parser.add_argument('--format', choices=['json', 'csv'])
+    parser.add_argument('--provider', default=DEFAULT_PROVIDER)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--dry-run', action='store_true', help="Roll every chunk back")
+    args = parser.parse_args(argv)
+
+    with open(args.path, encoding='utf-8') as stream:
+        users = read_users(stream, args.format)
+    stats = Provisioner(args.provider, args.chunk_size, args.dry_run).run(users)
+    print("SSO provisioning{}: {} users read, {}".format(
+        " (dry run)" if args.dry_run else "",
+        len(users),
+        ", ".join("{} {}".format(count, name) for name, count in stats.items()),
+    ))
+    return stats
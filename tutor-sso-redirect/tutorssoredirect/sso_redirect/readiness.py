@@ -0,0 +1,125 @@
+"""
+SSO readiness, refreshed in the background for cheap probes
+
+A thread per worker checks every ``SSO_READY_INTERVAL`` seconds that the IdP
+discovery document can be fetched, and reads the age of the cached JWKS and
+the state of the IdP circuit breaker. Only one worker of the deployment calls
+the IdP per interval, the others take its result from the cache.
+``/sso/ready`` then only reads the last snapshot of its worker: no database,
+no session, no call to the IdP.
+"""
+import logging
+import os
+import threading
+import time
+
+from .breaker import get_breaker
+from .discovery import DISCOVERY_PATH, get_document_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 10
+RESULT_KEY = 'sso:ready:idp'
+
+STATUS_OK = 'ok'
+STATUS_STARTING = 'starting'
+STATUS_UNAVAILABLE = 'unavailable'
+
+
+def check_idp(url, timeout):
+    """Fetch the discovery document at url, return the result of the check"""
+    from . import idp_client
+
+    start = time.perf_counter()
+    result = {'checked_at': time.time(), 'reachable': False, 'error': None, 'jwks_uri': None}
+    try:
+        response = idp_client.get_session().get(url, timeout=timeout)
+        response.raise_for_status()
+        result['jwks_uri'] = response.json().get('jwks_uri')
+        result['reachable'] = True
+    except Exception as e:
+        result['error'] = e.__class__.__name__
+    result['latency_ms'] = round((time.perf_counter() - start) * 1000, 3)
+    return result
+
+
+class Readiness(object):
+    '''Snapshot of the SSO readiness of one worker, kept fresh by a thread'''
+
+    def __init__(self, cache, discovery_url, interval=DEFAULT_INTERVAL, check=check_idp):
+        self.cache = cache
+        self.discovery_url = discovery_url
+        self.interval = interval
+        self.check = check
+        self.snapshot = {'status': STATUS_STARTING}
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Return the last snapshot, starting the refresh thread of this worker"""
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # Threads do not survive the uWSGI fork
+                    self._pid = os.getpid()
+                    threading.Thread(target=self._run, daemon=True).start()
+        snapshot = self.snapshot
+        if snapshot['status'] == STATUS_OK and time.time() - snapshot['checked_at'] > 3 * self.interval:
+            # The refresh thread is stuck, do not report a stale success
+            return dict(snapshot, status=STATUS_UNAVAILABLE, error='stale')
+        return snapshot
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception:
+                logger.warning("SSO readiness: refresh failed", exc_info=True)
+            time.sleep(self.interval)
+
+    def refresh(self):
+        # cache.add is atomic: the first worker of the interval calls the IdP
+        if self.cache.add(RESULT_KEY + ':lock', 1, timeout=self.interval):
+            result = self.check(self.discovery_url, timeout=min(self.interval, 5))
+            self.cache.set(RESULT_KEY, result, timeout=3 * self.interval)
+        else:
+            result = self.cache.get(RESULT_KEY)
+        if result is None:
+            # Another worker holds the lock and has not stored its result yet
+            return self.snapshot
+        self.snapshot = self.build(result)
+        return self.snapshot
+
+    def build(self, result):
+        jwks_age = None
+        if result.get('jwks_uri'):
+            age = get_document_cache().age(result['jwks_uri'])
+            jwks_age = round(age, 1) if age is not None else None
+        return {
+            'status': STATUS_OK if result['reachable'] else STATUS_UNAVAILABLE,
+            'checked_at': result['checked_at'],
+            'idp_reachable': result['reachable'],
+            'idp_latency_ms': result['latency_ms'],
+            'error': result['error'],
+            'jwks_age': jwks_age,
+            'breaker': get_breaker().state(),
+        }
+
+
+_readiness = None
+
+
+def get_readiness():
+    """Return the per-worker Readiness configured by the settings"""
+    global _readiness
+    if _readiness is None:
+        from django.conf import settings
+        from django.core.cache import caches
+
+        endpoint = getattr(settings, 'SOCIAL_AUTH_OIDC_OIDC_ENDPOINT', '')
+        _readiness = Readiness(
+            caches[getattr(settings, 'SSO_OIDC_CACHE_ALIAS', 'default')],
+            endpoint + DISCOVERY_PATH,
+            interval=getattr(settings, 'SSO_READY_INTERVAL', DEFAULT_INTERVAL),
+        )
+    return _readiness
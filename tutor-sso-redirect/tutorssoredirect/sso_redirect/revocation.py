@@ -0,0 +1,306 @@
+"""
+Index of the sessions of SSO users, for back-channel logout and revocation
+
+Django keeps no index from a user to their sessions: finding them means
+decoding every session. When the SSO pipeline logs a user in, the session key
+is recorded, with the IdP session ID (``sid``) of the ID token, in the
+``extra_data`` of the user's association with the IdP. That row is in the
+database, so the index survives cache evictions and restarts, and it is the
+row a logout token names by ``sub``. Logging a user out everywhere then costs
+one query, and one delete per session by its primary key. The Django cache
+only maps a ``sid`` to its association, for logout tokens without ``sub``.
+
+The index does not cover the sessions of logins that did not go through the
+SSO pipeline, or that happened before it was turned on. ``gaps`` tells when a
+user may have such sessions, and ``scan_sessions`` finds them by decoding
+every session of the database session engines.
+"""
+import argparse
+import logging
+import time
+from importlib import import_module
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROVIDER = 'oidc'
+# Key of the index in UserSocialAuth.extra_data
+EXTRA_DATA_KEY = 'sso_sessions'
+# Sessions kept per association, the oldest beyond are dropped
+MAX_SESSIONS = 100
+SID_PREFIX = 'sso:sessions:sid:'
+# Tolerance between the login time of an entry and auth_user.last_login
+LOGIN_SLACK = 60
+
+
+class SessionIndex(object):
+    '''
+    Session keys of the SSO logins of an association, in its extra_data:
+    {'since': time, 'dropped': time, 'sessions': {key: [login time, sid]}}
+    '''
+
+    def __init__(self, max_sessions=MAX_SESSIONS):
+        self.max_sessions = max_sessions
+
+    @staticmethod
+    def data(social):
+        return (social.extra_data or {}).get(EXTRA_DATA_KEY) or {}
+
+    def add(self, social, session_key, sid=None):
+        """Record a login of social, locking its row against concurrent logins"""
+        from django.db import transaction
+
+        now = time.time()
+        with transaction.atomic():
+            row = type(social).objects.select_for_update().only('id', 'extra_data').get(pk=social.pk)
+            data = prune(self.data(row), now)
+            data.setdefault('since', now)
+            sessions = data.setdefault('sessions', {})
+            sessions[session_key] = [now, sid]
+            if len(sessions) > self.max_sessions:
+                oldest = sorted(sessions, key=lambda key: sessions[key][0])[:-self.max_sessions]
+                data['dropped'] = max(sessions[key][0] for key in oldest)
+                for key in oldest:
+                    del sessions[key]
+            self.save(row, data)
+        # Later saves of the pipeline's copy must not write the old index back
+        social.extra_data = row.extra_data
+
+    def sessions(self, socials, sid=None):
+        """Session keys of the associations, or of their IdP session sid"""
+        return [
+            key for social in socials
+            for key, (_logged_in_at, session_sid) in self.data(social).get('sessions', {}).items()
+            if sid is None or session_sid == sid
+        ]
+
+    def forget(self, socials, session_keys):
+        from django.db import transaction
+
+        session_keys = set(session_keys)
+        with transaction.atomic():
+            for social in socials:
+                row = type(social).objects.select_for_update().only('id', 'extra_data').get(pk=social.pk)
+                data = self.data(row)
+                if session_keys & set(data.get('sessions', {})):
+                    data['sessions'] = {
+                        key: entry for key, entry in data['sessions'].items() if key not in session_keys
+                    }
+                    self.save(row, data)
+                social.extra_data = row.extra_data
+
+    @staticmethod
+    def save(row, data):
+        row.extra_data = dict(row.extra_data or {}, **{EXTRA_DATA_KEY: data})
+        row.save(update_fields=['extra_data'])
+
+    def gaps(self, user, socials):
+        """Why user may have sessions the index of socials does not cover"""
+        reasons = []
+        now = time.time()
+        data = [self.data(social) for social in socials]
+        logins = [entry[0] for item in data for entry in item.get('sessions', {}).values()]
+        since = min([item['since'] for item in data if 'since' in item] or [now])
+        dropped = max([item.get('dropped', 0) for item in data] or [0])
+        last_login = user.last_login.timestamp() if user.last_login else None
+        if last_login and last_login > max(logins or [0]) + LOGIN_SLACK and may_live(last_login, now):
+            reasons.append("logged in without the SSO pipeline")
+        if user.date_joined.timestamp() < since - LOGIN_SLACK and may_live(since, now):
+            reasons.append("logins before the session index")
+        if dropped and may_live(dropped, now):
+            reasons.append("more than {} sessions".format(self.max_sessions))
+        return reasons
+
+
+def may_live(logged_in_at, now):
+    """Whether a session of a login at logged_in_at may not have expired yet"""
+    from django.conf import settings
+
+    if getattr(settings, 'SESSION_SAVE_EVERY_REQUEST', False):
+        # Every request pushes the expiry forward
+        return True
+    return logged_in_at > now - settings.SESSION_COOKIE_AGE
+
+
+def prune(data, now):
+    """data without the sessions that have surely expired"""
+    sessions = data.get('sessions', {})
+    data['sessions'] = {key: entry for key, entry in sessions.items() if may_live(entry[0], now)}
+    return data
+
+
+def delete_sessions(session_keys):
+    """Delete sessions by key through the session engine, return how many"""
+    from django.conf import settings
+
+    store = import_module(settings.SESSION_ENGINE).SessionStore()
+    for session_key in session_keys:
+        # Also clears the cached copy of the cache and cached_db engines
+        store.delete(session_key)
+    return len(session_keys)
+
+
+def scan_sessions(user_ids, chunk_size=2000):
+    """
+    Delete the sessions of user_ids by decoding every session, return
+    (sessions scanned, sessions deleted). Only for the database engines.
+    """
+    from django.conf import settings
+    from django.contrib.sessions.backends.db import SessionStore as DBStore
+    from django.utils import timezone
+
+    store_class = import_module(settings.SESSION_ENGINE).SessionStore
+    if not issubclass(store_class, DBStore):
+        raise ValueError("The {} session engine cannot be scanned".format(settings.SESSION_ENGINE))
+    wanted = {str(user_id) for user_id in user_ids}
+    store = store_class()
+    scanned = 0
+    found = []
+    rows = (
+        store_class.get_model_class().objects.filter(expire_date__gt=timezone.now())
+        .values_list('session_key', 'session_data').iterator(chunk_size=chunk_size)
+    )
+    for session_key, session_data in rows:
+        scanned += 1
+        if store.decode(session_data).get('_auth_user_id') in wanted:
+            found.append(session_key)
+    deleted = delete_sessions(found)
+    metrics.inc('sso_sessions_revoked_total', deleted, source='scan')
+    return scanned, deleted
+
+
+def record_login(sender, request, user, **kwargs):
+    """user_logged_in receiver indexing the session of an SSO login"""
+    from django.conf import settings
+
+    # do_complete sets social_user on users logged in by the SSO pipeline
+    social = getattr(user, 'social_user', None)
+    if not getattr(settings, 'SSO_SESSION_INDEX', True) or social is None:
+        return
+    session = getattr(request, 'session', None)
+    if session is None or not session.session_key:
+        return
+    backend = getattr(request, 'backend', None)
+    sid = (getattr(backend, 'id_token', None) or {}).get('sid')
+    try:
+        get_index().add(social, session.session_key, sid)
+        if sid:
+            get_cache().set(SID_PREFIX + sid, social.pk, timeout=settings.SESSION_COOKIE_AGE)
+    except Exception:
+        # The login must not fail because of the index; revocation reports the gap
+        logger.warning("SSO session index: cannot index the session of user %s", user.pk,
+                       exc_info=True)
+
+
+def social_for(sub=None, sid=None, provider=DEFAULT_PROVIDER):
+    """Association of the IdP subject sub, or of the IdP session sid, with its user"""
+    from social_django.models import UserSocialAuth
+
+    socials = UserSocialAuth.objects.select_related('user')
+    if sub:
+        # The unique (provider, uid) index
+        return socials.filter(provider=provider, uid=sub).first()
+    social_id = get_cache().get(SID_PREFIX + sid) if sid else None
+    return socials.filter(pk=social_id).first() if social_id else None
+
+
+def report_gaps(user, socials, source):
+    """Log and count a revocation that may have missed sessions, return the reasons"""
+    reasons = get_index().gaps(user, socials)
+    if reasons:
+        metrics.inc('sso_revocations_incomplete_total', source=source)
+        logger.warning("SSO revocation of user %s may have missed sessions: %s",
+                       user.pk, ", ".join(reasons))
+    return reasons
+
+
+def revoke_user(user):
+    """Delete every indexed session of user, return (how many, gaps)"""
+    from social_django.models import UserSocialAuth
+
+    index = get_index()
+    socials = list(UserSocialAuth.objects.filter(user_id=user.pk).only('id', 'extra_data'))
+    session_keys = index.sessions(socials)
+    deleted = delete_sessions(session_keys)
+    index.forget(socials, session_keys)
+    metrics.inc('sso_sessions_revoked_total', deleted, source='revoke')
+    return deleted, report_gaps(user, socials, 'revoke')
+
+
+def logout(sub=None, sid=None, provider=DEFAULT_PROVIDER):
+    """
+    Back-channel logout: delete the sessions of the IdP session sid, or all
+    the sessions of the subject sub when there is no sid. Return how many.
+    """
+    social = social_for(sub, sid, provider)
+    if social is None:
+        logger.info("SSO back-channel logout: no user for sub %s, sid %s", sub, sid)
+        return 0
+    index = get_index()
+    session_keys = index.sessions([social], sid=sid)
+    deleted = delete_sessions(session_keys)
+    index.forget([social], session_keys)
+    metrics.inc('sso_sessions_revoked_total', deleted, source='backchannel')
+    if not sid or not deleted:
+        report_gaps(social.user, [social], 'backchannel')
+    return deleted
+
+
+def connect():
+    """Index the sessions of the SSO logins from now on"""
+    from django.contrib.auth.signals import user_logged_in
+
+    user_logged_in.connect(record_login, dispatch_uid='sso_redirect.revocation.record_login')
+
+
+_index = None
+
+
+def get_index():
+    """Return the per-worker SessionIndex"""
+    global _index
+    if _index is None:
+        _index = SessionIndex()
+    return _index
+
+
+def get_cache():
+    """The SSO_OIDC_CACHE_ALIAS cache, for the sid map and the logout token IDs"""
+    from django.conf import settings
+    from django.core.cache import caches
+
+    return caches[getattr(settings, 'SSO_OIDC_CACHE_ALIAS', 'default')]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='sso-revoke', description="Log SSO users out everywhere")
+    parser.add_argument('subs', nargs='+', help="IdP subjects (sub) of the users")
+    parser.add_argument('--provider', default=DEFAULT_PROVIDER)
+    parser.add_argument('--scan', action='store_true',
+                        help="Also decode every session to find those the index does not cover")
+    args = parser.parse_args(argv)
+
+    users = []
+    incomplete = False
+    for sub in args.subs:
+        social = social_for(sub, provider=args.provider)
+        if social is None:
+            print("{}: no user".format(sub))
+            continue
+        users.append(social.user)
+        deleted, reasons = revoke_user(social.user)
+        print("{}: {} indexed sessions deleted".format(sub, deleted))
+        if reasons:
+            incomplete = True
+            print("{}: may have sessions the index does not cover: {}".format(sub, ", ".join(reasons)))
+
+    if args.scan and users:
+        scanned, deleted = scan_sessions([user.pk for user in users])
+        print("Scanned {} sessions, {} more deleted".format(scanned, deleted))
+    elif incomplete:
+        print("Run again with --scan to find them by decoding every session")
+    print("JWT cookies already issued stay valid until they expire")
+
+
+connect()
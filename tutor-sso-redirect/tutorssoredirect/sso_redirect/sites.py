@@ -0,0 +1,109 @@
+"""
+Per-host SSO routing for LMS instances serving several sites
+
+``SSO_SITES`` maps a host to the authn MFE, the third party auth provider and
+the origins of its site. It is compiled once per worker into a dict keyed by
+host, so that a request finds its site with one or two dict lookups. Hosts
+that are not listed get the default site, built from the single-site
+settings. The CORS, CSRF and redirect host settings are computed from the
+same table when the settings are loaded.
+"""
+from urllib.parse import urlsplit
+
+DEFAULT_BACKEND = 'oidc'
+
+
+class Site(object):
+    '''Where the logins of one host go'''
+
+    __slots__ = ('host', 'mfe_url', 'provider', 'backend', 'mode', 'login_url', 'origins')
+
+    def __init__(self, host, mfe_url, provider=DEFAULT_BACKEND, backend=DEFAULT_BACKEND,
+                 mode='mfe', login_url=None, origins=()):
+        self.host = host
+        self.mfe_url = mfe_url.rstrip('/')
+        # tpa_hint sent to the authn MFE, the provider ID of Open edX
+        self.provider = provider
+        self.backend = backend
+        self.mode = mode
+        self.login_url = login_url or '/auth/login/{}/'.format(backend)
+        self.origins = tuple(origin.rstrip('/') for origin in origins)
+
+    @property
+    def mfe_domain(self):
+        return urlsplit(self.mfe_url).netloc
+
+    def __repr__(self):
+        return '<Site {} -> {}>'.format(self.host or '*', self.mfe_url)
+
+
+class SiteRouter(object):
+    '''Host-keyed table of sites, with a fallback site'''
+
+    def __init__(self, sites, default):
+        self.default = default
+        self.sites = {site.host.lower(): site for site in sites}
+
+    @classmethod
+    def from_config(cls, sites, default):
+        """Build the router from SSO_SITES and the default site options"""
+        options = dict(default)
+        fallback = Site(None, **options)
+        # Unset options of a site are those of the default site, except the
+        # login URL that follows the backend
+        options.pop('login_url', None)
+        return cls(
+            [Site(host, **dict(options, **site)) for host, site in (sites or {}).items()],
+            fallback,
+        )
+
+    def for_host(self, host):
+        """Return the site of host, with or without its port"""
+        host = host.lower()
+        site = self.sites.get(host)
+        if site is None and ':' in host:
+            site = self.sites.get(host.rsplit(':', 1)[0])
+        return site or self.default
+
+    def for_request(self, request):
+        return self.for_host(request.get_host())
+
+    def all(self):
+        return [self.default] + list(self.sites.values())
+
+    def origins(self, extra=()):
+        """Allowed origins of every site, in order and without duplicates"""
+        origins = list(extra)
+        for site in self.all():
+            origins.extend(site.origins)
+        return list(dict.fromkeys(origins))
+
+    def hosts(self, extra=()):
+        """host[:port] of the allowed origins and MFEs, for redirect checks"""
+        hosts = list(extra)
+        for site in self.all():
+            hosts.extend(urlsplit(origin).netloc for origin in site.origins)
+            hosts.append(site.mfe_domain)
+        return [host for host in dict.fromkeys(hosts) if host]
+
+
+_router = None
+
+
+def get_router():
+    """Return the per-worker SiteRouter of SSO_SITES and SSO_DEFAULT_SITE"""
+    global _router
+    if _router is None:
+        from django.conf import settings
+
+        default = getattr(settings, 'SSO_DEFAULT_SITE', None) or {
+            'mfe_url': getattr(settings, 'AUTHN_MICROFRONTEND_URL', ''),
+            'mode': getattr(settings, 'SSO_REDIRECT_MODE', 'mfe'),
+            'login_url': getattr(settings, 'SSO_REDIRECT_URL', None),
+        }
+        _router = SiteRouter.from_config(getattr(settings, 'SSO_SITES', {}), default)
+    return _router
+
+
+def for_request(request):
+    return get_router().for_request(request)
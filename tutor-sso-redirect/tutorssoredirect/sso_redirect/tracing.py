@@ -0,0 +1,125 @@
+"""
+Per-login trace of the social auth pipeline
+
+When ``SSO_PIPELINE_TRACE`` is on, every login gets a trace ID. It is started
+at ``/login`` (or at ``/auth/login/oidc/`` when the proxy answered
+``/login``), kept in the session, and prefixed to the OIDC ``state``. The IdP
+sends ``state`` back to ``/auth/complete/oidc/``, so the ID is there even if
+the session is not. The IdP calls and each pipeline step, with its duration
+and number of queries, are then logged as JSON records on the
+``lms.djangoapps.sso_redirect.tracing`` logger, one per line, all carrying
+the trace ID.
+"""
+import json
+import logging
+import re
+import time
+import uuid
+from contextlib import contextmanager
+
+from . import metrics
+from .instrumentation import count_queries
+
+logger = logging.getLogger(__name__)
+
+TRACE_ID_KEY = '_sso_trace_id'
+
+_trace_id_re = re.compile(r'^[0-9a-f]{16}$')
+
+
+def is_enabled():
+    from django.conf import settings
+    return getattr(settings, 'SSO_PIPELINE_TRACE', False)
+
+
+def new_trace_id():
+    return uuid.uuid4().hex[:16]
+
+
+def session_trace_id(strategy):
+    """Return the trace ID of the login in progress, starting one if needed"""
+    trace_id = strategy.session_get(TRACE_ID_KEY)
+    if not trace_id:
+        trace_id = new_trace_id()
+        strategy.session_set(TRACE_ID_KEY, trace_id)
+    return trace_id
+
+
+def start(request):
+    """Start the trace of a login at /login, return its ID"""
+    trace_id = new_trace_id()
+    request.session[TRACE_ID_KEY] = trace_id
+    emit(trace_id, 'login', path=request.path, next=request.GET.get('next'))
+    return trace_id
+
+
+def with_state(trace_id, state):
+    return '{}.{}'.format(trace_id, state)
+
+
+def from_state(state):
+    """Return the trace ID prefixed to an OIDC state, or None"""
+    trace_id, dot, _rest = (state or '').partition('.')
+    if dot and _trace_id_re.match(trace_id):
+        return trace_id
+    return None
+
+
+def emit(trace_id, event, **fields):
+    record = {'trace_id': trace_id, 'event': event, 'ts': round(time.time(), 3)}
+    record.update(fields)
+    logger.info("%s", json.dumps(record, default=str, sort_keys=True))
+
+
+class PipelineTrace(object):
+    '''Times every step of one pipeline run, and counts its queries when enabled'''
+
+    def __init__(self, trace_id=None, enabled=False):
+        self.trace_id = trace_id
+        self.enabled = enabled
+        self.steps = []
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def step(self, name, index):
+        start = time.perf_counter()
+        if not self.enabled:
+            try:
+                yield
+            finally:
+                metrics.observe('sso_pipeline_step_duration_seconds',
+                                time.perf_counter() - start, step=name)
+            return
+        error = None
+        with count_queries() as counter:
+            try:
+                yield
+            except Exception as e:
+                error = e.__class__.__name__
+                raise
+            finally:
+                duration = time.perf_counter() - start
+                metrics.observe('sso_pipeline_step_duration_seconds', duration, step=name)
+                step = {
+                    'step': name,
+                    'index': index,
+                    'duration_ms': round(duration * 1000, 3),
+                    'queries': counter.count,
+                }
+                if error:
+                    step['error'] = error
+                self.steps.append(step)
+                emit(self.trace_id, 'pipeline_step', **step)
+
+    def finish(self, outcome):
+        if not self.enabled:
+            return
+        emit(
+            self.trace_id,
+            'pipeline',
+            outcome=outcome,
+            duration_ms=round((time.perf_counter() - self.started) * 1000, 3),
+            queries=sum(step['queries'] for step in self.steps),
+            steps=len(self.steps),
+            slowest=max(self.steps, key=lambda s: s['duration_ms'])['step'] if self.steps else None,
+        )
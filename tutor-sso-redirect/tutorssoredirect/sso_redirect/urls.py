@@ -0,0 +1,55 @@
+"""
+URL pattern for the legacy login and registration URLs
+
+The patterns are prepended to the LMS urlpatterns, so every request that is
+resolved pays for them. A single pattern looking the path up in a frozenset
+replaces the four ``re_path`` regexes that were tried one after the other.
+"""
+import re
+
+from django.urls import URLPattern
+from django.urls.resolvers import RegexPattern
+
+from .views import backchannel_logout_view, metrics_view, mfe_sso_redirect, ready_view
+
+# Paths as the root resolver sees them, without the leading slash
+AUTH_PATHS = (
+    'login', 'login/',
+    'register', 'register/',
+    'signin', 'signin/',
+    'signup', 'signup/',
+)
+
+
+class ExactPathPattern(RegexPattern):
+    '''RegexPattern matching a set of exact paths with one lookup'''
+
+    def __init__(self, paths, name=None):
+        paths = tuple(paths)
+        self.paths = frozenset(paths)
+        # The regex is never matched, it only serves reverse() and checks,
+        # which do not support alternations: the first path is canonical
+        regex = r'^{}\Z'.format(re.escape(paths[0]))
+        super().__init__(regex, name=name, is_endpoint=True)
+
+    def match(self, path):
+        if path in self.paths:
+            return '', (), {}
+        return None
+
+
+def exact_path(paths, view, name=None):
+    """Return a URL pattern routing any of paths to view"""
+    return URLPattern(ExactPathPattern(paths), view, name=name)
+
+
+auth_redirects = [
+    exact_path(AUTH_PATHS, mfe_sso_redirect, name='sso_auth_redirect'),
+]
+
+# Appended to the LMS urlpatterns, they do not shadow any LMS route
+urlpatterns = [
+    exact_path(('sso/metrics',), metrics_view, name='sso_metrics'),
+    exact_path(('sso/ready',), ready_view, name='sso_ready'),
+    exact_path(('sso/backchannel-logout',), backchannel_logout_view, name='sso_backchannel_logout'),
+]
@@ -0,0 +1,151 @@
+"""
+Views behind the legacy login and registration URLs
+
+In "mfe" mode the browser goes to the authn MFE with ``tpa_hint``, which boots
+and then bounces to ``/auth/login/oidc/``. In "direct" mode the social auth
+begin step runs right here and the response is the IdP authorize redirect,
+which saves the MFE round-trips and the SPA boot. The MFE, provider and mode
+are those of the request's host, see ``sites``.
+
+``metrics_view`` serves the metrics of all the workers to Prometheus,
+``ready_view`` the SSO readiness of the worker to load balancer probes, and
+``backchannel_logout_view`` receives the OIDC back-channel logouts of the IdP.
+"""
+import hmac
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.http import (
+    HttpResponse, HttpResponseForbidden, HttpResponseNotAllowed, HttpResponseRedirect, JsonResponse,
+)
+from django.views.decorators.csrf import csrf_exempt
+
+from . import metrics, readiness, revocation, sites, tracing
+
+MODE_MFE = 'mfe'
+MODE_DIRECT = 'direct'
+
+# Name of the social auth backend, see backends.SSOOpenIdConnectAuth
+BACKEND_NAME = sites.DEFAULT_BACKEND
+
+DEFAULT_NEXT = '/dashboard'
+
+
+def mfe_sso_redirect(request):
+    """Send the user to the IdP, directly or through the authn MFE"""
+    next_url = request.GET.get('next', DEFAULT_NEXT)
+    site = sites.for_request(request)
+    metrics.inc('sso_redirects_total', source='view', mode=site.mode)
+    if tracing.is_enabled():
+        tracing.start(request)
+    if site.mode == MODE_DIRECT:
+        return begin_sso_login(request, next_url, site.backend)
+    query = urlencode({'next': next_url, 'tpa_hint': site.provider})
+    return HttpResponseRedirect(f"{site.mfe_url}/login?{query}")
+
+
+def begin_sso_login(request, next_url, backend=BACKEND_NAME):
+    """Run the social auth begin step, as /auth/login/oidc/ would"""
+    # Imported here: social_django is only configured once the apps are loaded
+    from social_django.views import auth
+
+    # The third party auth pipeline reads auth_entry and next from the query
+    # and keeps them in the session for the callback
+    params = request.GET.copy()
+    params['auth_entry'] = 'login'
+    params['next'] = next_url
+    request.GET = params
+    return auth(request, backend)
+
+
+def metrics_view(request):
+    """Metrics of all the workers, in the Prometheus text exposition format"""
+    token = getattr(settings, 'SSO_METRICS_TOKEN', '')
+    if token:
+        supplied = request.META.get('HTTP_AUTHORIZATION', '')[len('Bearer '):]
+        if not hmac.compare_digest(supplied.encode('utf-8'), token.encode('utf-8')):
+            return HttpResponseForbidden()
+    elif 'HTTP_X_FORWARDED_FOR' in request.META:
+        # Without a token, only scrapers inside the deployment, not behind Caddy
+        return HttpResponseForbidden()
+    response = HttpResponse(
+        metrics.get_registry().render(), content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+def ready_view(request):
+    """Last background check of the IdP: 200 when SSO logins can work, else 503"""
+    snapshot = readiness.get_readiness().get()
+    body = dict(snapshot)
+    if 'checked_at' in body:
+        body['age'] = round(time.time() - body.pop('checked_at'), 1)
+    response = JsonResponse(body, status=200 if snapshot['status'] == readiness.STATUS_OK else 503)
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+def logout_backend(request, token):
+    """
+    Backend to validate a logout token with: the one of the request's site,
+    or of another site whose IdP issued the token. None if no backend can.
+    """
+    import jwt
+    from social_core.exceptions import MissingBackend
+    from social_django.utils import load_backend, load_strategy
+
+    # No request: the IdP's call has no session to load
+    strategy = load_strategy()
+    names = [sites.for_request(request).backend] + [site.backend for site in sites.get_router().all()]
+    backends = []
+    for name in dict.fromkeys(names):
+        try:
+            backend = load_backend(strategy, name, redirect_uri=None)
+        except MissingBackend:
+            continue
+        # e.g. the stock OpenIdConnectAuth with SSO_OIDC_BACKEND
+        if hasattr(backend, 'validate_logout_token'):
+            backends.append(backend)
+    try:
+        issuer = jwt.decode(token, options={'verify_signature': False}).get('iss')
+    except jwt.PyJWTError:
+        issuer = None
+    if issuer:
+        for backend in backends:
+            if backend.id_token_issuer() == issuer:
+                return backend
+    # Its validation of the token fails
+    return backends[0] if backends else None
+
+
+@csrf_exempt
+def backchannel_logout_view(request):
+    """OIDC back-channel logout: delete the sessions named by the IdP's logout token"""
+    from social_core.exceptions import AuthException
+
+    if not getattr(settings, 'SSO_BACKCHANNEL_LOGOUT', True):
+        return HttpResponse(status=404)
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    token = request.POST.get('logout_token', '')
+    try:
+        backend = logout_backend(request, token)
+        if backend is None:
+            return HttpResponse(status=404)
+        claims = backend.validate_logout_token(token)
+    except AuthException as e:
+        response = JsonResponse({'error': 'invalid_request', 'error_description': str(e)}, status=400)
+    else:
+        # Replays of a token are accepted without deleting anything again
+        replay = claims.get('jti') and not revocation.get_cache().add(
+            'sso:logout:jti:' + claims['jti'], 1,
+            timeout=backend.setting('ID_TOKEN_MAX_AGE', backend.ID_TOKEN_MAX_AGE),
+        )
+        if not replay:
+            revocation.logout(claims.get('sub'), claims.get('sid'), provider=backend.name)
+        response = HttpResponse(status=200)
+    response['Cache-Control'] = 'no-cache, no-store'
+    response['Pragma'] = 'no-cache'
+    return response